@@ -0,0 +1,197 @@
+"""
+Content-addressed cache for vision analysis results.
+
+Results are keyed by a hash of the image bytes together with the analysis
+kind, prompt version and model, so a repeat upload of the same image is
+answered without another OpenAI round-trip. A bounded in-memory LRU tier is
+always active; an on-disk tier is enabled with ANALYSIS_CACHE_DIR and
+survives worker restarts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class AnalysisCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 7 * 24 * 3600,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        # key -> (expires_at, serialized value); values are stored as JSON so
+        # callers always get a fresh copy they are free to mutate.
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: int | None = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        """Build a cache configured from ANALYSIS_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "512")),
+            ttl_seconds=float(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+            disk_dir=os.environ.get("ANALYSIS_CACHE_DIR") or None,
+            disk_max_bytes=int(os.environ.get("ANALYSIS_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def make_key(image_bytes: bytes, kind: str, prompt_version: str, model: str) -> str:
+        """Return the cache key for an image analysed with a given prompt and model."""
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+        return hashlib.sha256(f"{kind}:{prompt_version}:{model}:{image_digest}".encode()).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Return a cached result, checking memory first and then disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(payload)
+                del self._entries[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_set(key, *entry)
+        return json.loads(entry[1])
+
+    def set(self, key: str, value: dict) -> None:
+        """Store a result in memory and, when configured, on disk."""
+        expires_at = time.time() + self.ttl_seconds
+        payload = json.dumps(value)
+        with self._lock:
+            self._memory_set(key, expires_at, payload)
+        self._disk_set(key, expires_at, payload)
+
+    def clear(self) -> None:
+        """Drop every cached entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if self.disk_dir:
+            for path in self.disk_dir.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+            self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_enabled": self.disk_dir is not None,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _memory_set(self, key: str, expires_at: float, payload: str) -> None:
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, str] | None:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Discarding unreadable analysis cache entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+        if record.get("expires_at", 0) <= now:
+            path.unlink(missing_ok=True)
+            return None
+        return record["expires_at"], json.dumps(record["value"])
+
+    def _disk_set(self, key: str, expires_at: float, payload: str) -> None:
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        data = f'{{"expires_at": {expires_at}, "value": {payload}}}'.encode("utf-8")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Write to a temp file and rename so concurrent workers never read
+            # a partially written entry.
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Failed to write analysis cache entry {path}: {e}")
+            return
+
+        if self._disk_bytes is None:
+            self._disk_bytes = self._scan_disk_bytes()
+        else:
+            self._disk_bytes += len(data)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._prune_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.disk_dir.glob("*/*.json"))
+
+    def _prune_disk(self) -> None:
+        """Delete expired entries, then the oldest ones, until under 90% of the budget."""
+        now = time.time()
+        entries = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            # Entries older than the TTL are expired regardless of contents
+            if st.st_mtime + self.ttl_seconds <= now:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._disk_bytes = total
+
+
+# Global instance
+analysis_cache = AnalysisCache.from_env()
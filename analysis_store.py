@@ -0,0 +1,158 @@
+"""
+Server-side store for analysis results, addressed by short content handles.
+
+The analyze routes put each successful analysis here and return its handle,
+so the browser can send the handle back to /generate instead of the full
+analysis JSON on every regenerate. /generate stores its prompt result the
+same way for /enhance-prompt.
+
+A handle is a hash of the stored value and its kind, so storing the same
+analysis twice yields the same handle. Entries expire after a TTL, and the
+in-memory tier is capped by the total size of the stored JSON. Set
+ANALYSIS_STORE_DB to a SQLite file to keep handles across worker restarts
+and share them between workers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class UnknownHandle(LookupError):
+    """Raised when a handle was never issued, has expired or is of another kind."""
+
+
+class AnalysisStore:
+    def __init__(
+        self,
+        ttl_seconds: float = 24 * 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        db_path: str | None = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        # handle -> (kind, expires_at, serialized value), least recently used first
+        self._entries: OrderedDict[str, tuple[str, float, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS handles ("
+                "handle TEXT PRIMARY KEY, kind TEXT NOT NULL, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+
+    @classmethod
+    def from_env(cls) -> "AnalysisStore":
+        """Build a store configured from ANALYSIS_STORE_* environment variables."""
+        return cls(
+            ttl_seconds=float(os.environ.get("ANALYSIS_STORE_TTL", str(24 * 3600))),
+            max_bytes=int(os.environ.get("ANALYSIS_STORE_MAX_MB", "64")) * 1024 * 1024,
+            db_path=os.environ.get("ANALYSIS_STORE_DB") or None,
+        )
+
+    @staticmethod
+    def make_handle(kind: str, payload: str) -> str:
+        """Return the handle for a serialized value of the given kind."""
+        return hashlib.blake2b(f"{kind}:{payload}".encode("utf-8"), digest_size=12).hexdigest()
+
+    def put(self, kind: str, value: dict) -> str:
+        """Store a value and return its handle, refreshing the TTL if already stored."""
+        payload = json.dumps(value, sort_keys=True, separators=(",", ":"))
+        handle = self.make_handle(kind, payload)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._memory_set(handle, kind, expires_at, payload)
+            self._puts += 1
+            purge = self._puts % 1000 == 0
+        self._db_set(handle, kind, expires_at, payload, purge)
+        return handle
+
+    def get(self, handle: str, kind: str) -> dict:
+        """Return a fresh copy of the value stored under handle.
+
+        Raises UnknownHandle if it is missing, expired or stored as another kind.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(handle)
+                else:
+                    self._memory_delete(handle)
+                    entry = None
+
+        if entry is None:
+            entry = self._db_get(handle, now)
+            if entry is not None:
+                with self._lock:
+                    self._memory_set(handle, *entry)
+
+        if entry is None or entry[0] != kind:
+            raise UnknownHandle(f"Unknown or expired {kind} handle: {handle}")
+        return json.loads(entry[2])
+
+    def stats(self) -> dict:
+        """Return the in-memory entry count and size."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "db_enabled": self._db is not None,
+            }
+
+    def _memory_set(self, handle: str, kind: str, expires_at: float, payload: str) -> None:
+        if handle in self._entries:
+            self._memory_delete(handle)
+        self._entries[handle] = (kind, expires_at, payload)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._memory_delete(next(iter(self._entries)))
+
+    def _memory_delete(self, handle: str) -> None:
+        _, _, payload = self._entries.pop(handle)
+        self._bytes -= len(payload)
+
+    def _db_set(self, handle: str, kind: str, expires_at: float, payload: str, purge: bool) -> None:
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO handles (handle, kind, expires_at, payload) VALUES (?, ?, ?, ?)",
+                    (handle, kind, expires_at, payload),
+                )
+                if purge:
+                    self._db.execute("DELETE FROM handles WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to persist analysis handle {handle}: {e}")
+
+    def _db_get(self, handle: str, now: float) -> tuple[str, float, str] | None:
+        if self._db is None:
+            return None
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT kind, expires_at, payload FROM handles WHERE handle = ? AND expires_at > ?",
+                    (handle, now),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to read analysis handle {handle}: {e}")
+            return None
+        return tuple(row) if row else None
+
+
+# Global instance
+analysis_store = AnalysisStore.from_env()
@@ -1,12 +1,28 @@
 import os
 import logging
 import base64
+import hmac
+import json
+import math
+import shutil
+import tempfile
+import time
+import uuid
 from io import BytesIO
-from PIL import Image
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
+from datetime import datetime, timezone
+from flask import Flask, Response, g, render_template, request, jsonify, flash, redirect, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from openai_service import analyze_product_image, generate_ugc_prompt, enhance_prompt_with_templates
+from openai_service import (
+    run_image_analysis, run_image_analyses, stream_image_analysis, stream_ai_powered_ugc_prompt,
+    generate_ugc_prompt, generate_ugc_prompts, generate_ugc_prompt_grid, enhance_prompt_with_templates,
+)
+from image_pipeline import JPEG_QUALITY, TARGET_SIZES, ImageNormalizationError, normalize_image
+from analysis_store import UnknownHandle, analysis_store
+from openai_scheduler import SchedulerOverloaded
+from metrics import UPLOAD_READ_SECONDS, observe_http_request, render_metrics
+from usage_ledger import tag_request, usage_ledger
+from traffic_recorder import RECORDED_ROUTE_PREFIXES, traffic_recorder
 # Google Vision removed - using OpenAI only
 
 # Configure logging
@@ -37,28 +53,288 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def image_to_base64(image_path):
-    """Convert image file to base64 string"""
+def image_to_base64(image_path, kind='product'):
+    """Convert image file to a normalized base64 JPEG string"""
     try:
-        with Image.open(image_path) as img:
-            # Resize image if too large (max 1024px on longest side)
-            img.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Save to bytes
-            buffer = BytesIO()
-            img.save(buffer, format='JPEG', quality=85)
-            img_bytes = buffer.getvalue()
-            
-            # Encode to base64
-            return base64.b64encode(img_bytes).decode('utf-8')
+        with open(image_path, 'rb') as f:
+            # Orient, resize to the kind's target size and re-encode as JPEG
+            img_bytes, _ = normalize_image(f, kind)
+        
+        # Encode to base64
+        return base64.b64encode(img_bytes).decode('utf-8')
     except Exception as e:
         logging.error(f"Error converting image to base64: {e}")
         raise
 
+# Analyze routes take the image as multipart/form-data, as a raw image/* or
+# application/octet-stream body, or (the original contract) as a base64 data
+# URL in a JSON body. Binary uploads skip the 33% base64 overhead and reach
+# Pillow as a file, without a multi-megabyte JSON string in between.
+UPLOAD_SPOOL_BYTES = 1024 * 1024  # raw bodies larger than this go to a temp file
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+def is_binary_upload(mimetype):
+    return mimetype.startswith('image/') or mimetype == 'application/octet-stream'
+
+def spool_upload(stream):
+    """Copy a request body into a spooled temp file; None if it is empty"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    g.setdefault('uploads', []).append(spooled)
+    shutil.copyfileobj(stream, spooled, UPLOAD_CHUNK_BYTES)
+    if not spooled.tell():
+        return None
+    spooled.seek(0)
+    return spooled
+
+def request_image(field='image'):
+    """The image uploaded to an analyze route, or None if there is none.
+
+    Multipart and raw binary uploads come back as seekable files (werkzeug
+    spools multipart files itself); a JSON body's base64 string is returned
+    as is.
+    """
+    if request.mimetype == 'multipart/form-data':
+        with UPLOAD_READ_SECONDS.labels('multipart').time():
+            upload = request.files.get(field)
+        return upload.stream if upload else None
+    if is_binary_upload(request.mimetype):
+        with UPLOAD_READ_SECONDS.labels('binary').time():
+            # record_traffic has already read the body if traffic is being recorded
+            recorded = g.get('recorded_body')
+            return spool_upload(BytesIO(recorded) if recorded is not None else request.stream)
+    with UPLOAD_READ_SECONDS.labels('json').time():
+        data = request.get_json(silent=True)
+    return data.get(field) if isinstance(data, dict) else None
+
+@app.teardown_request
+def close_uploads(exc):
+    for upload in g.pop('uploads', []):
+        upload.close()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def record_traffic():
+    """Append analyze and generate requests to TRAFFIC_RECORD_FILE for benchmarks/replay.py"""
+    if not (traffic_recorder.enabled and request.method == 'POST'
+            and request.path.startswith(RECORDED_ROUTE_PREFIXES)):
+        return
+    inline = {}
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        try:
+            if data.get('analysis_handle'):
+                inline['analysis'] = request_analysis(data)
+            if data.get('prompt_handle'):
+                inline['prompt'] = request_prompt(data)
+        except UnknownHandle:
+            pass
+    g.recorded_body = request.get_data()
+    traffic_recorder.record(request.method, request.path, request.content_type, g.recorded_body, inline)
+
+@app.before_request
+def tag_request_usage():
+    """Tag OpenAI usage with this request; the frontend sends X-Session-Id per browser tab.
+
+    Left set after the request, since streamed responses record their usage
+    once the view has returned; the next request on the thread replaces it.
+    """
+    g.request_id = uuid.uuid4().hex
+    tag_request(
+        request.url_rule.rule if request.url_rule else None,
+        request_id=g.request_id,
+        session_id=request.headers.get('X-Session-Id'),
+    )
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-route latency and sizes; routes are labelled by their URL rule, not the raw path"""
+    started = g.get('request_started')
+    if started is not None:
+        observe_http_request(
+            request.url_rule.rule if request.url_rule else '<unmatched>', request.method,
+            response.status_code, time.perf_counter() - started,
+            request.content_length, response.content_length,
+        )
+    if 'request_id' in g:
+        response.headers['X-Request-Id'] = g.request_id
+    return response
+
+@app.after_request
+def cache_hashed_assets(response):
+    """Hashed picker images from build_assets.py never change, so cache them for good"""
+    if request.path.startswith('/static/images/optimized/') and response.status_code == 200:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def build_generate_context(settings, analysis):
+    """Build the generate_ugc_prompt context from form settings and analysis"""
+    return {
+        'product': settings.get('product', ''),
+        'target_audience': settings.get('target_audience', ''),
+        'ugc_type': settings.get('ugc_type', ''),
+        'creator_age': settings.get('creator_age', ''),
+        'creator_style': settings.get('creator_style', ''),
+        'energy_level': settings.get('energy_level', ''),
+        'tone': settings.get('tone', ''),
+        'duration': settings.get('duration', ''),
+        'platform': settings.get('platform', ''),
+        'setting': settings.get('setting', ''),
+        'lighting': settings.get('lighting', ''),
+        'camera_movement': settings.get('camera_movement', ''),
+        'hook_type': settings.get('hook_type', ''),
+        'custom_hook': settings.get('custom_hook', ''),
+        'conversion_focus': settings.get('conversion_focus', ''),
+        'visual_style': settings.get('visual_style', ''),
+        'product_analysis': analysis
+    }
+
+# Response field for each analysis kind, shared by the single and batch routes
+ANALYSIS_RESULT_FIELDS = {'product': 'analysis', 'scene': 'scene_analysis', 'actor': 'actor_analysis'}
+
+def store_analysis(kind, result, meta):
+    """Keep a successful analysis server-side and return its handle (None on failure)"""
+    if not result or meta.get('error'):
+        return None
+    return analysis_store.put(kind, result)
+
+def analysis_response(kind, result, meta):
+    """The JSON body of a single analyze route, with the analysis handle"""
+    return {
+        'success': True,
+        ANALYSIS_RESULT_FIELDS[kind]: result,
+        'analysis_handle': store_analysis(kind, result, meta),
+        'meta': meta
+    }
+
+def request_analysis(data):
+    """The product analysis sent inline, or the one stored under analysis_handle.
+
+    Raises UnknownHandle for a missing or expired handle.
+    """
+    if data.get('analysis_handle'):
+        return analysis_store.get(data['analysis_handle'], 'product')
+    return data.get('analysis', {})
+
+def request_prompt(data):
+    """The prompt text sent inline, or the one /generate stored under prompt_handle"""
+    if data.get('prompt_handle'):
+        return analysis_store.get(data['prompt_handle'], 'prompt')['prompt']
+    return data.get('prompt')
+
+def generate_response(data, prompt_result):
+    """The JSON body of /generate; the prompt is stored for /enhance-prompt only if store_prompt is set"""
+    response = {'success': True, 'prompt': prompt_result}
+    if data.get('store_prompt'):
+        response['prompt_handle'] = analysis_store.put('prompt', prompt_result)
+    return response
+
+def unknown_handle_error(e):
+    return {'error': f'{e}; analyze the image or generate the prompt again'}
+
+def batch_analysis_images(data):
+    """Pick the product/scene/actor images out of an /analyze-batch body"""
+    return {kind: data[kind] for kind in ANALYSIS_RESULT_FIELDS if data.get(kind)}
+
+def batch_upload_images(files):
+    """Pick the product/scene/actor files out of a multipart /analyze-batch upload"""
+    return {kind: files[kind].stream for kind in ANALYSIS_RESULT_FIELDS if kind in files}
+
+def batch_analysis_response(batch):
+    """Shape a run_image_analyses result like the individual analyze routes"""
+    response = {'success': bool(batch['results'])}
+    handles = {}
+    for kind, result in batch['results'].items():
+        response[ANALYSIS_RESULT_FIELDS[kind]] = result
+        handles[kind] = store_analysis(kind, result, batch['meta'][kind])
+    response['analysis_handles'] = handles
+    response['meta'] = batch['meta']
+    if batch['errors']:
+        response['errors'] = batch['errors']
+    return response
+
+# Upper bound on prompts per /generate-batch request (items + products × grid)
+MAX_BATCH_PROMPTS = int(os.environ.get('MAX_BATCH_PROMPTS', '50000'))
+
+def batch_prompt_request(data):
+    """Validate a /generate-batch body; returns (items, products, grid, count)
+
+    Entries given an analysis_handle come back with the stored analysis inline.
+    """
+    items = data.get('items') or []
+    products = data.get('products') or []
+    grid = data.get('grid') or {}
+
+    if not isinstance(items, list) or not isinstance(products, list) or not isinstance(grid, dict):
+        raise ValueError('items and products must be lists and grid an object')
+    if not all(isinstance(entry, dict) for entry in items + products):
+        raise ValueError('Each item and product must be an object')
+    if not all(isinstance(values, list) and values for values in grid.values()):
+        raise ValueError('Each grid setting must be a non-empty list of values')
+
+    count = len(items) + len(products) * math.prod(len(values) for values in grid.values())
+    if not count:
+        raise ValueError('No prompts requested')
+    if count > MAX_BATCH_PROMPTS:
+        raise ValueError(f'Batch of {count} prompts exceeds the limit of {MAX_BATCH_PROMPTS}')
+
+    # Entries may reference a stored analysis instead of sending it inline
+    try:
+        items, products = [
+            [{**entry, 'analysis': request_analysis(entry)} if entry.get('analysis_handle') else entry
+             for entry in entries]
+            for entries in (items, products)
+        ]
+    except UnknownHandle as e:
+        raise ValueError(str(e)) from None
+    return items, products, grid, count
+
+def batch_prompt_lines(items, products, grid):
+    """Yield /generate-batch NDJSON: one line per prompt, then a summary line"""
+    started = time.perf_counter()
+
+    def context_for(entry):
+        return build_generate_context(entry.get('settings') or {}, entry.get('analysis') or {})
+
+    def line(record):
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    index = 0
+    for entry, result in zip(items, generate_ugc_prompts(context_for(entry) for entry in items)):
+        yield line({'index': index, 'id': entry.get('id'), 'prompt': result})
+        index += 1
+
+    contexts = [context_for(product) for product in products]
+    for product_index, variant, result in generate_ugc_prompt_grid(contexts, grid):
+        yield line({'index': index, 'id': products[product_index].get('id'), 'variant': variant, 'prompt': result})
+        index += 1
+
+    yield line({'done': True, 'count': index, 'elapsed_ms': round((time.perf_counter() - started) * 1000)})
+
+# Streaming routes send server-sent events: "delta" events carry text as the
+# model writes it, and a final "result" event carries the same payload the
+# matching JSON route returns. A "reset" event means the reply so far was
+# rejected and is being rewritten by a stronger model; deltas start over.
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_analysis_event(kind, event, data):
+    if event == 'delta':
+        return sse_event('delta', {'text': data})
+    if event == 'reset':
+        return sse_event('reset', {'reason': data})
+    return sse_event('result', analysis_response(kind, *data))
+
+def sse_prompt_event(event, data):
+    if event == 'delta':
+        return sse_event('delta', {'text': data})
+    return sse_event('result', {'success': True, 'prompt': data})
+
 @app.route('/')
 def index():
     # Check API availability from both sources
@@ -146,10 +422,7 @@ def test_connection():
     try:
         from secure_config import api_key_manager
         from openai import OpenAI
-        try:
-            import httpx  # optional for proxy support
-        except Exception:
-            httpx = None
+        from http_pool import get_http_client
         
         data = request.get_json()
         master_password = data.get('masterPassword')
@@ -165,12 +438,8 @@ def test_connection():
             if not api_key:
                 return jsonify({'success': False, 'error': 'No API key found'})
         
-        # Test the connection (with optional proxy support)
-        proxy = os.environ.get('OPENAI_HTTP_PROXY') or os.environ.get('HTTPS_PROXY') or os.environ.get('HTTP_PROXY')
-        if proxy and httpx is not None:
-            client = OpenAI(api_key=api_key, http_client=httpx.Client(proxies=proxy))
-        else:
-            client = OpenAI(api_key=api_key)
+        # Test the connection over the shared pool (proxy support comes from http_pool)
+        client = OpenAI(api_key=api_key, http_client=get_http_client())
         response = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": "Say 'Connection successful!'"}],
@@ -183,6 +452,93 @@ def test_connection():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Connection failed: {str(e)}'})
 
+@app.route('/api/pool-stats')
+def http_pool_stats():
+    """Connection reuse counters for the shared OpenAI HTTP pools"""
+    if not admin_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    from http_pool import pool_stats
+    return jsonify({'success': True, 'pools': pool_stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint, summed across gunicorn workers in multiprocess mode"""
+    if not admin_allowed():
+        return Response('Forbidden\n', status=403, content_type='text/plain')
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+def admin_allowed():
+    """Admin routes need ADMIN_TOKEN as a bearer token; without ADMIN_TOKEN they are closed"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        # The client address cannot be trusted behind a local reverse proxy
+        return False
+    supplied = request.headers.get('Authorization', '').encode()
+    return hmac.compare_digest(supplied, f'Bearer {token}'.encode())
+
+def parse_time_param(name):
+    """A since/until query parameter as Unix seconds; accepts Unix seconds or ISO 8601 (UTC if naive)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be Unix seconds or an ISO 8601 date') from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+@app.route('/api/usage')
+def usage_rollup():
+    """Token and cost totals from the usage ledger, e.g. ?group_by=day,route&since=2024-05-01"""
+    if not admin_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    group_by = [name.strip() for name in request.args.get('group_by', 'day').split(',') if name.strip()]
+    try:
+        rows = usage_ledger.rollup(group_by, parse_time_param('since'), parse_time_param('until'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'enabled': usage_ledger.enabled, 'group_by': group_by, 'rows': rows})
+
+@app.route('/api/usage/entries')
+def usage_entries():
+    """Recent ledger rows, optionally for one session_id or request_id"""
+    if not admin_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    try:
+        entries = usage_ledger.entries(
+            session_id=request.args.get('session_id'),
+            request_id=request.args.get('request_id'),
+            since=parse_time_param('since'),
+            until=parse_time_param('until'),
+            limit=min(request.args.get('limit', 100, type=int), 1000),
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'enabled': usage_ledger.enabled, 'entries': entries})
+
+@app.route('/api/capabilities')
+def capabilities():
+    """Upload settings the frontend uses to downscale images the way the server would"""
+    response = jsonify({
+        'success': True,
+        # Longest side, per analysis kind, that the server normalizes images to
+        'target_sizes': TARGET_SIZES,
+        # A JPEG at or under the target size is analysed as uploaded, without
+        # a second lossy re-encode on the server
+        'upload_type': 'image/jpeg',
+        'upload_quality': JPEG_QUALITY / 100,
+        'max_upload_bytes': MAX_CONTENT_LENGTH,
+    })
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
 @app.route('/api/list-services', methods=['POST'])
 def list_services():
     """List stored services"""
@@ -241,27 +597,21 @@ def help_redirect():
 def analyze_scene():
     """Analyze scene/location image using OpenAI Vision"""
     try:
-        data = request.get_json()
+        # Multipart, raw binary or base64 JSON upload
+        image = request_image()
         
-        if not data or 'image' not in data:
+        if not image:
             return jsonify({'error': 'No image data provided'}), 400
         
-        image_data = data['image']
-        # Extract base64 data
-        if 'base64,' in image_data:
-            base64_image = image_data.split('base64,')[1]
-        else:
-            base64_image = image_data
-        
-        # Use OpenAI Vision for scene analysis  
-        from openai_service import analyze_scene_image
-        analysis_result = analyze_scene_image(base64_image)
+        # Use OpenAI Vision for scene analysis (repeat images come from the cache)
+        analysis_result, meta = run_image_analysis('scene', image)
         
-        return jsonify({
-            'success': True,
-            'scene_analysis': analysis_result
-        })
+        return jsonify(analysis_response('scene', analysis_result, meta))
         
+    except ImageNormalizationError as e:
+        return jsonify({'error': str(e)}), 400
+    except SchedulerOverloaded as e:
+        return jsonify({'error': f'Server busy, please retry shortly: {str(e)}'}), 503
     except Exception as e:
         logging.error(f"Error analyzing scene: {e}")
         return jsonify({'error': f'Failed to analyze scene: {str(e)}'}), 500
@@ -270,27 +620,21 @@ def analyze_scene():
 def analyze_actor():
     """Analyze actor image using OpenAI Vision"""
     try:
-        data = request.get_json()
+        # Multipart, raw binary or base64 JSON upload
+        image = request_image()
         
-        if not data or 'image' not in data:
+        if not image:
             return jsonify({'error': 'No image data provided'}), 400
         
-        image_data = data['image']
-        # Extract base64 data
-        if 'base64,' in image_data:
-            base64_image = image_data.split('base64,')[1]
-        else:
-            base64_image = image_data
-        
-        # Use OpenAI Vision for actor analysis  
-        from openai_service import analyze_actor_image
-        analysis_result = analyze_actor_image(base64_image)
+        # Use OpenAI Vision for actor analysis (repeat images come from the cache)
+        analysis_result, meta = run_image_analysis('actor', image)
         
-        return jsonify({
-            'success': True,
-            'actor_analysis': analysis_result
-        })
+        return jsonify(analysis_response('actor', analysis_result, meta))
         
+    except ImageNormalizationError as e:
+        return jsonify({'error': str(e)}), 400
+    except SchedulerOverloaded as e:
+        return jsonify({'error': f'Server busy, please retry shortly: {str(e)}'}), 503
     except Exception as e:
         logging.error(f"Error analyzing actor: {e}")
         return jsonify({'error': f'Failed to analyze actor: {str(e)}'}), 500
@@ -299,32 +643,75 @@ def analyze_actor():
 def analyze():
     """Analyze product image using OpenAI Vision"""
     try:
-        data = request.get_json()
+        # Multipart, raw binary or base64 JSON upload
+        image = request_image()
         
-        if not data or 'image' not in data:
+        if not image:
             return jsonify({'error': 'No image data provided'}), 400
         
-        image_data = data['image']
-        # Extract base64 data (remove data:image/jpeg;base64, prefix if present)
-        if 'base64,' in image_data:
-            base64_image = image_data.split('base64,')[1]
-        else:
-            base64_image = image_data
+        # Use OpenAI Vision (repeat images come from the cache)
+        analysis_result, meta = run_image_analysis('product', image)
         
-        # Use OpenAI Vision with 4o-mini
-        analysis_result = analyze_product_image(base64_image)
-        
-        return jsonify({
-            'success': True,
-            'analysis': analysis_result
-        })
+        return jsonify(analysis_response('product', analysis_result, meta))
         
+    except ImageNormalizationError as e:
+        return jsonify({'error': str(e)}), 400
+    except SchedulerOverloaded as e:
+        return jsonify({'error': f'Server busy, please retry shortly: {str(e)}'}), 503
     except Exception as e:
         logging.error(f"Error analyzing image: {e}")
         return jsonify({'error': f'Failed to analyze image: {str(e)}'}), 500
 
 
 
+@app.route('/analyze-stream', methods=['POST'], defaults={'kind': 'product'})
+@app.route('/analyze-scene-stream', methods=['POST'], defaults={'kind': 'scene'})
+@app.route('/analyze-actor-stream', methods=['POST'], defaults={'kind': 'actor'})
+def analyze_stream(kind):
+    """Stream a product, scene or actor analysis as server-sent events"""
+    try:
+        image = request_image()
+        
+        if not image:
+            return jsonify({'error': 'No image data provided'}), 400
+        
+        # Bad images and overload are reported before the stream starts
+        events = stream_image_analysis(kind, image)
+        
+        return Response(
+            (sse_analysis_event(kind, event, value) for event, value in events),
+            mimetype='text/event-stream',
+            headers=SSE_HEADERS
+        )
+        
+    except ImageNormalizationError as e:
+        return jsonify({'error': str(e)}), 400
+    except SchedulerOverloaded as e:
+        return jsonify({'error': f'Server busy, please retry shortly: {str(e)}'}), 503
+    except Exception as e:
+        logging.error(f"Error analyzing {kind} image: {e}")
+        return jsonify({'error': f'Failed to analyze {kind}: {str(e)}'}), 500
+
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Analyze any subset of product, scene and actor images in one request"""
+    try:
+        if request.mimetype == 'multipart/form-data':
+            images = batch_upload_images(request.files)
+        else:
+            images = batch_analysis_images(request.get_json(silent=True) or {})
+        if not images:
+            return jsonify({'error': 'No image data provided'}), 400
+        
+        # The analyses run concurrently, so this takes as long as the slowest one
+        batch = run_image_analyses(images)
+        
+        return jsonify(batch_analysis_response(batch))
+        
+    except Exception as e:
+        logging.error(f"Error analyzing batch: {e}")
+        return jsonify({'error': f'Failed to analyze images: {str(e)}'}), 500
+
 @app.route('/generate', methods=['POST'])
 def generate():
     """Generate UGC prompt based on form data and analysis"""
@@ -334,39 +721,64 @@ def generate():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Extract analysis and settings
-        analysis = data.get('analysis', {})
-        settings = data.get('settings', {})
-        
-        # Create context from form data and analysis
-        context = {
-            'product': settings.get('product', ''),
-            'target_audience': settings.get('target_audience', ''),
-            'ugc_type': settings.get('ugc_type', ''),
-            'creator_age': settings.get('creator_age', ''),
-            'creator_style': settings.get('creator_style', ''),
-            'energy_level': settings.get('energy_level', ''),
-            'tone': settings.get('tone', ''),
-            'duration': settings.get('duration', ''),
-            'platform': settings.get('platform', ''),
-            'setting': settings.get('setting', ''),
-            'lighting': settings.get('lighting', ''),
-            'camera_movement': settings.get('camera_movement', ''),
-            'hook_type': settings.get('hook_type', ''),
-            'custom_hook': settings.get('custom_hook', ''),
-            'conversion_focus': settings.get('conversion_focus', ''),
-            'visual_style': settings.get('visual_style', ''),
-            'product_analysis': analysis
-        }
+        # Create context from form data and the inline or stored analysis
+        context = build_generate_context(data.get('settings', {}), request_analysis(data))
         
         # Generate prompt using templates
         prompt_result = generate_ugc_prompt(context)
         
-        return jsonify({
-            'success': True,
-            'prompt': prompt_result
-        })
+        return jsonify(generate_response(data, prompt_result))
+        
+    except UnknownHandle as e:
+        return jsonify(unknown_handle_error(e)), 404
+    except Exception as e:
+        logging.error(f"Error generating prompt: {e}")
+        return jsonify({'error': f'Failed to generate prompt: {str(e)}'}), 500
+
+@app.route('/generate-batch', methods=['POST'])
+def generate_batch():
+    """Generate template prompts for many contexts, streamed back as NDJSON"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            items, products, grid, count = batch_prompt_request(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return Response(
+            batch_prompt_lines(items, products, grid),
+            mimetype='application/x-ndjson',
+            headers={'X-Prompt-Count': str(count)}
+        )
+        
+    except Exception as e:
+        logging.error(f"Error generating prompt batch: {e}")
+        return jsonify({'error': f'Failed to generate prompts: {str(e)}'}), 500
+
+@app.route('/generate-ai-stream', methods=['POST'])
+def generate_ai_stream():
+    """Stream an AI-written UGC prompt as server-sent events"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        context = build_generate_context(data.get('settings', {}), request_analysis(data))
+        events = stream_ai_powered_ugc_prompt(context, context['product_analysis'] or {})
+        
+        return Response(
+            (sse_prompt_event(event, value) for event, value in events),
+            mimetype='text/event-stream',
+            headers=SSE_HEADERS
+        )
         
+    except UnknownHandle as e:
+        return jsonify(unknown_handle_error(e)), 404
     except Exception as e:
         logging.error(f"Error generating prompt: {e}")
         return jsonify({'error': f'Failed to generate prompt: {str(e)}'}), 500
@@ -377,10 +789,10 @@ def enhance_prompt():
     try:
         data = request.get_json()
         
-        if not data or 'prompt' not in data:
+        if not data or ('prompt' not in data and not data.get('prompt_handle')):
             return jsonify({'error': 'No prompt provided'}), 400
         
-        original_prompt = data['prompt']
+        original_prompt = request_prompt(data)
         enhancement_focus = data.get('enhancement_focus', 'conversion')
         
         # Enhance prompt using templates
@@ -391,6 +803,8 @@ def enhance_prompt():
             'enhancement': enhancement_result
         })
         
+    except UnknownHandle as e:
+        return jsonify(unknown_handle_error(e)), 404
     except Exception as e:
         logging.error(f"Error enhancing prompt: {e}")
         return jsonify({'error': f'Failed to enhance prompt: {str(e)}'}), 500
@@ -0,0 +1,366 @@
+"""
+ASGI entry point with non-blocking OpenAI calls.
+
+The sync Flask app ties up a whole gunicorn worker for the seconds a vision
+call takes. This app serves the OpenAI-bound routes natively on the event
+loop with AsyncOpenAI, so one process can hold hundreds of requests while
+they wait on the network. Every other route (pages, key management, static
+files) is handed to the Flask app unchanged.
+
+Run with:
+    gunicorn -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:5050 asgi:app
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from io import BytesIO
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.formparser import parse_form_data
+from app import (
+    app as flask_app, allowed_origins, analysis_response, batch_analysis_images, batch_analysis_response,
+    batch_upload_images, build_generate_context, generate_response, is_binary_upload, MAX_CONTENT_LENGTH,
+    request_analysis, request_prompt, SSE_HEADERS, sse_analysis_event, sse_prompt_event, unknown_handle_error,
+)
+from analysis_store import UnknownHandle
+from http_pool import get_async_http_client
+from image_pipeline import ImageNormalizationError
+from metrics import UPLOAD_READ_SECONDS, observe_http_request
+from usage_ledger import tag_request
+from openai_scheduler import SchedulerOverloaded
+from openai_service import (
+    arun_image_analysis, arun_image_analyses, astream_image_analysis, astream_ai_powered_ugc_prompt,
+    generate_ugc_prompt, enhance_prompt_with_templates,
+)
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+_allowed_origins = {o.strip() for o in allowed_origins if o.strip()}
+
+
+class Request:
+    def __init__(self, scope, body: bytes):
+        self.scope = scope
+        self.body = body
+        self.id = uuid.uuid4().hex
+
+    def header(self, name: str) -> str | None:
+        name = name.lower().encode("latin-1")
+        for key, value in self.scope["headers"]:
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    @property
+    def mimetype(self) -> str:
+        return (self.header("content-type") or "").split(";", 1)[0].strip().lower()
+
+    def get_json(self):
+        """Parse the body as JSON, returning None if it is empty or invalid."""
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+    def files(self):
+        """Parse a multipart/form-data body with werkzeug, as the Flask routes do."""
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "CONTENT_TYPE": self.header("content-type") or "",
+            "CONTENT_LENGTH": str(len(self.body)),
+            "wsgi.input": BytesIO(self.body),
+        }
+        return parse_form_data(environ)[2]
+
+    async def image(self, field: str = "image"):
+        """Like app.request_image: a file for multipart, the bytes of a raw
+        binary body, or the base64 string of a JSON body; None if missing.
+
+        Multipart bodies are parsed in a worker thread."""
+        if self.mimetype == "multipart/form-data":
+            with UPLOAD_READ_SECONDS.labels("multipart").time():
+                upload = (await asyncio.to_thread(self.files)).get(field)
+            return upload.stream if upload else None
+        if is_binary_upload(self.mimetype):
+            return self.body or None
+        with UPLOAD_READ_SECONDS.labels("json").time():
+            data = self.get_json()
+        return data.get(field) if isinstance(data, dict) else None
+
+
+async def _read_body(receive) -> bytes | None:
+    """Read the request body, returning None once it exceeds MAX_CONTENT_LENGTH."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_CONTENT_LENGTH:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+class EventStream:
+    """Handler result streamed to the client as server-sent events."""
+
+    def __init__(self, events):
+        self.events = events  # async iterator of formatted SSE strings
+
+
+def _request_id_header(request) -> list:
+    return [(b"x-request-id", request.id.encode("ascii"))] if request else []
+
+
+def _cors_headers(request) -> list:
+    origin = request.header("origin") if request else None
+    if origin in _allowed_origins:
+        return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return []
+
+
+async def _send_json(send, request, payload, status=200):
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    headers.extend(_cors_headers(request))
+    headers.extend(_request_id_header(request))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+    return len(body)
+
+
+async def _send_event_stream(send, request, stream: EventStream):
+    headers = [(b"content-type", b"text/event-stream; charset=utf-8")]
+    headers.extend((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in SSE_HEADERS.items())
+    headers.extend(_cors_headers(request))
+    headers.extend(_request_id_header(request))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    async for event in stream.events:
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _image_route(kind, label):
+    async def handler(request):
+        try:
+            image = await request.image()
+
+            if not image:
+                return {'error': 'No image data provided'}, 400
+
+            analysis_result, meta = await arun_image_analysis(kind, image)
+
+            return analysis_response(kind, analysis_result, meta), 200
+
+        except ImageNormalizationError as e:
+            return {'error': str(e)}, 400
+        except SchedulerOverloaded as e:
+            return {'error': f'Server busy, please retry shortly: {str(e)}'}, 503
+        except Exception as e:
+            logging.error(f"Error analyzing {label}: {e}")
+            return {'error': f'Failed to analyze {label}: {str(e)}'}, 500
+
+    return handler
+
+
+def _image_stream_route(kind, label):
+    async def handler(request):
+        try:
+            image = await request.image()
+
+            if not image:
+                return {'error': 'No image data provided'}, 400
+
+            # Bad images and overload are reported before the stream starts
+            events = await astream_image_analysis(kind, image)
+            return EventStream(sse_analysis_event(kind, event, value) async for event, value in events)
+
+        except ImageNormalizationError as e:
+            return {'error': str(e)}, 400
+        except SchedulerOverloaded as e:
+            return {'error': f'Server busy, please retry shortly: {str(e)}'}, 503
+        except Exception as e:
+            logging.error(f"Error analyzing {label}: {e}")
+            return {'error': f'Failed to analyze {label}: {str(e)}'}, 500
+
+    return handler
+
+
+async def analyze_batch(request):
+    try:
+        if request.mimetype == 'multipart/form-data':
+            images = batch_upload_images(await asyncio.to_thread(request.files))
+        else:
+            images = batch_analysis_images(request.get_json() or {})
+        if not images:
+            return {'error': 'No image data provided'}, 400
+
+        batch = await arun_image_analyses(images)
+        return batch_analysis_response(batch), 200
+
+    except Exception as e:
+        logging.error(f"Error analyzing batch: {e}")
+        return {'error': f'Failed to analyze images: {str(e)}'}, 500
+
+
+def _generate(data):
+    context = build_generate_context(data.get('settings', {}), request_analysis(data))
+    return generate_response(data, generate_ugc_prompt(context))
+
+
+async def generate(request):
+    try:
+        data = request.get_json()
+
+        if not data:
+            return {'error': 'No data provided'}, 400
+
+        # The handle lookup, prompt generation and prompt storage block
+        return await asyncio.to_thread(_generate, data), 200
+
+    except UnknownHandle as e:
+        return unknown_handle_error(e), 404
+    except Exception as e:
+        logging.error(f"Error generating prompt: {e}")
+        return {'error': f'Failed to generate prompt: {str(e)}'}, 500
+
+
+async def generate_ai_stream(request):
+    try:
+        data = request.get_json()
+
+        if not data:
+            return {'error': 'No data provided'}, 400
+
+        analysis = await asyncio.to_thread(request_analysis, data)
+        context = build_generate_context(data.get('settings', {}), analysis)
+        events = astream_ai_powered_ugc_prompt(context, context['product_analysis'] or {})
+        return EventStream(sse_prompt_event(event, value) async for event, value in events)
+
+    except UnknownHandle as e:
+        return unknown_handle_error(e), 404
+    except Exception as e:
+        logging.error(f"Error generating prompt: {e}")
+        return {'error': f'Failed to generate prompt: {str(e)}'}, 500
+
+
+async def enhance_prompt(request):
+    try:
+        data = request.get_json()
+
+        if not data or ('prompt' not in data and not data.get('prompt_handle')):
+            return {'error': 'No prompt provided'}, 400
+
+        original_prompt = await asyncio.to_thread(request_prompt, data)
+        enhancement_result = enhance_prompt_with_templates(
+            original_prompt, data.get('enhancement_focus', 'conversion')
+        )
+        return {'success': True, 'enhancement': enhancement_result}, 200
+
+    except UnknownHandle as e:
+        return unknown_handle_error(e), 404
+    except Exception as e:
+        logging.error(f"Error enhancing prompt: {e}")
+        return {'error': f'Failed to enhance prompt: {str(e)}'}, 500
+
+
+async def test_connection(request):
+    try:
+        from secure_config import api_key_manager
+        from openai import AsyncOpenAI
+
+        data = request.get_json() or {}
+        master_password = data.get('masterPassword')
+
+        if not master_password:
+            return {'success': False, 'error': 'Master password is required'}, 200
+
+        # Key derivation is CPU-bound; keep it off the event loop
+        api_key = await asyncio.to_thread(api_key_manager.get_api_key, 'openai', master_password)
+        if not api_key:
+            api_key = os.environ.get('OPENAI_API_KEY')
+            if not api_key:
+                return {'success': False, 'error': 'No API key found'}, 200
+
+        # Not closed: the client shares the process-wide connection pool
+        client = AsyncOpenAI(api_key=api_key, http_client=get_async_http_client())
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "Say 'Connection successful!'"}],
+            max_tokens=10
+        )
+
+        result = response.choices[0].message.content
+        return {'success': True, 'message': f'Connection successful! Response: {result}'}, 200
+
+    except Exception as e:
+        return {'success': False, 'error': f'Connection failed: {str(e)}'}, 200
+
+
+ROUTES = {
+    '/analyze': _image_route('product', 'image'),
+    '/analyze-scene': _image_route('scene', 'scene'),
+    '/analyze-actor': _image_route('actor', 'actor'),
+    '/analyze-stream': _image_stream_route('product', 'image'),
+    '/analyze-scene-stream': _image_stream_route('scene', 'scene'),
+    '/analyze-actor-stream': _image_stream_route('actor', 'actor'),
+    '/analyze-batch': analyze_batch,
+    '/generate': generate,
+    '/generate-ai-stream': generate_ai_stream,
+    '/enhance-prompt': enhance_prompt,
+    '/api/test-connection': test_connection,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    handler = ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+    # Only POSTs are served natively; CORS preflights and everything else go to Flask
+    if handler is None or scope["method"] != "POST":
+        await wsgi_fallback(scope, receive, send)
+        return
+
+    # Timed like the Flask routes: from the start of the request until the
+    # response (or, for event streams, its headers) is ready
+    started = time.perf_counter()
+    path = scope["path"]
+    body = await _read_body(receive)
+    if body is None:
+        observe_http_request(path, "POST", 413, time.perf_counter() - started, None, None)
+        await _send_json(send, None, {'error': 'File too large. Maximum size is 16MB.'}, 413)
+        return
+
+    request = Request(scope, body)
+    tag_request(path, request_id=request.id, session_id=request.header("x-session-id"))
+    response = await handler(request)
+    if isinstance(response, EventStream):
+        observe_http_request(path, "POST", 200, time.perf_counter() - started, len(body), None)
+        await _send_event_stream(send, request, response)
+        return
+    payload, status = response
+    size = await _send_json(send, request, payload, status)
+    observe_http_request(path, "POST", status, time.perf_counter() - started, len(body), size)
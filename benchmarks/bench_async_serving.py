@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Concurrent-request throughput: sync gunicorn workers vs the ASGI app.
+
+Starts the local OpenAI stub, then for each serving mode starts the app
+with the same number of workers and fires a burst of concurrent
+/analyze-scene requests, each with a distinct image so none are served from
+the analysis cache. Reports throughput and latency percentiles.
+
+    python benchmarks/bench_async_serving.py --concurrency 200 --requests 400
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STUB = Path(__file__).resolve().parent / "openai_stub.py"
+
+MODES = {
+    "sync": ["main:app"],
+    "async": ["-k", "uvicorn.workers.UvicornWorker", "asgi:app"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def make_images(count: int) -> list[str]:
+    """Return distinct small JPEG data URLs so every request misses the cache."""
+    images = []
+    for i in range(count):
+        img = Image.new("RGB", (64, 64), (i % 256, (i // 256) % 256, 128))
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append("data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+async def fire(port: int, images: list[str], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=300) as client:
+        async def one(image):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/analyze-scene", json={"image": image})
+                    if response.status_code != 200 or not response.json().get("success"):
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(image) for image in images))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(images),
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": len(images) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def run_mode(mode: str, args, stub_port: int, images: list[str]) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        PYTHONPATH=str(REPO_ROOT),
+    )
+    env.pop("ANALYSIS_CACHE_DIR", None)
+
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--timeout", "300",
+        "--log-level", "warning",
+        *MODES[mode],
+    ]
+    # Run from a scratch directory so the app's uploads/ and .secure_config/ stay out of the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(command, cwd=workdir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            return asyncio.run(fire(port, images, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async serving")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per completion")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, str(STUB), "--port", str(stub_port), "--latency", str(args.latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(stub_port)
+        images = make_images(args.requests)
+        print(f"{args.requests} requests, concurrency {args.concurrency}, "
+              f"{args.workers} workers, stub latency {args.latency}s")
+        print(f"{'mode':<6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'errors':>7} {'total s':>8}")
+        for mode in args.modes:
+            r = run_mode(mode, args, stub_port, images)
+            print(f"{mode:<6} {r['throughput']:>8.1f} {r['p50']:>8.2f} {r['p95']:>8.2f} "
+                  f"{r['errors']:>7} {r['elapsed']:>8.1f}")
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
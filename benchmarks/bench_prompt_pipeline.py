@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for each step of the template prompt pipeline.
+
+Times the functions bulk generation runs for every prompt, over fixtures
+that cover every hook type and UGC type with no, short and long product
+descriptions, and reports per function:
+
+- ns/op: best-of-rounds nanoseconds per call; each round loops for at
+  least --min-time seconds
+- peak B/op: the most memory traced by tracemalloc during one call, which
+  covers temporaries freed before it returns
+- blocks/op: memory blocks still allocated after the call, i.e. the result
+  and anything cached or leaked
+
+    python benchmarks/bench_prompt_pipeline.py --save-baseline benchmarks/baselines/main.json
+    python benchmarks/bench_prompt_pipeline.py --compare benchmarks/baselines/main.json --threshold 0.1
+
+--compare flags every function whose ns/op or peak B/op grew by more than
+--threshold over the baseline and exits with status 1 if any did.
+Baselines are only comparable on the same machine and Python version,
+which the baseline file records.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import openai_service  # noqa: E402
+from prompt_templates import (  # noqa: E402
+    ACTION_TEMPLATES, AUDIO_STYLES, CAMERA_STYLES, HOOK_TEMPLATES, LIGHTING_DESCRIPTIONS, SETTING_DESCRIPTIONS,
+)
+
+SHORT_DESCRIPTIONS = [
+    "A white leather sneaker with a navy logo on a light wooden table.",
+    "A black fabric backpack with silver zippers against a neutral background.",
+    "A premium glass bottle of serum with gold text on the label.",
+]
+LONG_DESCRIPTIONS = [
+    "The image shows a pair of white leather Nike sneakers photographed from a low three-quarter angle on "
+    "a light oak table. The upper is smooth, premium full-grain leather with subtle perforations across the "
+    "toe box, and a navy blue swoosh logo runs along the side panel. The midsole is thick white foam with a "
+    "gum rubber outsole that has a visible herringbone tread. Flat white laces are tied loosely, and a small "
+    "embroidered text tag sits on the tongue. Soft daylight from the left casts gentle shadows and brings out "
+    "the texture of the leather, giving the shot a clean, minimalist, high quality look.",
+    "A matte black stainless steel water bottle stands on a marble kitchen counter next to a bowl of green "
+    "apples. The bottle has a brushed metal cap with a silver carrying loop and a laser-etched logo near the "
+    "base. Condensation beads on the surface suggest it holds a cold drink. The background is a bright, "
+    "modern kitchen with white cabinets and warm pendant lighting, slightly out of focus. The composition is "
+    "centered, with the bottle filling the frame vertically, and the overall mood is fresh, sporty and "
+    "premium, aimed at active people who want durable, elegant everyday gear.",
+]
+ENHANCEMENT_FOCUSES = ["conversion", "visual", "emotion", "engagement"]
+
+
+def make_contexts() -> list[dict]:
+    """Every hook type by every UGC type (plus the defaults), each with no, a short and a long description"""
+    hooks = [*HOOK_TEMPLATES, ""]
+    ugc_types = [*ACTION_TEMPLATES, ""]
+    descriptions = ["", *SHORT_DESCRIPTIONS[:1], *LONG_DESCRIPTIONS[:1]]
+    settings, lightings = list(SETTING_DESCRIPTIONS), list(LIGHTING_DESCRIPTIONS)
+    cameras, styles = list(CAMERA_STYLES), list(AUDIO_STYLES)
+
+    contexts = []
+    for hook_type in hooks:
+        for ugc_type in ugc_types:
+            for description in descriptions:
+                i = len(contexts)
+                contexts.append({
+                    "product": "Sneaker",
+                    "ugc_type": ugc_type,
+                    "target_audience": "gen-z",
+                    "actor_type": "",
+                    "age_range": "18-24",
+                    "gender": "",
+                    "setting": settings[i % len(settings)],
+                    "lighting": lightings[i % len(lightings)],
+                    "camera_movement": cameras[i % len(cameras)],
+                    "hook_type": hook_type,
+                    "custom_hook": "Wait until you see this" if i % 11 == 0 else "",
+                    "performance_style": styles[i % len(styles)],
+                    "video_length": "8",
+                    "aspect_ratio": "9:16",
+                    "audio_enabled": i % 5 != 0,
+                    "product_analysis": {"detailed_description": description} if description else {},
+                    "actor_description": None,
+                    "character_archetype": None,
+                })
+    return contexts
+
+
+def make_cases(contexts: list[dict]) -> dict:
+    """Benchmark name -> (function, list of argument tuples)"""
+    service = openai_service
+    descriptions = SHORT_DESCRIPTIONS + LONG_DESCRIPTIONS
+    enriched = [dict(c, enrichment=service.product_enrichment(c["product_analysis"])) for c in contexts]
+    hits = [service.DESCRIPTION_KEYWORDS.scan(d) for d in descriptions]
+    prompts = [service.generate_ugc_prompt(c)["prompt"] for c in contexts[::7]]
+
+    def generate_cold(context):
+        # Without the enrichment memo, as for the first prompt of each product
+        service._enrichments.clear()
+        return service.generate_ugc_prompt(context)
+
+    return {
+        "generate_ugc_prompt": (service.generate_ugc_prompt, [(c,) for c in contexts]),
+        "generate_ugc_prompt_cold": (generate_cold, [(c,) for c in contexts]),
+        "_build_prompt_from_templates": (service._build_prompt_from_templates, [(c,) for c in enriched]),
+        "_generate_basic_template_prompt": (service._generate_basic_template_prompt, [(c,) for c in enriched]),
+        "DESCRIPTION_KEYWORDS.scan": (service.DESCRIPTION_KEYWORDS.scan, [(d,) for d in descriptions]),
+        "_extract_visual_details": (service._extract_visual_details, [(h,) for h in hits]),
+        "_create_enhanced_product_description": (
+            service._create_enhanced_product_description,
+            [(d, c) for d in descriptions for c in contexts[:: len(contexts) // 8]],
+        ),
+        "enhance_prompt_with_templates": (
+            service.enhance_prompt_with_templates, [(p, f) for p in prompts for f in ENHANCEMENT_FOCUSES],
+        ),
+    }
+
+
+def time_case(func, args_list, rounds: int, min_time: float) -> float:
+    """Best-of-rounds nanoseconds per call; each round repeats the fixture list for at least min_time"""
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            for args in args_list:
+                func(*args)
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+
+    best = elapsed / (loops * len(args_list))
+    for _ in range(rounds - 1):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            for args in args_list:
+                func(*args)
+        best = min(best, (time.perf_counter_ns() - start) / (loops * len(args_list)))
+    return best
+
+
+def measure_memory(func, args_list) -> tuple[float, float]:
+    """(mean peak traced bytes per call, mean blocks still allocated after a call)"""
+    # Blocks are counted without tracemalloc running, into a preallocated list
+    results = [None] * len(args_list)
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    for i, args in enumerate(args_list):
+        results[i] = func(*args)
+    blocks = sys.getallocatedblocks() - blocks_before
+    del results
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for args in args_list:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            func(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return statistics.fmean(peaks), max(0, blocks) / len(args_list)
+
+
+def run(cases: dict, rounds: int, min_time: float) -> dict:
+    results = {}
+    for name, (func, args_list) in cases.items():
+        # Warm up caches and lazily compiled patterns before measuring
+        for args in args_list:
+            func(*args)
+        peak, blocks = measure_memory(func, args_list)
+        results[name] = {
+            "ns_per_op": time_case(func, args_list, rounds, min_time),
+            "peak_bytes_per_op": peak,
+            "blocks_per_op": blocks,
+            "fixtures": len(args_list),
+        }
+    return results
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "git_revision": revision,
+        "created_at": int(time.time()),
+    }
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> dict:
+    """Benchmark name -> list of metrics that grew by more than threshold"""
+    flagged = {}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        metrics = [metric for metric in ("ns_per_op", "peak_bytes_per_op")
+                   if previous.get(metric) and current[metric] > previous[metric] * (1 + threshold)]
+        if metrics:
+            flagged[name] = metrics
+    return flagged
+
+
+def print_report(results: dict, baseline: dict | None, flagged: dict):
+    header = f"{'function':<38} {'ns/op':>10} {'peak B/op':>10} {'blocks/op':>10}"
+    if baseline is not None:
+        header += f" {'base ns/op':>11} {'change':>8}"
+    print(header)
+    for name, r in results.items():
+        row = f"{name:<38} {r['ns_per_op']:>10.0f} {r['peak_bytes_per_op']:>10.0f} {r['blocks_per_op']:>10.1f}"
+        if baseline is not None:
+            previous = baseline.get(name)
+            if previous:
+                change = r["ns_per_op"] / previous["ns_per_op"] - 1
+                row += f" {previous['ns_per_op']:>11.0f} {change:>+8.1%}"
+            else:
+                row += f" {'-':>11} {'new':>8}"
+            if name in flagged:
+                row += f"  REGRESSION ({', '.join(flagged[name])})"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the template prompt pipeline")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds; the best is reported")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing round")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="JSON baseline to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative growth in ns/op or peak B/op counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Cannot read baseline {args.compare}: {e}")
+            sys.exit(1)
+        baseline = saved["results"]
+        env = environment()
+        if (saved["environment"].get("python"), saved["environment"].get("machine")) != (env["python"], env["machine"]):
+            print(f"Warning: baseline was recorded on Python {saved['environment'].get('python')} "
+                  f"({saved['environment'].get('machine')}); numbers may not be comparable")
+
+    contexts = make_contexts()
+    cases = {name: case for name, case in make_cases(contexts).items()
+             if not args.filter or args.filter in name}
+    print(f"{len(contexts)} prompt contexts, best of {args.rounds} rounds of at least {args.min_time}s")
+    results = run(cases, args.rounds, args.min_time)
+
+    flagged = regressions(results, baseline, args.threshold) if baseline is not None else {}
+    print_report(results, baseline, flagged)
+
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"[OK] Baseline saved to {path}")
+
+    if baseline is not None:
+        if flagged:
+            print(f"[ERROR] {len(flagged)} regressions beyond {args.threshold:.0%}: {', '.join(flagged)}")
+            sys.exit(1)
+        print(f"[OK] No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Per-prompt cost of the template prompt builders.
+
+Times generate_ugc_prompt (structured format), the basic fallback format and
+enhance_prompt_with_templates over a fixed mix of contexts. With
+--baseline-ref, the same workload also runs against openai_service.py as it
+was at that git revision, and the speedup is reported:
+
+    python benchmarks/bench_prompt_templates.py --baseline-ref HEAD~1
+"""
+
+import argparse
+import importlib.util
+import itertools
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+HOOK_TYPES = ["problem_agitate_solve", "curiosity_gap", "social_proof", "pattern_interrupt", "fomo", ""]
+UGC_TYPES = ["unboxing", "review", "tutorial", "lifestyle", "before_after", ""]
+DESCRIPTIONS = [
+    "A white leather sneaker with a navy logo, photographed on a light wooden table.",
+    "A black fabric backpack with silver zippers against a neutral background.",
+    "A premium glass bottle of serum with gold text on the label.",
+    "",
+]
+
+
+def make_contexts():
+    contexts = []
+    for hook_type, ugc_type, description in itertools.product(HOOK_TYPES, UGC_TYPES, DESCRIPTIONS):
+        contexts.append({
+            "product": "Sneaker",
+            "hook_type": hook_type,
+            "ugc_type": ugc_type,
+            "target_audience": "gen-z",
+            "setting": "home_bedroom",
+            "lighting": "natural",
+            "camera_movement": "handheld",
+            "performance_style": "excited",
+            "product_analysis": {"detailed_description": description} if description else {},
+        })
+    return contexts
+
+
+def load_service(ref: str | None):
+    """Import openai_service from the working tree, or as it was at a git ref"""
+    if ref is None:
+        import openai_service
+        return openai_service
+
+    source = subprocess.run(
+        ["git", "show", f"{ref}:openai_service.py"],
+        cwd=REPO_ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    path = Path(tempfile.mkdtemp()) / "baseline_openai_service.py"
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location("baseline_openai_service", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def workloads(service, contexts):
+    prompts = [(f"Prompt {i} for a sneaker", focus)
+               for i, focus in enumerate(["conversion", "visual", "emotion", "engagement"] * 50)]
+    return {
+        "structured": (service.generate_ugc_prompt, [(c,) for c in contexts]),
+        "basic": (service._generate_basic_template_prompt, [(c,) for c in contexts]),
+        "enhance": (service.enhance_prompt_with_templates, prompts),
+    }
+
+
+def time_once(func, args_list) -> float:
+    start = time.perf_counter_ns()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter_ns() - start) / len(args_list)
+
+
+def run(services: dict, contexts, repeat: int) -> dict:
+    """Best-of-repeat nanoseconds per call for every service and workload.
+
+    Rounds alternate between services so machine noise hits them equally.
+    """
+    loads = {name: workloads(service, contexts) for name, service in services.items()}
+    best = {name: {case: float("inf") for case in load} for name, load in loads.items()}
+    for _ in range(repeat):
+        for name, load in loads.items():
+            for case, (func, args_list) in load.items():
+                best[name][case] = min(best[name][case], time_once(func, args_list))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template prompt generation")
+    parser.add_argument("--baseline-ref", help="git revision to compare against, e.g. HEAD~1")
+    parser.add_argument("--repeat", type=int, default=20, help="timing rounds; the best is reported")
+    args = parser.parse_args()
+
+    contexts = make_contexts()
+    services = {"current": load_service(None)}
+    if args.baseline_ref:
+        services["baseline"] = load_service(args.baseline_ref)
+    results = run(services, contexts, args.repeat)
+    current, baseline = results["current"], results.get("baseline")
+
+    print(f"{len(contexts)} contexts, best of {args.repeat} rounds (µs per prompt)")
+    header = f"{'format':<12} {'current':>9}"
+    if baseline:
+        header += f" {args.baseline_ref:>12} {'speedup':>8}"
+    print(header)
+    for name, ns in current.items():
+        row = f"{name:<12} {ns / 1000:>9.2f}"
+        if baseline:
+            row += f" {baseline[name] / 1000:>12.2f} {baseline[name] / ns:>7.2f}x"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for benchmarks.
+
+Answers POST /v1/chat/completions with canned content after a delay drawn
+from a latency distribution, so the app can be load-tested without an API
+key or network access. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python benchmarks/openai_stub.py --latency lognormal:0.8,0.5 --error-rate 0.02 --seed 7
+
+--latency takes SECONDS, uniform:LOW,HIGH, normal:MEAN,STDDEV,
+lognormal:MEDIAN,SIGMA or exponential:MEAN. For streamed completions it is
+the time to the first chunk. --error-rate answers that share of completions
+at once with one of --error-statuses (429 responses carry retry-after-ms).
+--responses replaces the canned replies with a JSON file of
+{"json": [objects], "text": [strings]}; each completion picks one.
+
+Every random draw for a completion is seeded from --seed, its request body
+and how many times that body was seen, so replaying the same traffic
+against a fresh stub sees the same latencies, errors and replies in any
+arrival order. GET /stats reports request, error and concurrency counts.
+
+It also mimics the Batch API protocol: file upload and download
+(/v1/files), batch creation and polling (/v1/batches). A batch reports
+in_progress until --batch-latency seconds have passed, then completes with
+one canned completion per input line.
+"""
+
+import argparse
+import asyncio
+import email.parser
+import hashlib
+import json
+import random
+import time
+import uuid
+
+
+PRODUCT_RESPONSE = {
+    "detailed_description": "A white leather sneaker with a navy blue logo on the side, "
+    "a gum rubber sole and flat white laces, photographed on a light wooden table.",
+    "product_name": "Stub Sneaker",
+    "product_type": "footwear",
+    "key_features": ["leather upper", "rubber sole"],
+    "target_audience": "gen-z",
+    "use_cases": ["everyday wear"],
+    "visual_style": "clean",
+    "suggested_setting": "home_bedroom",
+    "emotional_appeal": "confidence",
+    "materials_textures": ["leather", "rubber"],
+    "color_palette": ["white", "navy"],
+    "lighting_style": "soft natural",
+    "composition_notes": "centered product shot",
+}
+TEXT_RESPONSE = "A bright room with soft daylight from a window on the left and pale wooden floors."
+
+ERROR_MESSAGES = {
+    429: ("rate_limit_exceeded", "Rate limit reached (stub)"),
+    500: ("server_error", "The server had an error while processing your request (stub)"),
+    502: ("server_error", "Bad gateway (stub)"),
+    503: ("server_error", "The engine is currently overloaded (stub)"),
+}
+RETRY_AFTER_MS = 200
+STREAM_CHUNK_CHARS = 16
+
+
+def parse_latency(spec: str):
+    """Return a function drawing a latency in seconds from a random.Random.
+
+    Raises ValueError for a spec that is not one of the forms in the module
+    docstring.
+    """
+    name, _, params = spec.partition(":")
+    try:
+        if not params:
+            seconds = float(name)
+            return lambda rng: seconds
+        values = [float(value) for value in params.split(",")]
+        if name == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(*values)
+        if name == "normal" and len(values) == 2:
+            return lambda rng: max(0.0, rng.gauss(*values))
+        if name == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda rng: median * rng.lognormvariate(0.0, sigma)
+        if name in ("exponential", "exp") and len(values) == 1:
+            return lambda rng: rng.expovariate(1 / values[0])
+    except ValueError:
+        pass
+    raise ValueError(f"Bad latency {spec!r}; expected SECONDS, uniform:LOW,HIGH, normal:MEAN,STDDEV, "
+                     f"lognormal:MEDIAN,SIGMA or exponential:MEAN")
+
+
+def load_responses(path: str | None) -> dict:
+    """Canned replies by response type, from a --responses file or the defaults"""
+    responses = {"json": [PRODUCT_RESPONSE], "text": [TEXT_RESPONSE]}
+    if path:
+        with open(path, "r") as f:
+            for key, value in json.load(f).items():
+                if key in responses:
+                    responses[key] = value if isinstance(value, list) else [value]
+    return responses
+
+
+class StubState:
+    def __init__(self, latency: float | str, batch_latency: float = 2.0, error_rate: float = 0.0,
+                 error_statuses=(429, 500), responses: dict | None = None, chunk_interval: float = 0.0,
+                 seed: int = 0):
+        self.latency = parse_latency(str(latency))
+        self.batch_latency = batch_latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.responses = responses or load_responses(None)
+        self.chunk_interval = chunk_interval
+        self.seed = seed
+        self.requests = 0
+        self.completions = 0
+        self.errors = 0
+        self.streams = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.files = {}
+        self.batches = {}
+        self._seen = {}
+
+    def rng_for(self, raw: bytes) -> random.Random:
+        """A generator seeded by the request body and how often it was seen before"""
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        count = self._seen.get(digest, 0)
+        self._seen[digest] = count + 1
+        return random.Random(f"{self.seed}:{digest}:{count}")
+
+
+def completion_content(body: dict, responses: dict | None = None, rng: random.Random | None = None) -> str:
+    responses = responses or load_responses(None)
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        choices = responses["json"]
+        content = choices[rng.randrange(len(choices))] if rng else choices[0]
+        return content if isinstance(content, str) else json.dumps(content)
+    choices = responses["text"]
+    return choices[rng.randrange(len(choices))] if rng else choices[0]
+
+
+def error_payload(status: int) -> dict:
+    code, message = ERROR_MESSAGES.get(status, ("server_error", f"HTTP {status} (stub)"))
+    return {"error": {"message": message, "type": code, "code": code}}
+
+
+def usage_payload(body: dict, content: str) -> dict:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def completion_payload(body: dict, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage_payload(body, content),
+    }
+
+
+def stream_chunk(body: dict, chunk_id: str, delta: dict | None, finish_reason=None, usage=None) -> bytes:
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+
+async def stream_completion(state: StubState, body: dict, content: str):
+    """Server-sent event chunks of a streamed completion, with a usage chunk if asked for"""
+    chunk_id = f"chatcmpl-stub-{time.time_ns()}"
+    yield stream_chunk(body, chunk_id, {"role": "assistant", "content": ""})
+    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+        if start and state.chunk_interval:
+            await asyncio.sleep(state.chunk_interval)
+        yield stream_chunk(body, chunk_id, {"content": content[start:start + STREAM_CHUNK_CHARS]})
+    yield stream_chunk(body, chunk_id, {}, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield stream_chunk(body, chunk_id, None, usage=usage_payload(body, content))
+    yield b"data: [DONE]\n\n"
+
+
+async def handle_chat_completion(state: StubState, body: dict, raw: bytes):
+    rng = state.rng_for(raw)
+    state.completions += 1
+    if state.error_rate and rng.random() < state.error_rate:
+        state.errors += 1
+        status = state.error_statuses[rng.randrange(len(state.error_statuses))]
+        return status, error_payload(status)
+
+    await asyncio.sleep(state.latency(rng))
+    content = completion_content(body, state.responses, rng)
+    if body.get("stream"):
+        state.streams += 1
+        return 200, stream_completion(state, body, content)
+    return 200, completion_payload(body, content)
+
+
+def parse_multipart(content_type: str, raw: bytes) -> dict:
+    """Return {field name: (filename, bytes)} for a multipart/form-data body"""
+    message = email.parser.BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + raw
+    )
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def file_object(file_id: str, filename: str, purpose: str, data: bytes, created: int) -> dict:
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(data),
+        "created_at": created,
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+
+
+def store_file(state: StubState, filename: str, purpose: str, data: bytes) -> dict:
+    file_id = f"file-stub-{uuid.uuid4().hex[:12]}"
+    state.files[file_id] = file_object(file_id, filename, purpose, data, int(time.time())), data
+    return state.files[file_id][0]
+
+
+def upload_file(state: StubState, headers: dict, raw: bytes):
+    fields = parse_multipart(headers.get("content-type", ""), raw)
+    if "file" not in fields:
+        return 400, {"error": {"message": "No file uploaded", "type": "invalid_request_error"}}
+    filename, data = fields["file"]
+    purpose = (fields.get("purpose") or (None, b"batch"))[1].decode()
+    return 200, store_file(state, filename or "upload.jsonl", purpose, data)
+
+
+def run_batch(state: StubState, batch: dict):
+    """Answer every request line of a batch's input file and attach the output file"""
+    _, data = state.files[batch["input_file_id"]]
+    lines = []
+    for line in data.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        body = request.get("body", {})
+        lines.append({
+            "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+            "custom_id": request.get("custom_id"),
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": completion_payload(body, completion_content(body, state.responses)),
+            },
+            "error": None,
+        })
+    output = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+    batch["output_file_id"] = store_file(state, f"{batch['id']}_output.jsonl", "batch_output", output)["id"]
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+    batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+
+
+def create_batch(state: StubState, body: dict):
+    if body.get("input_file_id") not in state.files:
+        return 404, {"error": {"message": "No such file", "type": "invalid_request_error"}}
+    batch_id = f"batch_stub_{uuid.uuid4().hex[:12]}"
+    batch = state.batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body.get("endpoint"),
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window", "24h"),
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "completed_at": None,
+        "metadata": body.get("metadata"),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    return 200, batch
+
+
+def retrieve_batch(state: StubState, batch_id: str):
+    batch = state.batches.get(batch_id)
+    if batch is None:
+        return 404, {"error": {"message": "No such batch", "type": "invalid_request_error"}}
+    if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= state.batch_latency:
+        run_batch(state, batch)
+    return 200, batch
+
+
+async def route(state: StubState, method: str, path: str, headers: dict, raw: bytes):
+    body = json.loads(raw) if raw and "json" in headers.get("content-type", "application/json") else {}
+    if method == "POST" and path == "/v1/chat/completions":
+        return await handle_chat_completion(state, body, raw)
+    if method == "POST" and path == "/v1/files":
+        return upload_file(state, headers, raw)
+    if method == "GET" and path.startswith("/v1/files/") and path.endswith("/content"):
+        stored = state.files.get(path[len("/v1/files/"):-len("/content")])
+        if stored is None:
+            return 404, {"error": {"message": "No such file", "type": "invalid_request_error"}}
+        return 200, stored[1]
+    if method == "POST" and path == "/v1/batches":
+        return create_batch(state, body)
+    if method == "GET" and path.startswith("/v1/batches/"):
+        return retrieve_batch(state, path[len("/v1/batches/"):])
+    if method == "GET" and path == "/stats":
+        return 200, {
+            "requests": state.requests,
+            "completions": state.completions,
+            "errors": state.errors,
+            "streams": state.streams,
+            "in_flight": state.in_flight,
+            "max_in_flight": state.max_in_flight,
+        }
+    return 404, {"error": {"message": f"No stub for {method} {path}", "type": "invalid_request_error"}}
+
+
+async def handle_connection(state: StubState, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            raw = await reader.readexactly(int(headers.get("content-length", "0")))
+
+            state.requests += 1
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                status, payload = await route(state, method, path.split("?", 1)[0], headers, raw)
+                head = f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                if status == 429:
+                    head += f"retry-after-ms: {RETRY_AFTER_MS}\r\n"
+
+                if hasattr(payload, "__aiter__"):
+                    # Streamed completion: chunked server-sent events
+                    writer.write(
+                        f"{head}Content-Type: text/event-stream\r\n"
+                        f"Transfer-Encoding: chunked\r\n\r\n".encode("latin-1")
+                    )
+                    async for data in payload:
+                        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                        await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                else:
+                    if isinstance(payload, bytes):
+                        data, content_type = payload, "application/octet-stream"
+                    else:
+                        data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                    writer.write(
+                        f"{head}Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                    )
+                await writer.drain()
+            finally:
+                state.in_flight -= 1
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, state: StubState, description: str = ""):
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(state, r, w), host, port, backlog=1024
+    )
+    print(f"OpenAI stub listening on http://{host}:{port}/v1 {description}".rstrip(), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="1.0",
+                        help="seconds per completion, or a distribution such as lognormal:0.8,0.5")
+    parser.add_argument("--chunk-interval", type=float, default=0.0,
+                        help="seconds between chunks of a streamed completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions answered with an error")
+    parser.add_argument("--error-statuses", default="429,500", help="comma-separated statuses for injected errors")
+    parser.add_argument("--responses", help="JSON file of canned replies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="seconds before a batch completes")
+    args = parser.parse_args()
+
+    try:
+        state = StubState(
+            args.latency, args.batch_latency, args.error_rate,
+            [int(status) for status in args.error_statuses.split(",")],
+            load_responses(args.responses), args.chunk_interval, args.seed,
+        )
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    description = f"(latency {args.latency}, error rate {args.error_rate}, seed {args.seed})"
+    try:
+        asyncio.run(serve(args.host, args.port, state, description))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
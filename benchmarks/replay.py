@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Replay recorded or synthetic API traffic against the app and report latency.
+
+    python benchmarks/replay.py synthesize workload.jsonl --requests 500 --mix analyze=1,analyze-scene=1,generate=4
+    python benchmarks/replay.py run workload.jsonl --rps 20 --serve sync --latency lognormal:0.8,0.5
+    python benchmarks/replay.py run recorded.jsonl --url http://127.0.0.1:5000 --speed 2
+
+A workload is a JSONL file with one request per line: "ts" (arrival time
+in seconds), "method", "path", "content_type" and the body as "json" or
+"body_b64", plus optional "inline" values for the analysis and prompt
+handles it used. Start the app with TRAFFIC_RECORD_FILE=recorded.jsonl to
+record real /analyze and /generate traffic in this format; synthesize
+writes a seeded one with distinct images, a share of repeats (which the
+analysis cache answers) and Poisson arrivals.
+
+run sends every request at its scheduled time whether or not earlier ones
+have finished, and measures latency from that scheduled time, so a server
+falling behind shows up as latency instead of a lower send rate. With
+--rps the requests are spaced evenly; otherwise the recorded gaps are kept,
+divided by --speed. --serve starts the local OpenAI stub and the app under
+gunicorn in a scratch directory, passing --latency, --error-rate and --seed
+to the stub, so a run needs no API key and repeats exactly. The app's
+OpenAI rate limits are lifted unless OPENAI_RPM_LIMIT or OPENAI_TPM_LIMIT
+is set. --url targets an app that is already running.
+
+The report gives p50/p95/p99 latency, time to first byte, throughput and
+error rate per route and in total. A request fails on an HTTP error or a
+body (or final stream event) reporting one, including analyses that fell
+back after an OpenAI error.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image, ImageDraw
+
+from bench_async_serving import MODES, REPO_ROOT, STUB, free_port, wait_for_port
+
+# Route name for --mix -> (path, body type)
+SYNTHETIC_ROUTES = {
+    "analyze": ("/analyze", "image"),
+    "analyze-scene": ("/analyze-scene", "image"),
+    "analyze-actor": ("/analyze-actor", "image"),
+    "analyze-stream": ("/analyze-stream", "image"),
+    "analyze-scene-stream": ("/analyze-scene-stream", "image"),
+    "generate": ("/generate", "settings"),
+    "generate-ai-stream": ("/generate-ai-stream", "settings"),
+}
+DEFAULT_MIX = "analyze=2,analyze-scene=1,analyze-actor=1,generate=6"
+
+SETTINGS_CHOICES = {
+    "hook_type": ["problem_agitate_solve", "curiosity_gap", "social_proof", "pattern_interrupt", "fomo"],
+    "ugc_type": ["unboxing", "review", "tutorial", "lifestyle", "before_after"],
+    "target_audience": ["gen-z", "millennials", "parents", "professionals"],
+    "setting": ["home_bedroom", "kitchen", "outdoor", "office"],
+    "lighting": ["natural", "golden_hour", "ring_light"],
+    "camera_movement": ["handheld", "static", "close_zoom"],
+}
+DESCRIPTIONS = [
+    "A white leather sneaker with a navy logo, photographed on a light wooden table.",
+    "A black fabric backpack with silver zippers against a neutral background.",
+    "A premium glass bottle of serum with gold text on the label.",
+]
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(spec: str) -> list[tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SYNTHETIC_ROUTES:
+            raise ValueError(f"Unknown route {name!r} in --mix; expected any of {', '.join(SYNTHETIC_ROUTES)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def synthetic_image(rng: random.Random, size: int) -> bytes:
+    """A JPEG of random shapes, far enough apart from any other that no cache tier matches it"""
+    image = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(size), rng.randrange(size)
+        x1, y1 = x0 + rng.randrange(size // 8, size // 2), y0 + rng.randrange(size // 8, size // 2)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def synthesize(count: int, mix, repeat: float, rate: float, image_size: int, seed: int) -> list[dict]:
+    """A seeded workload; repeat is the share of image requests reusing an earlier image"""
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    images = {}
+    entries = []
+    ts = 0.0
+    for _ in range(count):
+        ts += rng.expovariate(rate)
+        name = rng.choices(names, weights)[0]
+        path, body_type = SYNTHETIC_ROUTES[name]
+        if body_type == "image":
+            seen = images.setdefault(path, [])
+            if seen and rng.random() < repeat:
+                image = rng.choice(seen)
+            else:
+                image = "data:image/jpeg;base64," + base64.b64encode(synthetic_image(rng, image_size)).decode()
+                seen.append(image)
+            body = {"image": image}
+        else:
+            settings = {key: rng.choice(values) for key, values in SETTINGS_CHOICES.items()}
+            settings["product"] = "Sneaker"
+            body = {"settings": settings, "analysis": {"detailed_description": rng.choice(DESCRIPTIONS)}}
+        entries.append({"ts": round(ts, 4), "method": "POST", "path": path,
+                        "content_type": "application/json", "json": body})
+    return entries
+
+
+def load_workload(path: Path) -> list[dict]:
+    with open(path, "r") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        raise ValueError(f"{path} holds no requests")
+    return sorted(entries, key=lambda entry: entry.get("ts", 0))
+
+
+def schedule(entries: list[dict], rps: float | None, speed: float, count: int | None) -> list[tuple[float, dict]]:
+    """(seconds after the start, entry) pairs; a longer count cycles through the workload"""
+    count = count or len(entries)
+    if rps:
+        return [(i / rps, entries[i % len(entries)]) for i in range(count)]
+
+    start, span = entries[0].get("ts", 0), 0.0
+    if len(entries) > 1:
+        # One mean gap between the last request of a pass and the first of the next
+        span = (entries[-1].get("ts", 0) - start) * len(entries) / (len(entries) - 1)
+    return [
+        ((entries[i % len(entries)].get("ts", 0) - start + span * (i // len(entries))) / speed,
+         entries[i % len(entries)])
+        for i in range(count)
+    ]
+
+
+def request_args(entry: dict) -> dict:
+    """httpx request arguments for an entry, with recorded handles replaced by their values"""
+    headers = {"Content-Type": entry["content_type"]} if entry.get("content_type") else {}
+    if "json" in entry:
+        body = entry["json"]
+        if entry.get("inline") and isinstance(body, dict):
+            body = dict(body)
+            for key, value in entry["inline"].items():
+                body.pop(f"{key}_handle", None)
+                body[key] = value
+        return {"content": json.dumps(body).encode("utf-8"), "headers": headers}
+    return {"content": base64.b64decode(entry.get("body_b64", "")), "headers": headers}
+
+
+def response_failed(status: int, content_type: str, body: bytes) -> bool:
+    if status >= 400:
+        return True
+    try:
+        if content_type.startswith("text/event-stream"):
+            results = [line for line in body.decode("utf-8").split("\n\n") if line.startswith("event: result")]
+            if not results:
+                return True
+            payload = json.loads(results[-1].split("data: ", 1)[1])
+        elif content_type.startswith("application/json"):
+            payload = json.loads(body)
+        else:
+            return False
+    except (ValueError, IndexError):
+        return True
+    return bool(isinstance(payload, dict) and (payload.get("error") or (payload.get("meta") or {}).get("error")))
+
+
+async def replay(url: str, planned, max_in_flight: int, timeout: float) -> tuple[list[dict], float]:
+    """Send every planned request on time; returns (results, seconds from start to the last reply)"""
+    slots = asyncio.Semaphore(max_in_flight)
+    results = []
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+
+        async def one(offset, entry):
+            await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+            scheduled = start + offset
+            first_byte = None
+            status, content_type, chunks = 0, "", []
+            async with slots:
+                try:
+                    async with client.stream(entry.get("method", "POST"), entry["path"],
+                                             **request_args(entry)) as response:
+                        status, content_type = response.status_code, response.headers.get("content-type", "")
+                        async for chunk in response.aiter_bytes():
+                            if first_byte is None:
+                                first_byte = time.perf_counter()
+                            chunks.append(chunk)
+                except httpx.HTTPError:
+                    pass
+            done = time.perf_counter()
+            results.append({
+                "path": entry["path"],
+                "status": status,
+                "failed": status == 0 or response_failed(status, content_type, b"".join(chunks)),
+                "latency": done - scheduled,
+                "ttfb": (first_byte or done) - scheduled,
+                "done": done - start,
+            })
+
+        await asyncio.gather(*(one(offset, entry) for offset, entry in planned))
+    return results, max(result["done"] for result in results)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(results: list[dict], elapsed: float) -> dict:
+    def stats(rows):
+        latencies = sorted(row["latency"] for row in rows)
+        failed = sum(row["failed"] for row in rows)
+        return {
+            "requests": len(rows),
+            "failed": failed,
+            "error_rate": failed / len(rows),
+            "throughput": len(rows) / elapsed if elapsed else 0.0,
+            **{f"p{q}_ms": percentile(latencies, q) * 1000 for q in PERCENTILES},
+            "ttfb_p50_ms": percentile(sorted(row["ttfb"] for row in rows), 50) * 1000,
+            "statuses": {str(status): sum(row["status"] == status for row in rows)
+                         for status in sorted({row["status"] for row in rows})},
+        }
+
+    routes = {}
+    for row in results:
+        routes.setdefault(row["path"], []).append(row)
+    return {
+        "elapsed": elapsed,
+        "total": stats(results),
+        "routes": {path: stats(rows) for path, rows in sorted(routes.items())},
+    }
+
+
+def print_report(report: dict):
+    print(f"{'route':<24} {'reqs':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'ttfb ms':>8} {'errors':>7}")
+    for name, r in [*report["routes"].items(), ("total", report["total"])]:
+        print(f"{name:<24} {r['requests']:>6} {r['throughput']:>7.1f} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} "
+              f"{r['p99_ms']:>8.0f} {r['ttfb_p50_ms']:>8.0f} {r['error_rate']:>7.1%}")
+    if report.get("openai"):
+        o = report["openai"]
+        print(f"OpenAI stub: {o['completions']} completions, {o['errors']} injected errors, "
+              f"{o['max_in_flight']} max in flight")
+
+
+@contextmanager
+def serve_app(args):
+    """Start the OpenAI stub and the app; yields (app URL, stub URL)"""
+    stub_port, port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, str(STUB), "--port", str(stub_port), "--latency", args.latency,
+         "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL,
+    )
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        PYTHONPATH=str(REPO_ROOT),
+    )
+    for name in ("ANALYSIS_CACHE_DIR", "ANALYSIS_STORE_DB", "TRAFFIC_RECORD_FILE"):
+        env.pop(name, None)
+    # The stub has no rate limits; keep the app's limiter from pacing the run unless asked to
+    env.setdefault("OPENAI_RPM_LIMIT", "1000000")
+    env.setdefault("OPENAI_TPM_LIMIT", "1000000000")
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--timeout", "300",
+        "--log-level", "warning",
+        *MODES[args.serve],
+    ]
+    # Run from a scratch directory so the app's uploads/, ledger and key store stay out of the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(command, cwd=workdir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(stub_port)
+            wait_for_port(port)
+            yield f"http://127.0.0.1:{port}", f"http://127.0.0.1:{stub_port}"
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            stub.terminate()
+            stub.wait(timeout=10)
+
+
+def run(args):
+    entries = load_workload(Path(args.workload))
+    planned = schedule(entries, args.rps, args.speed, args.requests)
+    rate = f"{args.rps} req/s" if args.rps else f"recorded pacing x{args.speed}"
+    print(f"Replaying {len(planned)} requests from {args.workload} at {rate}")
+
+    if args.url:
+        results, elapsed = asyncio.run(replay(args.url, planned, args.max_in_flight, args.timeout))
+        report = summarize(results, elapsed)
+    else:
+        print(f"Serving with {args.workers} {args.serve} workers, stub latency {args.latency}, "
+              f"error rate {args.error_rate}, seed {args.seed}")
+        with serve_app(args) as (url, stub_url):
+            results, elapsed = asyncio.run(replay(url, planned, args.max_in_flight, args.timeout))
+            report = summarize(results, elapsed)
+            report["openai"] = httpx.get(f"{stub_url}/stats").json()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] Report written to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay API traffic against the app")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synth = commands.add_parser("synthesize", help="write a seeded synthetic workload")
+    synth.add_argument("out", help="JSONL workload to write")
+    synth.add_argument("--requests", type=int, default=500)
+    synth.add_argument("--mix", default=DEFAULT_MIX, help=f"route=weight list (default {DEFAULT_MIX})")
+    synth.add_argument("--repeat", type=float, default=0.2, help="share of image requests reusing an image")
+    synth.add_argument("--rate", type=float, default=10.0, help="mean arrivals per second")
+    synth.add_argument("--image-size", type=int, default=768)
+    synth.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser("run", help="replay a workload and report latency")
+    run_parser.add_argument("workload", help="JSONL workload, recorded or synthesized")
+    target = run_parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="base URL of a running app")
+    target.add_argument("--serve", choices=list(MODES), default="sync",
+                        help="start the stub and the app with sync or async workers (default)")
+    run_parser.add_argument("--rps", type=float, help="send at this fixed rate instead of the recorded pacing")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="divide recorded gaps by this")
+    run_parser.add_argument("--requests", type=int, help="requests to send, cycling through the workload")
+    run_parser.add_argument("--max-in-flight", type=int, default=256)
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--workers", type=int, default=2)
+    run_parser.add_argument("--latency", default="lognormal:0.8,0.5", help="stub latency distribution")
+    run_parser.add_argument("--error-rate", type=float, default=0.0, help="stub error rate")
+    run_parser.add_argument("--seed", type=int, default=0, help="stub seed")
+    run_parser.add_argument("--json", help="also write the report as JSON to this file")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "synthesize":
+            entries = synthesize(args.requests, parse_mix(args.mix), args.repeat, args.rate,
+                                 args.image_size, args.seed)
+            with open(args.out, "w") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+            print(f"[OK] {len(entries)} requests written to {args.out}")
+        else:
+            run(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
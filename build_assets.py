@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Build responsive variants of the picker images.
+
+The actor portraits in static/images are PNGs of up to 3 MB each, far more
+than the 120x180 CSS pixels the picker shows them at. This writes each image
+at a few widths as WebP (and AVIF, when Pillow can encode it) into
+static/images/optimized, with a content hash in every filename, and records
+the variants and their dimensions in static/data/image-manifest.json. The
+picker reads the manifest to build a srcset, so browsers fetch the smallest
+variant for their screen density and never the original.
+
+    python build_assets.py            # rebuild changed images
+    python build_assets.py --force    # re-encode everything
+
+Hashed filenames never change content, so they are served with a long,
+immutable cache lifetime. Variants no longer referenced by the manifest are
+removed. Images in the manifest whose source bytes are unchanged are
+skipped.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+REPO_ROOT = Path(__file__).resolve().parent
+SOURCE_DIR = REPO_ROOT / "static" / "images"
+OUTPUT_DIR = SOURCE_DIR / "optimized"
+MANIFEST_PATH = REPO_ROOT / "static" / "data" / "image-manifest.json"
+SOURCE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+# 1x, 2x and 3x of the 120px the picker renders a portrait at
+VARIANT_WIDTHS = (120, 240, 360)
+
+# (mime type, Pillow format, file extension, save options), best format first
+VARIANT_FORMATS = (
+    ("image/avif", "AVIF", "avif", {"quality": 55, "speed": 6}),
+    ("image/webp", "WEBP", "webp", {"quality": 80, "method": 6}),
+)
+
+
+def available_formats():
+    """The VARIANT_FORMATS this Pillow build can encode"""
+    Image.init()
+    return [fmt for fmt in VARIANT_FORMATS if fmt[1] in Image.SAVE]
+
+
+def url_for(path: Path) -> str:
+    return "/" + path.relative_to(REPO_ROOT).as_posix()
+
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"images": {}}
+
+
+def save_manifest(manifest: dict):
+    """Write the manifest atomically so the app never reads a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=MANIFEST_PATH.parent, prefix=MANIFEST_PATH.name, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def build_image(source: Path, formats) -> dict:
+    """Encode every variant of one image and return its manifest entry"""
+    data = source.read_bytes()
+    with Image.open(BytesIO(data)) as im:
+        im = ImageOps.exif_transpose(im)
+        width, height = im.size
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+
+        # Never upscale: widths past the source collapse to the source width
+        widths = sorted({min(w, width) for w in VARIANT_WIDTHS})
+        variants = {}
+        for mime, pil_format, ext, options in formats:
+            variants[mime] = []
+            for w in widths:
+                h = round(height * w / width)
+                resized = im if w == width else im.resize((w, h), Image.LANCZOS)
+                out = BytesIO()
+                resized.save(out, pil_format, **options)
+                encoded = out.getvalue()
+                digest = hashlib.blake2b(encoded, digest_size=6).hexdigest()
+                path = OUTPUT_DIR / f"{source.stem}-{w}w.{digest}.{ext}"
+                if not path.exists():
+                    path.write_bytes(encoded)
+                variants[mime].append({"src": url_for(path), "width": w, "height": h, "bytes": len(encoded)})
+
+    return {
+        "source_hash": hashlib.blake2b(data, digest_size=12).hexdigest(),
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+        "variants": variants,
+    }
+
+
+def build(force: bool = False) -> dict:
+    """Bring the optimized variants and the manifest up to date"""
+    formats = available_formats()
+    if not formats:
+        raise RuntimeError("Pillow cannot encode WebP or AVIF; install a build with libwebp")
+    mimes = [fmt[0] for fmt in formats]
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    previous = load_manifest().get("images", {})
+    images = {}
+
+    for source in sorted(SOURCE_DIR.iterdir()):
+        if not source.is_file() or source.suffix.lower() not in SOURCE_SUFFIXES:
+            continue
+        key = url_for(source)
+        entry = previous.get(key)
+        if (not force and entry
+                and entry.get("source_hash") == hashlib.blake2b(source.read_bytes(), digest_size=12).hexdigest()
+                and list(entry.get("variants", {})) == mimes
+                and all((REPO_ROOT / v["src"].lstrip("/")).exists()
+                        for variants in entry["variants"].values() for v in variants)):
+            images[key] = entry
+            continue
+        try:
+            images[key] = build_image(source, formats)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {source.name}: {e}")
+            continue
+        smallest = min(v["bytes"] for variants in images[key]["variants"].values() for v in variants)
+        print(f"[OK] {source.name}: {images[key]['bytes'] // 1024} KB -> {smallest // 1024} KB at {VARIANT_WIDTHS[0]}w")
+
+    referenced = {v["src"] for entry in images.values() for variants in entry["variants"].values() for v in variants}
+    for path in OUTPUT_DIR.iterdir():
+        if path.is_file() and url_for(path) not in referenced:
+            path.unlink()
+
+    manifest = {"widths": list(VARIANT_WIDTHS), "formats": mimes, "images": images}
+    save_manifest(manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build responsive WebP/AVIF variants of the picker images")
+    parser.add_argument('--force', action='store_true', help="re-encode images even if unchanged")
+    args = parser.parse_args()
+
+    try:
+        manifest = build(force=args.force)
+    except (OSError, RuntimeError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    original = sum(entry["bytes"] for entry in manifest["images"].values())
+    thumbnails = sum(entry["variants"][manifest["formats"][-1]][0]["bytes"] for entry in manifest["images"].values())
+    print(f"[OK] {len(manifest['images'])} images in {MANIFEST_PATH.relative_to(REPO_ROOT)}: "
+          f"{original // 1024} KB of originals, {thumbnails // 1024} KB of 1x thumbnails")
+
+
+if __name__ == "__main__":
+    main()
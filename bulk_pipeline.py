@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Bulk Product Pipeline
+Analyze a folder (or JSONL manifest) of product images and generate UGC
+prompts for every image without the browser UI.
+
+    python bulk_pipeline.py products/ --out results.jsonl \\
+        --settings '{"ugc_type": "review", "target_audience": "gen-z"}' \\
+        --grid '{"hook_type": ["fomo", "curiosity_gap"]}'
+
+Each image is normalized, analyzed with bounded concurrency (OpenAI rate
+limits still apply through the shared scheduler) and expanded into one
+template prompt per grid combination. One JSON record per image is
+appended to the output as soon as it finishes, so the output doubles as
+the checkpoint: rerunning the same command skips images that already have
+a successful record and retries the ones that failed. Ctrl-C stops
+starting new images, waits for the analyses already running and writes
+their records before exiting.
+
+A manifest has one JSON object per line: {"image": "path.jpg"} plus
+optional "id" and "settings" (merged over --settings). Relative image
+paths are resolved against the manifest's folder.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+
+from image_pipeline import ImageNormalizationError
+from openai_service import generate_ugc_prompt_grid, run_image_analysis
+from usage_ledger import tag_request
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+
+
+def load_json_option(value):
+    """Parse an option given either as inline JSON or as a path to a JSON file"""
+    if not value:
+        return {}
+    if os.path.isfile(value):
+        with open(value, 'r') as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def discover_jobs(source: Path):
+    """Return [{"id", "image", "settings"}] for a directory or JSONL manifest"""
+    if source.is_dir():
+        return [
+            {'id': str(path.relative_to(source)), 'image': str(path), 'settings': {}}
+            for path in sorted(source.rglob('*'))
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+        ]
+
+    jobs = []
+    with open(source, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if 'image' not in entry:
+                raise ValueError(f"{source}:{line_number}: manifest entry has no 'image'")
+            image = source.parent / entry['image']
+            jobs.append({
+                'id': str(entry.get('id', entry['image'])),
+                'image': str(image),
+                'settings': entry.get('settings') or {},
+            })
+    return jobs
+
+
+def load_checkpoint(out_path: Path):
+    """Return the ids already processed successfully in an existing output file.
+
+    A record cut off by an interrupted run is dropped by truncating the file
+    back to its last complete line.
+    """
+    done = set()
+    if not out_path.exists():
+        return done
+
+    with open(out_path, 'rb+') as f:
+        valid_size = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_size += len(line)
+            if not record.get('error'):
+                done.add(record['id'])
+        f.truncate(valid_size)
+    return done
+
+
+def process_image(job, base_settings, grid):
+    """Analyze one image and generate its prompts; returns the output record"""
+    record = {'id': job['id'], 'image': job['image']}
+    tag_request('bulk_pipeline', request_id=job['id'])
+    try:
+        with open(job['image'], 'rb') as f:
+            image_bytes = f.read()
+
+        analysis, meta = run_image_analysis('product', image_bytes)
+        record['analysis'] = analysis
+        record['meta'] = meta
+        if meta.get('error') or not analysis:
+            record['error'] = meta.get('error', 'Product analysis returned no result')
+            return record
+
+        settings = {**base_settings, **job['settings']}
+        context = {
+            **settings,
+            'product': settings.get('product') or analysis.get('product_name', ''),
+            'product_analysis': analysis,
+        }
+        record['prompts'] = [
+            {'variant': variant, 'prompt': result}
+            for _, variant, result in generate_ugc_prompt_grid([context], grid)
+        ]
+    except (OSError, ImageNormalizationError) as e:
+        record['error'] = str(e)
+    except Exception as e:
+        record['error'] = f'Failed to process image: {e}'
+    return record
+
+
+class Progress:
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.images = 0
+        self.errors = 0
+        self.tokens = 0
+        self.cache_hits = 0
+
+    def add(self, record):
+        self.images += 1
+        meta = record.get('meta') or {}
+        if record.get('error'):
+            self.errors += 1
+        if meta.get('cache') in ('hit', 'near_duplicate'):
+            self.cache_hits += 1
+        self.tokens += (meta.get('usage') or {}).get('total_tokens', 0)
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"{self.images}/{self.total} images | {self.images / elapsed:.2f} img/s | "
+            f"{self.tokens / elapsed:.0f} tok/s | {self.cache_hits} cached | "
+            f"{self.errors} errors | {elapsed:.0f}s"
+        )
+
+    def maybe_report(self):
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(self.line(), file=sys.stderr, flush=True)
+
+
+def run(jobs, out_path: Path, base_settings, grid, concurrency: int, progress: Progress):
+    """Process jobs with at most `concurrency` analyses in flight, appending records"""
+    pending = iter(jobs)
+    in_flight = set()
+
+    with open(out_path, 'a') as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def write(finished):
+            for future in finished:
+                in_flight.discard(future)
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                progress.add(record)
+            out.flush()
+
+        try:
+            while True:
+                # Keep the window full without queueing every job up front
+                while len(in_flight) < concurrency:
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    in_flight.add(executor.submit(process_image, job, base_settings, grid))
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, timeout=progress.interval, return_when=FIRST_COMPLETED)
+                write(finished)
+                progress.maybe_report()
+        except KeyboardInterrupt:
+            # Drop the jobs not yet started. The running analyses are paid for
+            # and the executor waits for them anyway, so keep their records.
+            executor.shutdown(wait=False, cancel_futures=True)
+            running = [future for future in in_flight if not future.cancelled()]
+            print(f"\nInterrupted; writing the {len(running)} analyses in flight", file=sys.stderr, flush=True)
+            write(as_completed(running))
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze product images and generate UGC prompts in bulk")
+    parser.add_argument('source', help="folder of product images or a JSONL manifest")
+    parser.add_argument('--out', required=True, help="JSONL output file, also used to resume")
+    parser.add_argument('--settings', help="base generate settings as JSON or a JSON file")
+    parser.add_argument('--grid', help='setting grid as JSON or a JSON file, e.g. {"hook_type": ["fomo"]}')
+    parser.add_argument('--concurrency', type=int, default=8, help="analyses in flight (default 8)")
+    parser.add_argument('--progress-interval', type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    out_path = Path(args.out)
+    if not source.exists():
+        print(f"[ERROR] {source} does not exist")
+        sys.exit(1)
+
+    try:
+        base_settings = load_json_option(args.settings)
+        grid = load_json_option(args.grid)
+        jobs = discover_jobs(source)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    done = load_checkpoint(out_path)
+    remaining = [job for job in jobs if job['id'] not in done]
+    print(f"{len(jobs)} images found, {len(done)} already done, {len(remaining)} to process")
+    if not remaining:
+        return
+
+    progress = Progress(len(remaining), args.progress_interval)
+    try:
+        run(remaining, out_path, base_settings, grid, max(1, args.concurrency), progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted: {progress.line()}")
+        print("Rerun the same command to resume.")
+        sys.exit(130)
+
+    print(progress.line())
+    print(f"[OK] Results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings picked up automatically from the working directory.
+
+Puts the Prometheus client in multiprocess mode so /metrics reports the
+totals of every worker rather than whichever worker served the scrape (see
+metrics.py). PROMETHEUS_MULTIPROC_DIR defaults to a directory under the
+system temp dir; it is emptied when gunicorn starts, and the samples of
+workers that exit are folded into the totals.
+
+Analysis handles issued by one worker must be readable by the others, so
+ANALYSIS_STORE_DB defaults to a SQLite file under the system temp dir that
+every worker opens (see analysis_store.py).
+"""
+
+import os
+import shutil
+import tempfile
+
+multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "ugc-prompt-metrics")
+)
+os.environ.setdefault("ANALYSIS_STORE_DB", os.path.join(tempfile.gettempdir(), "ugc-analysis-handles.db"))
+
+# Imported once the directory is configured, and here rather than in the
+# hooks, which run from signal handlers
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this run's totals
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
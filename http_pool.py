@@ -0,0 +1,205 @@
+"""
+Shared keep-alive HTTP connection pools for OpenAI calls.
+
+Every OpenAI client in the app is built on one of these pools rather than a
+fresh httpx client, so TLS connections to the API are reused across vision
+calls and connection tests instead of paying a handshake each time. Pools
+are configured from the environment:
+
+    OPENAI_POOL_MAX_CONNECTIONS    total connections per pool (default 100)
+    OPENAI_POOL_MAX_KEEPALIVE      idle connections kept open (default 20)
+    OPENAI_POOL_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 30)
+    OPENAI_HTTP2                   "1" to negotiate HTTP/2 (needs the h2 package)
+    OPENAI_CONNECT_TIMEOUT         connect timeout in seconds (default 10)
+    OPENAI_READ_TIMEOUT            read timeout in seconds (default 120)
+    OPENAI_HTTP_PROXY / HTTPS_PROXY / HTTP_PROXY   optional proxy URL
+"""
+
+import logging
+import os
+import threading
+import httpx
+
+try:
+    import h2  # noqa: F401  optional, required for HTTP/2
+except ImportError:  # pragma: no cover
+    h2 = None
+
+
+class PoolConfig:
+    def __init__(self):
+        self.max_connections = int(os.environ.get("OPENAI_POOL_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.environ.get("OPENAI_POOL_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.environ.get("OPENAI_POOL_KEEPALIVE_EXPIRY", "30"))
+        self.http2 = os.environ.get("OPENAI_HTTP2", "0") == "1"
+        self.connect_timeout = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "10"))
+        self.read_timeout = float(os.environ.get("OPENAI_READ_TIMEOUT", "120"))
+        self.proxy = (
+            os.environ.get("OPENAI_HTTP_PROXY")
+            or os.environ.get("HTTPS_PROXY")
+            or os.environ.get("HTTP_PROXY")
+        )
+
+        if self.http2 and h2 is None:
+            logging.warning("OPENAI_HTTP2 is set but the h2 package is not installed; using HTTP/1.1.")
+            self.http2 = False
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.read_timeout,
+            connect=self.connect_timeout,
+            pool=self.connect_timeout,
+        )
+
+
+class PoolStats:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.connections_opened = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def trace(self, event_name: str, info: dict):
+        # httpcore emits this once per new TCP connection; reused ones skip it
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    def snapshot(self, transport) -> dict:
+        with self._lock:
+            stats = {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": max(0, self.requests - self.connections_opened),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "waiting": max(0, self.in_flight - self.max_connections),
+                "errors": self.errors,
+                "max_connections": self.max_connections,
+            }
+        connections = getattr(getattr(transport, "_pool", None), "connections", None)
+        if connections is not None:
+            stats["connections_open"] = len(connections)
+            stats["connections_idle"] = sum(1 for c in connections if c.is_idle())
+        return stats
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        request.extensions["trace"] = self.stats.trace
+        self.stats.started()
+        failed = True
+        try:
+            response = super().handle_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.finished(failed)
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        async def trace(event_name, info):
+            self.stats.trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.stats.started()
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self.stats.finished(failed)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(name: str, is_async: bool):
+    pool_key = (name, is_async)
+    with _pools_lock:
+        pool = _pools.get(pool_key)
+        if pool is not None:
+            return pool
+
+        config = PoolConfig()
+        stats = PoolStats(config.max_connections)
+        transport_class = _AsyncCountingTransport if is_async else _CountingTransport
+        transport = transport_class(
+            stats,
+            limits=config.limits,
+            http2=config.http2,
+            proxy=config.proxy or None,
+        )
+        client_class = httpx.AsyncClient if is_async else httpx.Client
+        client = client_class(transport=transport, timeout=config.timeout, follow_redirects=True)
+        pool = _pools[pool_key] = (client, transport, stats)
+        logging.info(
+            f"HTTP pool '{name}' ({'async' if is_async else 'sync'}) created: "
+            f"max_connections={config.max_connections}, http2={config.http2}, "
+            f"proxy={'yes' if config.proxy else 'no'}"
+        )
+        return pool
+
+
+def get_http_client(name: str = "openai") -> httpx.Client:
+    """Return the shared sync httpx client for a pool. Do not close it."""
+    return _get_pool(name, is_async=False)[0]
+
+
+def get_async_http_client(name: str = "openai") -> httpx.AsyncClient:
+    """Return the shared async httpx client for a pool. Do not close it."""
+    return _get_pool(name, is_async=True)[0]
+
+
+def pool_stats() -> dict:
+    """Return usage counters for every pool created so far."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {
+        f"{name}{'-async' if is_async else ''}": stats.snapshot(transport)
+        for (name, is_async), (_, transport, stats) in pools
+    }
+
+
+def close_pools():
+    """Close every sync pool; async pools are released with their event loop."""
+    with _pools_lock:
+        for (name, is_async), (client, _, _) in list(_pools.items()):
+            if not is_async:
+                client.close()
+                del _pools[(name, is_async)]
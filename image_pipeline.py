@@ -0,0 +1,167 @@
+"""
+Server-side image normalization before vision calls.
+
+Every analysis image is decoded, EXIF-oriented, downsampled to the
+resolution its analysis kind actually needs and re-encoded as JPEG. JPEGs
+are decoded in draft mode, so the decoder scales them down by a power of two
+while decoding and a 12 MP phone photo is never fully decompressed.
+
+An upright JPEG that is already small enough is not re-encoded; its
+metadata segments (EXIF with any GPS position, XMP, IPTC, comments) are cut
+out of the file instead, so they never reach OpenAI or the caches.
+"""
+
+import base64
+import binascii
+from io import SEEK_END, BytesIO
+from typing import BinaryIO
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Longest side, in pixels, sent to the vision model for each analysis kind
+TARGET_SIZES = {"product": 1024, "scene": 768, "actor": 512}
+JPEG_QUALITY = 85
+
+# Application segments kept when stripping metadata: JFIF (APP0), ICC color
+# profiles (APP2, when tagged ICC_PROFILE) and Adobe's color transform (APP14)
+_KEPT_APP_MARKERS = {0xE0, 0xE2, 0xEE}
+
+
+class ImageNormalizationError(ValueError):
+    """Raised when uploaded data cannot be decoded as an image."""
+
+
+def decode_base64_image(base64_image: str) -> bytes:
+    """Decode base64 image data, with or without a data URL prefix."""
+    if "base64," in base64_image:
+        base64_image = base64_image.split("base64,", 1)[1]
+    try:
+        return base64.b64decode(base64_image)
+    except (binascii.Error, ValueError) as e:
+        raise ImageNormalizationError(f"Invalid base64 image data: {e}") from e
+
+
+def normalize_image(image: bytes | BinaryIO, kind: str = "product") -> tuple[bytes, dict]:
+    """Normalize an encoded image for the given analysis kind.
+
+    image is the encoded bytes or a seekable binary file, such as a spooled
+    upload; a file is decoded in place rather than read into memory first.
+    Returns the JPEG bytes to send and a stats dict describing the sizes
+    before and after, including how many bytes were saved.
+    """
+    target = TARGET_SIZES.get(kind, TARGET_SIZES["product"])
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        source = BytesIO(image)
+        original_bytes = len(image)
+    else:
+        source = image
+        original_bytes = source.seek(0, SEEK_END)
+        source.seek(0)
+
+    try:
+        with Image.open(source) as img:
+            source_format = img.format
+            original_size = img.size
+            orientation = img.getexif().get(0x0112, 1)
+
+            # Already a right-sized, upright JPEG: re-encoding would only lose
+            # quality, so just drop its metadata
+            if (
+                source_format == "JPEG"
+                and orientation == 1
+                and max(original_size) <= target
+                and img.mode in ("RGB", "L")
+            ):
+                source.seek(0)
+                image_bytes = _strip_jpeg_metadata(source.read())
+                if image_bytes is not None:
+                    return image_bytes, _stats(original_bytes, image_bytes, original_size, original_size)
+
+            img.draft("RGB", (target, target))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((target, target), Image.Resampling.LANCZOS)
+            img = _to_rgb(img)
+
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+            normalized = buffer.getvalue()
+            normalized_size = img.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImageNormalizationError(f"Invalid image data: {e}") from e
+
+    return normalized, _stats(original_bytes, normalized, original_size, normalized_size)
+
+
+def _strip_jpeg_metadata(data: bytes) -> bytes | None:
+    """The JPEG without its metadata segments, or None if its structure is unexpected.
+
+    Everything after the end-of-image marker, such as the extra images of a
+    multi-picture file, is dropped too. The image data itself is copied
+    unchanged.
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    kept = [b"\xff\xd8"]
+    pos, end = 2, len(data)
+    while pos + 1 < end:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xD9:
+            kept.append(b"\xff\xd9")
+            return b"".join(kept)
+        if pos + 4 > end:
+            return None
+        segment_end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], "big")
+        if segment_end <= pos + 3 or segment_end > end:
+            return None
+
+        metadata = marker == 0xFE or (0xE0 <= marker <= 0xEF and marker not in _KEPT_APP_MARKERS)
+        if marker == 0xE2 and not data.startswith(b"ICC_PROFILE\0", pos + 4):
+            metadata = True
+        if not metadata:
+            kept.append(data[pos:segment_end])
+        pos = segment_end
+
+        if marker == 0xDA:
+            # Entropy-coded data runs to the next marker; 0xFF is followed by
+            # 0x00 when it is data and by RST0-RST7 at restart intervals
+            scan_end = pos
+            while True:
+                scan_end = data.find(b"\xff", scan_end)
+                if scan_end < 0 or scan_end + 1 >= end:
+                    return None
+                following = data[scan_end + 1]
+                if following == 0x00 or 0xD0 <= following <= 0xD7:
+                    scan_end += 2
+                    continue
+                break
+            kept.append(data[pos:scan_end])
+            pos = scan_end
+    return None
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """Convert to RGB, flattening transparency onto white rather than black."""
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _stats(original_bytes: int, normalized: bytes, original_size, normalized_size) -> dict:
+    return {
+        "original_bytes": original_bytes,
+        "normalized_bytes": len(normalized),
+        "bytes_saved": original_bytes - len(normalized),
+        "original_size": list(original_size),
+        "normalized_size": list(normalized_size),
+    }
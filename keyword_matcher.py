@@ -0,0 +1,106 @@
+"""
+Single-pass keyword matching for product descriptions.
+
+The description helpers used to lowercase the text again and run a separate
+substring scan for every color, material and brand word, which also matched
+inside other words ("tan" in "important", "text" in "textured"). A
+KeywordMatcher compiles every keyword of every category into one regex with
+word boundaries, shaped as a character trie and built once at import. scan()
+walks the text a single time and records every hit with its position.
+
+Keywords match whole words, optionally followed by a plural "s" or "es", so
+"sneaker" also matches "Sneakers" but not "sneakerhead".
+"""
+
+import re
+
+
+class KeywordHits:
+    """The keywords found in one text, with their positions."""
+
+    __slots__ = ("_matcher", "positions")
+
+    def __init__(self, matcher, positions: dict):
+        self._matcher = matcher
+        # keyword -> [start offsets], in text order
+        self.positions = positions
+
+    def __contains__(self, keyword: str) -> bool:
+        return keyword in self.positions
+
+    def __bool__(self) -> bool:
+        return bool(self.positions)
+
+    def any(self, *keywords: str) -> bool:
+        """True if any of the keywords occurs in the text"""
+        return any(keyword in self.positions for keyword in keywords)
+
+    def first(self, category: str) -> str | None:
+        """The category's highest-priority keyword that occurs in the text.
+
+        Priority is the order the category's keywords were given in, not the
+        order they appear in the text, matching a loop over the category's
+        table that stops at the first hit.
+        """
+        for keyword in self._matcher.categories[category]:
+            if keyword in self.positions:
+                return keyword
+        return None
+
+    def in_category(self, category: str) -> list:
+        """[(start, keyword)] for every hit of the category, in text order"""
+        keywords = self._matcher.categories[category]
+        return sorted(
+            (start, keyword)
+            for keyword in keywords if keyword in self.positions
+            for start in self.positions[keyword]
+        )
+
+
+def _trie_pattern(keywords) -> str:
+    """A regex alternation of keywords shaped as a character trie.
+
+    Shared prefixes are matched once ("gr(?:ay|ey)" rather than
+    "gray|grey"), so the regex engine tries one branch per character
+    instead of every keyword at every position.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A keyword ends here but longer ones continue
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, categories: dict, plurals: bool = True):
+        """categories maps a category name to its keywords in priority order.
+
+        A keyword may belong to several categories; it is matched once.
+        """
+        self.categories = {name: tuple(keyword.lower() for keyword in keywords)
+                           for name, keywords in categories.items()}
+        keywords = {keyword for keywords in self.categories.values() for keyword in keywords}
+        suffix = r"(?:e?s)?" if plurals else ""
+        self._pattern = re.compile(rf"\b({_trie_pattern(keywords)}){suffix}\b")
+
+    def scan(self, text: str) -> KeywordHits:
+        """Find every keyword in text with a single pass.
+
+        Matching is case-insensitive; positions are offsets into text.lower(),
+        which are the offsets into text for anything but exotic Unicode.
+        """
+        positions = {}
+        for match in self._pattern.finditer(text.lower()):
+            positions.setdefault(match.group(1), []).append(match.start())
+        return KeywordHits(self, positions)
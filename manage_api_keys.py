@@ -71,20 +71,9 @@ def test_openai_connection(manager: SecureAPIKeyManager):
         print("Testing OpenAI connection...")
 
         from openai import OpenAI
-        try:
-            import httpx  # optional for proxy support
-        except Exception:
-            httpx = None
-
-        proxy = (
-            os.environ.get("OPENAI_HTTP_PROXY")
-            or os.environ.get("HTTPS_PROXY")
-            or os.environ.get("HTTP_PROXY")
-        )
-        if proxy and httpx is not None:
-            client = OpenAI(api_key=api_key, http_client=httpx.Client(proxies=proxy))
-        else:
-            client = OpenAI(api_key=api_key)
+        from http_pool import get_http_client
+
+        client = OpenAI(api_key=api_key, http_client=get_http_client())
 
         # Simple test request
         response = client.chat.completions.create(
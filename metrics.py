@@ -0,0 +1,119 @@
+"""
+Prometheus metrics for the HTTP routes and the OpenAI calls behind them.
+
+Every route records its latency and request/response sizes. Every OpenAI
+call records its latency (excluding the scheduler's queue wait, which is
+recorded separately), request payload size, prompt and completion tokens,
+retries and outcome. The analysis pipeline records how long each phase of
+an analysis takes (base64 decode, image normalization, cache lookup,
+parsing the model's reply) and whether the caches answered it. /metrics
+serves all of it in the Prometheus text format.
+
+Under gunicorn every worker keeps its own metrics. Set
+PROMETHEUS_MULTIPROC_DIR to an empty directory before the workers start
+(gunicorn.conf.py does this) and each worker writes its samples there, and
+/metrics in any worker reports the totals across all of them.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PHASE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTE_BUCKETS = tuple(256 * 4 ** i for i in range(9))  # 256 B to 16 MB
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ugc_http_request_duration_seconds", "Time to produce a response, until the headers for streams",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_BYTES = Histogram(
+    "ugc_http_request_bytes", "Request body size", ["route"], buckets=BYTE_BUCKETS,
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "ugc_http_response_bytes", "Response body size, for responses with a known length",
+    ["route"], buckets=BYTE_BUCKETS,
+)
+UPLOAD_READ_SECONDS = Histogram(
+    "ugc_upload_read_seconds", "Time to read an uploaded image out of the request body",
+    ["source"], buckets=PHASE_BUCKETS,
+)
+
+ANALYSIS_PHASE_SECONDS = Histogram(
+    "ugc_analysis_phase_seconds", "Time spent in each phase of an image analysis",
+    ["kind", "phase"], buckets=PHASE_BUCKETS,
+)
+ANALYSIS_ESCALATIONS = Counter(
+    "ugc_analysis_escalations", "Analyses retried on the escalation model, by why the first reply was rejected",
+    ["kind", "reason"],
+)
+ANALYSIS_CACHE_RESULTS = Counter(
+    "ugc_analysis_cache_results", "Analysis cache lookups by result (hit, near_duplicate or miss)",
+    ["kind", "result"],
+)
+
+OPENAI_REQUEST_SECONDS = Histogram(
+    "ugc_openai_request_duration_seconds",
+    "OpenAI call latency including retries, excluding queue wait; to the end of the stream for streams",
+    ["operation", "model", "stream", "outcome"], buckets=LATENCY_BUCKETS,
+)
+OPENAI_QUEUE_SECONDS = Histogram(
+    "ugc_openai_queue_wait_seconds", "Time an OpenAI call waited for the rate limiter and a free slot",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+OPENAI_REQUEST_BYTES = Histogram(
+    "ugc_openai_request_bytes", "Size of the prompt text and images sent per OpenAI call",
+    ["operation"], buckets=BYTE_BUCKETS,
+)
+OPENAI_TOKENS = Histogram(
+    "ugc_openai_tokens", "Tokens per OpenAI call from response.usage", ["operation", "model", "type"],
+    buckets=TOKEN_BUCKETS,
+)
+OPENAI_RETRIES = Counter(
+    "ugc_openai_retries", "OpenAI attempts retried after a transient error", ["operation"],
+)
+
+
+def observe_http_request(route: str, method: str, status: int, seconds: float,
+                         request_bytes: int | None, response_bytes: int | None) -> None:
+    HTTP_REQUEST_SECONDS.labels(route, method, str(status)).observe(seconds)
+    if request_bytes:
+        HTTP_REQUEST_BYTES.labels(route).observe(request_bytes)
+    if response_bytes is not None:
+        HTTP_RESPONSE_BYTES.labels(route).observe(response_bytes)
+
+
+def observe_openai_call(operation: str, model: str, stream: bool, request_bytes: int, seconds: float,
+                        stats: dict, outcome: str, usage=None) -> None:
+    """Record one OpenAI call.
+
+    seconds runs from before the scheduler was entered; stats is the dict the
+    scheduler filled with queue_wait_ms and retries. outcome is "ok",
+    "error" or "overloaded".
+    """
+    queue_wait = stats.get("queue_wait_ms", 0) / 1000
+    OPENAI_QUEUE_SECONDS.labels(operation).observe(queue_wait)
+    OPENAI_REQUEST_SECONDS.labels(operation, model, "true" if stream else "false", outcome).observe(
+        max(0.0, seconds - queue_wait)
+    )
+    OPENAI_REQUEST_BYTES.labels(operation).observe(request_bytes)
+    if stats.get("retries"):
+        OPENAI_RETRIES.labels(operation).inc(stats["retries"])
+    if usage is not None:
+        if usage.prompt_tokens is not None:
+            OPENAI_TOKENS.labels(operation, model, "prompt").observe(usage.prompt_tokens)
+        if usage.completion_tokens is not None:
+            OPENAI_TOKENS.labels(operation, model, "completion").observe(usage.completion_tokens)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The current metrics as (body, content type), summed across workers in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+OpenAI Batch API mode for non-urgent product analysis.
+
+Overnight catalog refreshes do not need real-time latency. This packages
+product analyses into Batch API input files (at half the synchronous
+price, and outside the real-time rate limits), submits them, polls for
+completion and merges the results into the analysis cache and a JSONL
+output file.
+
+    python openai_batch.py submit products/ --job refresh.json --out analyses.jsonl
+    python openai_batch.py status --job refresh.json
+    python openai_batch.py collect --job refresh.json --wait
+
+Requests are built with build_analysis_request, exactly as the synchronous
+path builds them, and replies are parsed and cached the same way, so later
+/analyze calls and bulk_pipeline.py runs are served from the cache. Use
+ANALYSIS_CACHE_DIR for the cache to outlive this process. Images already
+in the cache are written to the output at submit time and never sent.
+
+Batch mode does not escalate to ANALYSIS_ESCALATION_MODEL. A reply the
+synchronous path would retry there is written to the output as an error
+and not cached, so the next synchronous analysis of that image escalates.
+
+The job file records every submitted batch and which images each request
+covers, so collect can run from a different process, hours later.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import openai
+from bulk_pipeline import discover_jobs
+from image_pipeline import ImageNormalizationError
+from openai_service import (
+    ANALYSIS_MODELS, ANALYSIS_PROMPT_VERSIONS, analysis_request_for, escalation_reason, finish_analysis,
+    get_openai_client, prepare_analysis,
+)
+from usage_ledger import BATCH_PRICE_FACTOR, tag_request, usage_ledger
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Batch API limits per input file, with headroom on the byte limit
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_client():
+    """The shared OpenAI client with SDK retries back on for the file and batch calls"""
+    client = get_openai_client()
+    if client is None:
+        raise RuntimeError("OpenAI API key not configured")
+    return client.with_options(max_retries=3)
+
+
+def load_job(path: Path) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_job(path: Path, job: dict):
+    """Write the job file atomically so an interrupted save never corrupts it"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_records(out_path: Path, records):
+    with open(out_path, 'a') as out:
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+
+
+class BatchFileWriter:
+    """Spool request lines into temp files that stay under the Batch API limits"""
+
+    def __init__(self):
+        self.files = []  # [(temp file, {custom_id: request entry})]
+        self._current = None
+        self._size = 0
+
+    def add(self, custom_id: str, body: dict, entry: dict):
+        line = json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": body,
+        }).encode('utf-8') + b'\n'
+
+        if (self._current is None or len(self._current[1]) >= MAX_BATCH_REQUESTS
+                or self._size + len(line) > MAX_BATCH_FILE_BYTES):
+            self._current = (tempfile.TemporaryFile(), {})
+            self._size = 0
+            self.files.append(self._current)
+
+        self._current[0].write(line)
+        self._current[1][custom_id] = entry
+        self._size += len(line)
+
+
+def prepare_batch_files(jobs, kind: str):
+    """Normalize every image and spool a request per distinct cache miss.
+
+    Returns (writer, records): records are finished output records for
+    cache hits and unreadable images. Images that normalize to the same
+    bytes share one request.
+    """
+    writer = BatchFileWriter()
+    entries = {}
+    records = []
+
+    for job in jobs:
+        item = {'id': job['id'], 'image': job['image']}
+        tag_request('openai_batch', request_id=job['id'])
+        try:
+            with open(job['image'], 'rb') as f:
+                state, cached = prepare_analysis(kind, f)
+        except (OSError, ImageNormalizationError) as e:
+            records.append({**item, 'error': str(e)})
+            continue
+
+        if cached is not None:
+            records.append({**item, 'analysis': cached, 'meta': state['meta']})
+            continue
+
+        entry = entries.get(state['cache_key'])
+        if entry is None:
+            entry = entries[state['cache_key']] = {
+                'cache_key': state['cache_key'],
+                'image_hash': state['image_hash'],
+                'image_colors': state['image_colors'],
+                'normalization': state['meta']['normalization'],
+                'items': [],
+            }
+            writer.add(f"{kind}-{len(entries)}", analysis_request_for(state), entry)
+        entry['items'].append(item)
+
+    return writer, records
+
+
+def submit(jobs, job_path: Path, out_path: Path, kind: str = 'product') -> dict:
+    """Upload and create batches for every image not already in the cache"""
+    job = {
+        'kind': kind,
+        'model': ANALYSIS_MODELS[kind],
+        'prompt_version': ANALYSIS_PROMPT_VERSIONS[kind],
+        'out': str(out_path),
+        'submitted_at': int(time.time()),
+        'batches': [],
+    }
+    writer, records = prepare_batch_files(jobs, kind)
+    write_records(out_path, records)
+    print(f"{len(records)} images answered from the cache or unreadable; "
+          f"{sum(len(requests) for _, requests in writer.files)} requests to submit")
+
+    client = batch_client()
+    for temp_file, requests in writer.files:
+        temp_file.seek(0)
+        uploaded = client.files.create(file=('analysis_batch.jsonl', temp_file.read()), purpose='batch')
+        temp_file.close()
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata={'kind': kind, 'prompt_version': job['prompt_version']},
+        )
+        job['batches'].append({
+            'id': batch.id,
+            'input_file_id': uploaded.id,
+            'status': batch.status,
+            'collected': False,
+            'requests': requests,
+        })
+        # Saved after every batch so a failure part-way still records what was submitted
+        save_job(job_path, job)
+        print(f"[OK] Submitted {batch.id} with {len(requests)} requests")
+
+    save_job(job_path, job)
+    return job
+
+
+def _read_result_lines(client, file_id):
+    if not file_id:
+        return {}
+    text = client.files.content(file_id).text
+    results = {}
+    for line in text.splitlines():
+        if line.strip():
+            result = json.loads(line)
+            results[result['custom_id']] = result
+    return results
+
+
+def _merge_result(job: dict, batch_state: dict, entry: dict, result: dict | None):
+    """Turn one batch result line into (analysis, meta), caching successes"""
+    meta = {'cache': 'miss', 'normalization': entry['normalization'], 'batch_id': batch_state['id'],
+            'model': job['model'], 'tier': 'primary'}
+    error = None
+
+    if result is None:
+        error = f"No result returned (batch {batch_state['status']})"
+    elif result.get('error'):
+        error = result['error'].get('message') or str(result['error'])
+    elif result['response']['status_code'] != 200:
+        body = result['response'].get('body') or {}
+        error = (body.get('error') or {}).get('message') or f"HTTP {result['response']['status_code']}"
+
+    if error is None:
+        body = result['response']['body']
+        usage = body.get('usage')
+        usage_ledger.record(job['kind'], job['model'], cache='miss', usage=usage,
+                            price_factor=BATCH_PRICE_FACTOR)
+        if usage:
+            meta['usage'] = {
+                'prompt_tokens': usage.get('prompt_tokens'),
+                'completion_tokens': usage.get('completion_tokens'),
+                'total_tokens': usage.get('total_tokens'),
+            }
+        state = {
+            'kind': job['kind'],
+            'model': job['model'],
+            'cache_key': entry['cache_key'],
+            # Jobs submitted before color signatures were recorded are not indexed
+            'image_hash': entry['image_hash'] if entry.get('image_colors') else None,
+            'image_colors': entry.get('image_colors'),
+            'meta': meta,
+        }
+        content = body['choices'][0]['message']['content']
+        reason = escalation_reason(state, content)
+        if reason:
+            # Not cached, so the next synchronous analysis of the image escalates
+            error = (f"Reply from {job['model']} rejected ({reason}); batch mode does not escalate, "
+                     f"so analyse the image again with /analyze or bulk_pipeline.py")
+        else:
+            try:
+                return finish_analysis(state, content), meta
+            except Exception as e:
+                error = f"Could not parse analysis: {e}"
+
+    logging.error(f"Batch analysis failed for {entry['cache_key']}: {error}")
+    meta['error'] = error
+    return {}, meta
+
+
+def collect(job_path: Path) -> bool:
+    """Merge every finished, uncollected batch; returns True once all are collected"""
+    job = load_job(job_path)
+    client = batch_client()
+    out_path = Path(job['out'])
+
+    for batch_state in job['batches']:
+        if batch_state['collected']:
+            continue
+
+        batch = client.batches.retrieve(batch_state['id'])
+        batch_state['status'] = batch.status
+        if batch.status not in TERMINAL_STATUSES:
+            continue
+
+        tag_request('openai_batch', request_id=batch_state['id'])
+        results = _read_result_lines(client, batch.output_file_id)
+        results.update(_read_result_lines(client, batch.error_file_id))
+
+        records = []
+        for custom_id, entry in batch_state['requests'].items():
+            analysis, meta = _merge_result(job, batch_state, entry, results.get(custom_id))
+            for item in entry['items']:
+                record = {**item, 'analysis': analysis, 'meta': meta}
+                if meta.get('error') or not analysis:
+                    record['error'] = meta.get('error', 'Product analysis returned no result')
+                records.append(record)
+
+        write_records(out_path, records)
+        batch_state['collected'] = True
+        save_job(job_path, job)
+        print(f"[OK] Collected {batch.id} ({batch.status}): {len(records)} records")
+
+    save_job(job_path, job)
+    return all(batch_state['collected'] for batch_state in job['batches'])
+
+
+def status(job_path: Path):
+    job = load_job(job_path)
+    client = batch_client()
+    for batch_state in job['batches']:
+        if batch_state['collected']:
+            print(f"{batch_state['id']}: collected")
+            continue
+        batch = client.batches.retrieve(batch_state['id'])
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+        print(f"{batch.id}: {batch.status}{progress}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run product analyses through the OpenAI Batch API")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = commands.add_parser('submit', help="package and submit images")
+    submit_parser.add_argument('source', help="folder of product images or a JSONL manifest")
+    submit_parser.add_argument('--job', required=True, help="job file to create")
+    submit_parser.add_argument('--out', required=True, help="JSONL file analyses are appended to")
+
+    status_parser = commands.add_parser('status', help="show batch progress")
+    status_parser.add_argument('--job', required=True)
+
+    collect_parser = commands.add_parser('collect', help="merge finished batches into the cache and output")
+    collect_parser.add_argument('--job', required=True)
+    collect_parser.add_argument('--wait', action='store_true', help="poll until every batch is collected")
+    collect_parser.add_argument('--poll-interval', type=float, default=60.0, help="seconds between polls")
+
+    args = parser.parse_args()
+    job_path = Path(args.job)
+
+    try:
+        if args.command == 'submit':
+            if job_path.exists():
+                print(f"[ERROR] {job_path} already exists; collect it or choose another --job")
+                sys.exit(1)
+            jobs = discover_jobs(Path(args.source))
+            submit(jobs, job_path, Path(args.out))
+        elif args.command == 'status':
+            status(job_path)
+        else:
+            while not collect(job_path):
+                if not args.wait:
+                    print("Some batches are still running; collect again later or pass --wait")
+                    break
+                time.sleep(args.poll_interval)
+            else:
+                print("[OK] All batches collected")
+    except (OSError, ValueError, RuntimeError, openai.OpenAIError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Admission control, rate limiting and retries for OpenAI requests.
+
+Every vision call is admitted through a RequestScheduler before it is sent:
+
+- a bounded in-flight limit caps concurrent requests per process,
+- token buckets sized to the organisation's requests-per-minute and
+  tokens-per-minute limits pace requests instead of letting a burst hit 429s,
+- 429, 5xx, timeout and connection errors are retried with jittered
+  exponential backoff that honours the server's Retry-After header.
+
+Each call has a single deadline, max_queue_wait seconds after it was
+queued, for the slot, the rate limits, every attempt and the backoffs
+between them. A call that would wait past it is rejected with
+SchedulerOverloaded rather than queueing indefinitely, which keeps calls
+inside gunicorn's 30 second worker timeout. Streamed
+responses keep their in-flight slot until the stream is exhausted or
+closed, not just until the response headers arrive. Limits come from
+OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, OPENAI_MAX_IN_FLIGHT, OPENAI_MAX_RETRIES
+and OPENAI_MAX_QUEUE_WAIT.
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+import openai
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request cannot be admitted within max_queue_wait."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, max_wait: float) -> float:
+        """Reserve tokens and return how long to wait before using them.
+
+        Reservations may drive the bucket negative, which queues callers in
+        arrival order. Raises SchedulerOverloaded if the wait exceeds max_wait.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise SchedulerOverloaded(f"rate limit queue is {wait:.1f}s deep")
+            self.tokens -= amount
+            return wait
+
+    def refund(self, amount: float) -> None:
+        """Return tokens that were reserved but not used."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _SlotRelease:
+    """Releases an in-flight slot once, however many times it is called"""
+
+    def __init__(self, release):
+        self._release = release
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __call__(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+
+class HeldStream:
+    """A streamed response that holds its in-flight slot until it is exhausted or closed.
+
+    The slot is also released if the stream is garbage collected unread.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = _SlotRelease(release)
+        weakref.finalize(self, self._release)
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self._release()
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class AsyncHeldStream(HeldStream):
+    """Async variant of HeldStream"""
+
+    def __iter__(self):
+        raise TypeError("AsyncHeldStream is iterated with async for")
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> float | None:
+    """Seconds the server asked us to wait, from retry-after-ms or retry-after."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+    return None
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        rpm_limit: float = 500,
+        tpm_limit: float = 30000,
+        max_in_flight: int = 32,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        max_queue_wait: float = 25.0,
+    ):
+        self.requests = TokenBucket(rpm_limit)
+        self.tokens = TokenBucket(tpm_limit)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue_wait = max_queue_wait
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # One semaphore per event loop, dropped along with the loop
+        self._async_slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """Build a scheduler configured from OPENAI_* environment variables."""
+        return cls(
+            rpm_limit=float(os.environ.get("OPENAI_RPM_LIMIT", "500")),
+            tpm_limit=float(os.environ.get("OPENAI_TPM_LIMIT", "30000")),
+            max_in_flight=int(os.environ.get("OPENAI_MAX_IN_FLIGHT", "32")),
+            max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", "4")),
+            max_queue_wait=float(os.environ.get("OPENAI_MAX_QUEUE_WAIT", "25")),
+        )
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _admit(self, estimated_tokens: int, deadline: float) -> float:
+        budget = deadline - time.monotonic()
+        wait = self.requests.reserve(1, budget)
+        try:
+            wait = max(wait, self.tokens.reserve(estimated_tokens, budget))
+        except SchedulerOverloaded:
+            self.requests.refund(1)
+            raise
+        return wait
+
+    def _retry_delay(self, attempt: int, error: Exception, deadline: float) -> float:
+        """The backoff before retrying error, or SchedulerOverloaded if it would end past deadline."""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            raise error
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= deadline:
+            raise SchedulerOverloaded(
+                f"OpenAI request failed ({error}) and a retry would overrun the {self.max_queue_wait:g}s deadline"
+            ) from error
+        logging.warning(f"OpenAI request failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _settle(self, response, estimated_tokens: int) -> None:
+        """Give back the part of the token estimate the response did not use."""
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens is not None:
+            self.tokens.refund(max(0, estimated_tokens - usage.total_tokens))
+
+    def call(self, send, estimated_tokens: int, stats: dict | None = None, stream: bool = False):
+        """Run send() under admission control and return its response.
+
+        If given, stats is updated with queue_wait_ms and retries, also when
+        the request ultimately fails. With stream, send() returns a stream,
+        which comes back as a HeldStream keeping the in-flight slot until
+        it is exhausted or closed. Raises SchedulerOverloaded once a wait
+        or retry would pass the call's deadline.
+        """
+        stats = stats if stats is not None else {}
+        stats.update(queue_wait_ms=0, retries=0)
+        # queue_wait_ms covers the first admission; the deadline the whole call
+        queued_at = time.monotonic()
+        deadline = queued_at + self.max_queue_wait
+        if not self._slots.acquire(timeout=self.max_queue_wait):
+            raise SchedulerOverloaded(f"{self.max_in_flight} OpenAI requests already in flight")
+        held = False
+        try:
+            attempt = 0
+            while True:
+                wait = self._admit(estimated_tokens, deadline)
+                if wait:
+                    time.sleep(wait)
+                if attempt == 0:
+                    stats["queue_wait_ms"] = round((time.monotonic() - queued_at) * 1000)
+                try:
+                    response = send()
+                except Exception as e:
+                    # A failed attempt did not spend its token estimate
+                    self.tokens.refund(estimated_tokens)
+                    time.sleep(self._retry_delay(attempt, e, deadline))
+                    attempt += 1
+                    stats["retries"] = attempt
+                    continue
+                self._settle(response, estimated_tokens)
+                if stream:
+                    held = True
+                    return HeldStream(response, self._slots.release)
+                return response
+        finally:
+            if not held:
+                self._slots.release()
+
+    def _async_slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_slots.get(loop)
+        if semaphore is None:
+            # A semaphore that has had waiters references its loop, which
+            # keeps the weak key alive; closed loops are dropped here instead
+            for closed in [other for other in self._async_slots.keys() if other.is_closed()]:
+                del self._async_slots[closed]
+            semaphore = self._async_slots[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    async def acall(self, send, estimated_tokens: int, stats: dict | None = None, stream: bool = False):
+        """Async variant of call(); send() returns an awaitable, and streams come back as AsyncHeldStream."""
+        stats = stats if stats is not None else {}
+        stats.update(queue_wait_ms=0, retries=0)
+        queued_at = time.monotonic()
+        deadline = queued_at + self.max_queue_wait
+        try:
+            await asyncio.wait_for(self._async_slot().acquire(), self.max_queue_wait)
+        except asyncio.TimeoutError:
+            raise SchedulerOverloaded(f"{self.max_in_flight} OpenAI requests already in flight") from None
+        slot = self._async_slot()
+        held = False
+        try:
+            attempt = 0
+            while True:
+                wait = self._admit(estimated_tokens, deadline)
+                if wait:
+                    await asyncio.sleep(wait)
+                if attempt == 0:
+                    stats["queue_wait_ms"] = round((time.monotonic() - queued_at) * 1000)
+                try:
+                    response = await send()
+                except Exception as e:
+                    # A failed attempt did not spend its token estimate
+                    self.tokens.refund(estimated_tokens)
+                    await asyncio.sleep(self._retry_delay(attempt, e, deadline))
+                    attempt += 1
+                    stats["retries"] = attempt
+                    continue
+                self._settle(response, estimated_tokens)
+                if stream:
+                    held = True
+                    return AsyncHeldStream(response, slot.release)
+                return response
+        finally:
+            if not held:
+                slot.release()
+
+
+# Global instance
+scheduler = RequestScheduler.from_env()
@@ -1,12 +1,31 @@
+import asyncio
+import base64
+import contextvars
+import itertools
 import json
 import os
 import logging
-from openai import OpenAI
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI, OpenAI
 from secure_config import get_openai_api_key_optional
-try:
-    import httpx  # optional, used for proxy support with OpenAI v1
-except Exception:  # pragma: no cover
-    httpx = None
+from http_pool import get_async_http_client, get_http_client
+from analysis_cache import analysis_cache
+from perceptual_hash import NearDuplicateIndex, image_signature
+from image_pipeline import ImageNormalizationError, decode_base64_image, normalize_image
+from keyword_matcher import KeywordMatcher
+from metrics import ANALYSIS_CACHE_RESULTS, ANALYSIS_ESCALATIONS, ANALYSIS_PHASE_SECONDS, observe_openai_call
+from openai_scheduler import SchedulerOverloaded, scheduler
+from usage_ledger import usage_ledger
+from prompt_templates import (
+    ACTION_TEMPLATES, AUDIO_STYLES, CAMERA_STYLES, DEFAULT_ACTION_TEMPLATE, DEFAULT_AUDIO_STYLE,
+    DEFAULT_CAMERA_STYLE, DEFAULT_HOOK_TEMPLATE, DEFAULT_LIGHTING_DESCRIPTION, DEFAULT_SETTING_DESCRIPTION,
+    ENHANCEMENT_PROMPTS, ENHANCEMENT_TEMPLATES, HOOK_TEMPLATES, LIGHTING_DESCRIPTIONS, SETTING_DESCRIPTIONS,
+    CompiledFormat,
+)
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
@@ -14,6 +33,7 @@ except Exception:  # pragma: no cover
 # OpenAI client is created lazily to avoid failing on import if no key is present
 OPENAI_API_KEY = get_openai_api_key_optional()
 openai_client = None
+async_openai_client = None
 
 def get_openai_client():
     """Return a cached OpenAI client or initialize it if a key is available.
@@ -32,18 +52,9 @@ def get_openai_client():
         return None
 
     try:
-        # Optional proxy support via env: OPENAI_HTTP_PROXY, HTTPS_PROXY, HTTP_PROXY
-        proxy = (
-            os.environ.get("OPENAI_HTTP_PROXY")
-            or os.environ.get("HTTPS_PROXY")
-            or os.environ.get("HTTP_PROXY")
-        )
-
-        if proxy and httpx is not None:
-            http_client = httpx.Client(proxies=proxy)
-            openai_client = OpenAI(api_key=api_key, http_client=http_client)
-        else:
-            openai_client = OpenAI(api_key=api_key)
+        # Shared keep-alive pool; proxy, limits and timeouts come from http_pool.
+        # Retries are handled by openai_scheduler, not the SDK.
+        openai_client = OpenAI(api_key=api_key, http_client=get_http_client(), max_retries=0)
         logging.info("OpenAI client initialized successfully.")
     except Exception as e:
         logging.error(f"Failed to initialize OpenAI client: {e}")
@@ -51,149 +62,698 @@ def get_openai_client():
 
     return openai_client
 
-def analyze_scene_image(base64_image):
-    """Analyze scene/location image for technical description"""
-    client = get_openai_client()
-    if not client:
-        return {"scene_description": "OpenAI client not available. Cannot analyze image."}
+def get_async_openai_client():
+    """Return a cached AsyncOpenAI client for the ASGI app, or None without a key."""
+    global async_openai_client
+    if async_openai_client is not None:
+        return async_openai_client
+
+    api_key = OPENAI_API_KEY or get_openai_api_key_optional()
+    if not api_key:
+        logging.warning("OpenAI API key not configured; skipping async client initialization.")
+        return None
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a technical scene analyst for video production. "
-                    + "Analyze this location/room image and provide a detailed technical description "
-                    + "focused on lighting, spatial layout, surfaces, colors, and atmosphere. "
-                    + "This will be used for AI video generation, so be precise about visual elements. "
-                    + "Focus on: lighting quality and direction, wall colors and textures, floor materials, "
-                    + "furniture placement, room size/scale, ambient mood, and any distinctive features. "
-                    + "Write as a single paragraph technical description suitable for video generation prompts."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this scene/location image. Provide a technical description focusing on lighting, spatial elements, colors, textures, and overall atmosphere that would help recreate this environment in video generation."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
+        async_openai_client = AsyncOpenAI(
+            api_key=api_key, http_client=get_async_http_client(), max_retries=0
         )
+        logging.info("Async OpenAI client initialized successfully.")
+    except Exception as e:
+        logging.error(f"Failed to initialize async OpenAI client: {e}")
+        async_openai_client = None
+
+    return async_openai_client
+
+# Model per vision analysis kind. Scene and actor descriptions are plain text
+# the cheaper model writes well; product analyses default to the full model.
+ANALYSIS_MODELS = {
+    "product": os.environ.get("ANALYSIS_MODEL_PRODUCT", "gpt-4o"),
+    "scene": os.environ.get("ANALYSIS_MODEL_SCENE", "gpt-4o-mini"),
+    "actor": os.environ.get("ANALYSIS_MODEL_ACTOR", "gpt-4o-mini"),
+}
+# A reply that fails analysis_defect() is retried once on this model; set it
+# empty to serve every reply from the kind's own model
+ESCALATION_MODEL = os.environ.get("ANALYSIS_ESCALATION_MODEL", "gpt-4o") or None
+
+# Keys a product analysis must contain, and the shortest scene or actor
+# description accepted, before a reply counts as usable
+ANALYSIS_REQUIRED_KEYS = {"product": ("detailed_description", "product_name", "product_type")}
+MIN_DESCRIPTION_CHARS = 40
+
+# Bump the version for a kind whenever its prompt or response handling changes,
+# so results produced by the old prompt are no longer served from the cache.
+ANALYSIS_PROMPT_VERSIONS = {"product": "1", "scene": "1", "actor": "1"}
+
+_ANALYSIS_PROMPTS = {
+    "scene": {
+        "system": "You are a technical scene analyst for video production. "
+        + "Analyze this location/room image and provide a detailed technical description "
+        + "focused on lighting, spatial layout, surfaces, colors, and atmosphere. "
+        + "This will be used for AI video generation, so be precise about visual elements. "
+        + "Focus on: lighting quality and direction, wall colors and textures, floor materials, "
+        + "furniture placement, room size/scale, ambient mood, and any distinctive features. "
+        + "Write as a single paragraph technical description suitable for video generation prompts.",
+        "user": "Analyze this scene/location image. Provide a technical description focusing on lighting, spatial elements, colors, textures, and overall atmosphere that would help recreate this environment in video generation.",
+        "max_tokens": 500,
+    },
+    "actor": {
+        "system": "You are describing a person's physical appearance for a blind person. "
+        + "Describe only what you SEE in the image, as if for a blind person. Do NOT guess, do NOT infer, do NOT describe anything not visually obvious. "
+        + "No names unless printed. "
+        + "Focus on: hair (color, length, style), facial features (eye color if visible, facial hair, skin tone), "
+        + "posture, and any distinctive visual characteristics. "
+        + "Be precise and factual - only describe what is clearly visible of the person in the image.",
+        "user": "Describe exactly what you see in this image of a person. Focus only on visible physical characteristics, clothing, and posture. Do not guess  name, or make assumptions about anything not clearly visible.",
+        "max_tokens": 300,
+    },
+    "product": {
+        "system": "You are a precise product analyst creating descriptions for video generation. "
+        + "CRITICAL: Only describe what you actually see in the image. Do not add fictional elements or substitute products. "
+        + "Provide a focused, accurate description that captures the exact visual elements present. "
+        + "This description will be used for AI video generation, so accuracy is essential. "
+        + "Focus on: exact colors, visible text/branding, materials, shape, size, and positioning. "
+        + "Keep descriptions clear and specific - imagine describing this to someone who cannot see the image. "
+        + "Respond with JSON in this exact format: "
+        + "{'detailed_description': 'precise visual description (100-150 words)', "
+        + "'product_name': 'exact name if visible', 'product_type': 'category', 'key_features': ['feature1', 'feature2'], "
+        + "'target_audience': 'likely audience', 'use_cases': ['use1', 'use2'], 'visual_style': 'style', "
+        + "'suggested_setting': 'setting', 'emotional_appeal': 'appeal', "
+        + "'materials_textures': ['material1', 'material2'], 'color_palette': ['primary_color', 'secondary_color'], "
+        + "'lighting_style': 'lighting', 'composition_notes': 'composition'}",
+        "user": "Analyze this product image with precision. Describe ONLY what you can actually see - do not invent details or substitute different products. Focus on exact colors, visible text, materials, and physical characteristics. Be accurate and concise, as if describing to someone who cannot see the image.",
+        "max_tokens": 2000,
+        "response_format": {"type": "json_object"},
+    },
+}
+
+
+def build_analysis_request(kind, base64_image, model=None):
+    """Build the chat completion arguments for a vision analysis kind, on the kind's model by default"""
+    prompts = _ANALYSIS_PROMPTS[kind]
+    request = {
+        "model": model or ANALYSIS_MODELS[kind],
+        "messages": [
+            {"role": "system", "content": prompts["system"]},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompts["user"]},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+                    }
+                ]
+            }
+        ],
+        "max_tokens": prompts["max_tokens"]
+    }
+    if "response_format" in prompts:
+        request["response_format"] = prompts["response_format"]
+    return request
+
+
+def parse_analysis_content(kind, content):
+    """Turn the model's message content into the result dict for an analysis kind"""
+    if kind == "product":
+        return json.loads(content or '{}')
+    if kind == "scene":
+        return {"scene_description": content or 'Scene analysis failed'}
+    return {"actor_description": content or 'Actor analysis failed'}
+
+
+def analysis_defect(kind, content):
+    """Why a reply is unusable ("invalid_json", "missing_keys", "empty" or
+    "too_short"), or None if it is fine"""
+    if kind in ANALYSIS_REQUIRED_KEYS:
+        try:
+            result = json.loads(content or "")
+        except ValueError:
+            return "invalid_json"
+        if (not isinstance(result, dict) or not result.get("detailed_description")
+                or any(key not in result for key in ANALYSIS_REQUIRED_KEYS[kind])):
+            return "missing_keys"
+        return None
+    text = (content or "").strip()
+    if not text:
+        return "empty"
+    if len(text) < MIN_DESCRIPTION_CHARS:
+        return "too_short"
+    return None
+
+
+def _analysis_fallback(kind, error=None):
+    """Result returned when no client is configured or the OpenAI call fails"""
+    if kind == "product":
+        return {}
+    field = f"{kind}_description"
+    if error is None:
+        return {field: "OpenAI client not available. Cannot analyze image."}
+    return {field: f"Error during {kind} analysis: {error}"}
+
+
+# Analysis kinds that may reuse the result of a visually near-identical image
+NEAR_DUPLICATE_KINDS = {"product"}
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", "5"))
+NEAR_DUPLICATE_MAX_COLOR_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_MAX_COLOR_DISTANCE", "6"))
+
+# One index per (kind, prompt version, model) so a prompt bump never serves stale results
+_near_duplicate_indexes = {}
+
+
+def _near_duplicate_index(kind, model):
+    index_key = (kind, ANALYSIS_PROMPT_VERSIONS[kind], model)
+    index = _near_duplicate_indexes.get(index_key)
+    if index is None:
+        index = _near_duplicate_indexes.setdefault(
+            index_key, NearDuplicateIndex(max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+                                          max_color_distance=NEAR_DUPLICATE_MAX_COLOR_DISTANCE)
+        )
+    return index
 
-        description = response.choices[0].message.content or 'Scene analysis failed'
-        return {"scene_description": description}
 
+def _perceptual_hash(image_bytes):
+    """(dHash, color signature) of the image, or (None, None) if it cannot be computed"""
+    try:
+        return image_signature(image_bytes)
     except Exception as e:
-        logging.error(f"Failed to analyze scene image: {e}")
-        return {"scene_description": f"Error during scene analysis: {e}"}
+        logging.warning(f"Could not compute perceptual hash: {e}")
+        return None, None
 
 
-def analyze_actor_image(base64_image):
-    """Analyze actor image to generate detailed physical description"""
+def prepare_analysis(kind, image):
+    """Normalize the image and look it up in the caches.
+
+    image is base64 text (optionally a data URL), encoded bytes or a
+    seekable binary file such as a spooled upload.
+
+    Returns (state, cached_result); cached_result is None on a miss, in which
+    case state carries what finish_analysis needs after the OpenAI call.
+    """
+    model = ANALYSIS_MODELS[kind]
+    if isinstance(image, str):
+        with ANALYSIS_PHASE_SECONDS.labels(kind, "decode").time():
+            image = decode_base64_image(image)
+    with ANALYSIS_PHASE_SECONDS.labels(kind, "normalize").time():
+        image_bytes, normalization = normalize_image(image, kind)
+    state = {
+        "kind": kind,
+        "model": model,
+        "image_bytes": image_bytes,
+        "cache_key": analysis_cache.make_key(
+            image_bytes, kind, ANALYSIS_PROMPT_VERSIONS[kind], model
+        ),
+        "image_hash": None,
+        "image_colors": None,
+        "meta": {"cache": "hit", "normalization": normalization},
+    }
+    with ANALYSIS_PHASE_SECONDS.labels(kind, "cache_lookup").time():
+        cached = _cached_analysis(state)
+    ANALYSIS_CACHE_RESULTS.labels(kind, state["meta"]["cache"]).inc()
+    if cached is not None:
+        usage_ledger.record(kind, model, cache=state["meta"]["cache"], outcome="cached")
+    return state, cached
+
+
+def _cached_analysis(state):
+    """Look the normalized image up by exact and perceptual hash, setting meta["cache"]"""
+    cached = analysis_cache.get(state["cache_key"])
+    if cached is not None:
+        return cached
+
+    kind, model = state["kind"], state["model"]
+    if kind in NEAR_DUPLICATE_KINDS:
+        state["image_hash"], state["image_colors"] = _perceptual_hash(state["image_bytes"])
+    if state["image_hash"] is not None:
+        match = _near_duplicate_index(kind, model).find(state["image_hash"], state["image_colors"])
+        if match is not None:
+            cached = analysis_cache.get(match[0])
+            if cached is not None:
+                state["meta"].update(cache="near_duplicate", distance=match[1])
+                return cached
+
+    state["meta"]["cache"] = "miss"
+    return None
+
+
+def analysis_request_for(state, model=None):
+    """The chat request for a prepared analysis, on model or else the kind's model"""
+    image_base64 = base64.b64encode(state["image_bytes"]).decode("ascii")
+    return build_analysis_request(state["kind"], image_base64, model or state["model"])
+
+
+def _primary_request(state, stream=False):
+    """The first request of an analysis, on the kind's model"""
+    state["meta"].update(model=state["model"], tier="primary")
+    request = analysis_request_for(state)
+    return dict(request, stream=True, stream_options=STREAM_OPTIONS) if stream else request
+
+
+def escalation_reason(state, content):
+    """analysis_defect() of a reply, unless it already came from the top tier"""
+    if ESCALATION_MODEL is None or state["meta"].get("model") == ESCALATION_MODEL:
+        return None
+    return analysis_defect(state["kind"], content)
+
+
+def _escalated_request(state, reason, stream=False):
+    """The retry of a rejected reply on ESCALATION_MODEL; records the escalation in meta"""
+    logging.warning(
+        f"{state['kind']} analysis from {state['model']} rejected ({reason}); retrying on {ESCALATION_MODEL}"
+    )
+    ANALYSIS_ESCALATIONS.labels(state["kind"], reason).inc()
+    state["meta"].update(
+        model=ESCALATION_MODEL, tier="escalated", escalated_from=state["model"], escalation_reason=reason
+    )
+    request = analysis_request_for(state, ESCALATION_MODEL)
+    return dict(request, stream=True, stream_options=STREAM_OPTIONS) if stream else request
+
+
+# Tokens a normalized image costs at high detail: a 1024px image is scaled to
+# 768px, i.e. four 512px tiles at 170 tokens each plus an 85-token base
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+def _estimate_tokens(request):
+    """Rough upper bound on the tokens a chat request will consume, for rate limiting"""
+    tokens = request.get("max_tokens") or 0
+    for message in request["messages"]:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return tokens
+
+
+def _request_bytes(request):
+    """Bytes of prompt text and image data URLs in a chat request"""
+    size = 0
+    for message in request["messages"]:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                size += len(part["image_url"]["url"])
+            else:
+                size += len(part.get("text", ""))
+    return size
+
+
+def _observe_call(operation, request, started, stats, outcome, usage=None):
+    """Record an OpenAI call made through the scheduler in the metrics and the usage ledger"""
+    seconds = time.perf_counter() - started
+    stream = bool(request.get("stream"))
+    request_bytes = _request_bytes(request)
+    observe_openai_call(operation, request["model"], stream, request_bytes, seconds, stats, outcome, usage)
+    usage_ledger.record(
+        operation.removesuffix("_analysis"), request["model"], cache=stats.get("cache"), stream=stream,
+        outcome=outcome, usage=usage, max_tokens=request.get("max_tokens"), request_bytes=request_bytes,
+        latency_ms=round((seconds - stats.get("queue_wait_ms", 0) / 1000) * 1000),
+        retries=stats.get("retries", 0),
+    )
+
+
+def _call_failure(error):
+    return "overloaded" if isinstance(error, SchedulerOverloaded) else "error"
+
+
+def _call_openai(operation, client, request, stats):
+    """Send a chat request through the scheduler and record it in the metrics.
+
+    Returns (response, started). Streams are recorded by their consumer once
+    they end, using started; everything else is recorded here. A stream
+    holds its scheduler slot until the consumer exhausts or closes it.
+    """
+    started = time.perf_counter()
+    try:
+        response = scheduler.call(
+            lambda: client.chat.completions.create(**request), _estimate_tokens(request), stats=stats,
+            stream=bool(request.get("stream")),
+        )
+    except Exception as e:
+        _observe_call(operation, request, started, stats, _call_failure(e))
+        raise
+    if not request.get("stream"):
+        _observe_call(operation, request, started, stats, "ok", response.usage)
+    return response, started
+
+
+async def _acall_openai(operation, client, request, stats):
+    """Async variant of _call_openai"""
+    started = time.perf_counter()
+    try:
+        response = await scheduler.acall(
+            lambda: client.chat.completions.create(**request), _estimate_tokens(request), stats=stats,
+            stream=bool(request.get("stream")),
+        )
+    except Exception as e:
+        _observe_call(operation, request, started, stats, _call_failure(e))
+        raise
+    if not request.get("stream"):
+        _observe_call(operation, request, started, stats, "ok", response.usage)
+    return response, started
+
+
+def _failed_analysis(state, error):
+    """Log a failed OpenAI call and return the fallback outcome for its kind"""
+    logging.error(f"Failed to analyze {state['kind']} image: {error}")
+    state["meta"]["error"] = str(error)
+    return _analysis_fallback(state["kind"], error), state["meta"]
+
+
+# Asks for a final chunk carrying the token usage, which plain streams omit
+STREAM_OPTIONS = {"include_usage": True}
+
+
+def _stream_text(stream, received):
+    """Yield the text deltas of a streamed chat completion.
+
+    The usage reported by the final chunk is stored in received["usage"].
+    """
+    for chunk in stream:
+        if chunk.usage is not None:
+            received["usage"] = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _astream_text(stream, received):
+    async for chunk in stream:
+        if chunk.usage is not None:
+            received["usage"] = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _aiter_events(*events):
+    for event in events:
+        yield event
+
+
+def _record_usage(state, usage):
+    """Add a completion's token usage to the analysis meta, summed over escalations"""
+    if usage is not None:
+        totals = state["meta"].setdefault(
+            "usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        )
+        totals["prompt_tokens"] += usage.prompt_tokens or 0
+        totals["completion_tokens"] += usage.completion_tokens or 0
+        totals["total_tokens"] += usage.total_tokens or 0
+
+
+def finish_analysis(state, content):
+    """Parse the model's reply and cache it if the analysis succeeded"""
+    with ANALYSIS_PHASE_SECONDS.labels(state["kind"], "parse").time():
+        result = parse_analysis_content(state["kind"], content)
+
+    # Only successful analyses are cached; empty replies are retried next time
+    if content and result:
+        analysis_cache.set(state["cache_key"], result)
+        if state["image_hash"] is not None:
+            _near_duplicate_index(state["kind"], state["model"]).add(
+                state["image_hash"], state["image_colors"], state["cache_key"]
+            )
+    return result
+
+
+def run_image_analysis(kind, image):
+    """Run a vision analysis of the given kind ('product', 'scene' or 'actor').
+
+    image is base64 text (optionally a data URL), encoded bytes or a
+    seekable binary file. It is first normalized to the kind's target
+    resolution. Repeat uploads of the same image are served from the
+    analysis cache, and for NEAR_DUPLICATE_KINDS so are re-encoded or
+    resized copies of an image already analysed. Returns (result, meta) where meta["cache"] is "hit",
+    "near_duplicate" (with meta["distance"]) or "miss", and
+    meta["normalization"] reports the bytes saved by normalizing.
+
+    Raises ImageNormalizationError if the data is not a decodable image.
+    """
+    state, cached = prepare_analysis(kind, image)
+    if cached is not None:
+        return cached, state["meta"]
+
     client = get_openai_client()
     if not client:
-        return {"actor_description": "OpenAI client not available. Cannot analyze image."}
+        return _analysis_fallback(kind), state["meta"]
 
+    request = _primary_request(state)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are describing a person's physical appearance for a blind person. "
-                    + "Describe only what you SEE in the image, as if for a blind person. Do NOT guess, do NOT infer, do NOT describe anything not visually obvious. "
-                    + "No names unless printed. "
-                    + "Focus on: hair (color, length, style), facial features (eye color if visible, facial hair, skin tone), "
-                    + "posture, and any distinctive visual characteristics. "
-                    + "Be precise and factual - only describe what is clearly visible of the person in the image."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Describe exactly what you see in this image of a person. Focus only on visible physical characteristics, clothing, and posture. Do not guess  name, or make assumptions about anything not clearly visible."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=300
-        )
+        response, _ = _call_openai(f"{kind}_analysis", client, request, state["meta"])
+        _record_usage(state, response.usage)
+        content = response.choices[0].message.content
+        reason = escalation_reason(state, content)
+        if reason:
+            request = _escalated_request(state, reason)
+            response, _ = _call_openai(f"{kind}_analysis", client, request, state["meta"])
+            _record_usage(state, response.usage)
+            content = response.choices[0].message.content
+        result = finish_analysis(state, content)
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return _failed_analysis(state, e)
+
+    return result, state["meta"]
+
+
+async def arun_image_analysis(kind, image):
+    """Async variant of run_image_analysis used by the ASGI app.
 
-        description = response.choices[0].message.content or 'Actor analysis failed'
-        return {"actor_description": description}
+    Image normalization and caching of the result run in worker threads and
+    the OpenAI call awaits the network, so one event loop can hold many
+    analyses in flight.
+    """
+    state, cached = await asyncio.to_thread(prepare_analysis, kind, image)
+    if cached is not None:
+        return cached, state["meta"]
+
+    client = get_async_openai_client()
+    if not client:
+        return _analysis_fallback(kind), state["meta"]
 
+    request = _primary_request(state)
+    try:
+        response, _ = await _acall_openai(f"{kind}_analysis", client, request, state["meta"])
+        _record_usage(state, response.usage)
+        content = response.choices[0].message.content
+        reason = escalation_reason(state, content)
+        if reason:
+            request = _escalated_request(state, reason)
+            response, _ = await _acall_openai(f"{kind}_analysis", client, request, state["meta"])
+            _record_usage(state, response.usage)
+            content = response.choices[0].message.content
+        # Parsing, the disk cache write and the near-duplicate index update
+        # block, so they run off the event loop
+        result = await asyncio.to_thread(finish_analysis, state, content)
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
-        logging.error(f"Failed to analyze actor image: {e}")
-        return {"actor_description": f"Error during actor analysis: {e}"}
+        return _failed_analysis(state, e)
 
+    return result, state["meta"]
+
+
+def stream_image_analysis(kind, image):
+    """Streaming variant of run_image_analysis.
+
+    Normalization and admission happen before this returns, so
+    ImageNormalizationError and SchedulerOverloaded are raised up front.
+    Returns an iterator of ("delta", text) events as the model writes,
+    ending with a single ("result", (result, meta)) event. Cached results
+    produce only the result event.
+    """
+    state, cached = prepare_analysis(kind, image)
+    if cached is not None:
+        return iter([("result", (cached, state["meta"]))])
 
-def analyze_product_image(base64_image):
-    """Provide detailed analysis and description of product image"""
     client = get_openai_client()
     if not client:
-        return {} # Return empty dict if client not available
+        return iter([("result", (_analysis_fallback(kind), state["meta"]))])
 
+    request = _primary_request(state, stream=True)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a precise product analyst creating descriptions for video generation. "
-                    + "CRITICAL: Only describe what you actually see in the image. Do not add fictional elements or substitute products. "
-                    + "Provide a focused, accurate description that captures the exact visual elements present. "
-                    + "This description will be used for AI video generation, so accuracy is essential. "
-                    + "Focus on: exact colors, visible text/branding, materials, shape, size, and positioning. "
-                    + "Keep descriptions clear and specific - imagine describing this to someone who cannot see the image. "
-                    + "Respond with JSON in this exact format: "
-                    + "{'detailed_description': 'precise visual description (100-150 words)', "
-                    + "'product_name': 'exact name if visible', 'product_type': 'category', 'key_features': ['feature1', 'feature2'], "
-                    + "'target_audience': 'likely audience', 'use_cases': ['use1', 'use2'], 'visual_style': 'style', "
-                    + "'suggested_setting': 'setting', 'emotional_appeal': 'appeal', "
-                    + "'materials_textures': ['material1', 'material2'], 'color_palette': ['primary_color', 'secondary_color'], "
-                    + "'lighting_style': 'lighting', 'composition_notes': 'composition'}"
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Analyze this product image with precision. Describe ONLY what you can actually see - do not invent details or substitute different products. Focus on exact colors, visible text, materials, and physical characteristics. Be accurate and concise, as if describing to someone who cannot see the image."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=2000
-        )
+        stream, started = _call_openai(f"{kind}_analysis", client, request, state["meta"])
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return iter([("result", _failed_analysis(state, e))])
 
-        result = json.loads(response.choices[0].message.content or '{}')
-        return result
+    return _relay_analysis(state, client, stream, request, started)
+
+
+def _relay_analysis(state, client, stream, request, started):
+    """Relay a streamed analysis, escalating a rejected reply.
+
+    An escalation emits a ("reset", reason) event, after which the deltas
+    start over with the escalated model's reply.
+    """
+    content = []
+    try:
+        yield from _relay_stream(state, stream, request, started, content)
+        reason = escalation_reason(state, "".join(content))
+        if reason:
+            yield "reset", reason
+            request = _escalated_request(state, reason, stream=True)
+            stream, started = _call_openai(f"{state['kind']}_analysis", client, request, state["meta"])
+            content = []
+            yield from _relay_stream(state, stream, request, started, content)
+        outcome = finish_analysis(state, "".join(content)), state["meta"]
+    except Exception as e:
+        outcome = _failed_analysis(state, e)
+    yield "result", outcome
+
+
+def _relay_stream(state, stream, request, started, content):
+    """Yield the deltas of one streamed call, collecting them in content; records the call when it ends"""
+    received = {}
+    status = "error"
+    try:
+        for text in _stream_text(stream, received):
+            content.append(text)
+            yield "delta", text
+        status = "ok"
+        _record_usage(state, received.get("usage"))
+    finally:
+        stream.close()
+        _observe_call(f"{state['kind']}_analysis", request, started, state["meta"], status, received.get("usage"))
+
+
+async def astream_image_analysis(kind, image):
+    """Async variant of stream_image_analysis; returns an async iterator."""
+    state, cached = await asyncio.to_thread(prepare_analysis, kind, image)
+    if cached is not None:
+        return _aiter_events(("result", (cached, state["meta"])))
+
+    client = get_async_openai_client()
+    if not client:
+        return _aiter_events(("result", (_analysis_fallback(kind), state["meta"])))
+
+    request = _primary_request(state, stream=True)
+    try:
+        stream, started = await _acall_openai(f"{kind}_analysis", client, request, state["meta"])
+    except SchedulerOverloaded:
+        raise
+    except Exception as e:
+        return _aiter_events(("result", _failed_analysis(state, e)))
+
+    return _arelay_analysis(state, client, stream, request, started)
 
+
+async def _arelay_analysis(state, client, stream, request, started):
+    content = []
+    try:
+        async for event in _arelay_stream(state, stream, request, started, content):
+            yield event
+        reason = escalation_reason(state, "".join(content))
+        if reason:
+            yield "reset", reason
+            request = _escalated_request(state, reason, stream=True)
+            stream, started = await _acall_openai(f"{state['kind']}_analysis", client, request, state["meta"])
+            content = []
+            async for event in _arelay_stream(state, stream, request, started, content):
+                yield event
+        outcome = await asyncio.to_thread(finish_analysis, state, "".join(content)), state["meta"]
     except Exception as e:
-        logging.error(f"Failed to analyze product image: {e}")
-        return {} # Return empty dict on error
+        outcome = _failed_analysis(state, e)
+    yield "result", outcome
+
+
+async def _arelay_stream(state, stream, request, started, content):
+    received = {}
+    status = "error"
+    try:
+        async for text in _astream_text(stream, received):
+            content.append(text)
+            yield "delta", text
+        status = "ok"
+        _record_usage(state, received.get("usage"))
+    finally:
+        await stream.close()
+        _observe_call(f"{state['kind']}_analysis", request, started, state["meta"], status, received.get("usage"))
+
+
+def _batch_outcome(kind, outcome):
+    """Split a run_image_analysis outcome (or exception) into result/meta/error"""
+    if isinstance(outcome, ImageNormalizationError):
+        return None, None, str(outcome)
+    if isinstance(outcome, Exception):
+        logging.error(f"Failed to analyze {kind} image in batch: {outcome}")
+        return None, None, f"Failed to analyze {kind}: {outcome}"
+    return outcome[0], outcome[1], None
+
+
+def _collect_batch(kinds, outcomes):
+    batch = {"results": {}, "meta": {}, "errors": {}}
+    for kind, outcome in zip(kinds, outcomes):
+        result, meta, error = _batch_outcome(kind, outcome)
+        if error is not None:
+            batch["errors"][kind] = error
+        else:
+            batch["results"][kind] = result
+            batch["meta"][kind] = meta
+    return batch
+
+
+def run_image_analyses(images):
+    """Run several analyses concurrently, e.g. {"product": b64, "scene": b64}.
+
+    Each kind keeps its own prompt and cache entry; running them side by side
+    makes the batch take as long as the slowest analysis rather than the sum.
+    Returns {"results": {kind: result}, "meta": {kind: meta}, "errors": {kind: message}}.
+    """
+    kinds = list(images)
+    if not kinds:
+        return _collect_batch([], [])
+
+    with ThreadPoolExecutor(max_workers=len(kinds)) as pool:
+        # Each analysis runs in a copy of the caller's context so its usage is
+        # tagged with the caller's request
+        futures = [pool.submit(contextvars.copy_context().run, run_image_analysis, kind, images[kind])
+                   for kind in kinds]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    return _collect_batch(kinds, outcomes)
+
+
+async def arun_image_analyses(images):
+    """Async variant of run_image_analyses used by the ASGI app"""
+    kinds = list(images)
+    outcomes = await asyncio.gather(
+        *(arun_image_analysis(kind, images[kind]) for kind in kinds),
+        return_exceptions=True
+    )
+    return _collect_batch(kinds, outcomes)
+
+
+def analyze_scene_image(base64_image):
+    """Analyze scene/location image for technical description"""
+    return run_image_analysis("scene", base64_image)[0]
+
+
+def analyze_actor_image(base64_image):
+    """Analyze actor image to generate detailed physical description"""
+    return run_image_analysis("actor", base64_image)[0]
+
+
+def analyze_product_image(base64_image):
+    """Provide detailed analysis and description of product image"""
+    return run_image_analysis("product", base64_image)[0]
 
 
 def generate_ugc_prompt(form_data):
     """Generate optimized UGC prompt using template-based logic (no AI tokens used)"""
+    return _generate_ugc_prompt(form_data)
+
+
+def _generate_ugc_prompt(form_data, enrichment=None):
+    """generate_ugc_prompt, optionally with the analysis enrichment already looked up"""
     try:
         # Build comprehensive context from form data
         context = {
@@ -216,6 +776,7 @@ def generate_ugc_prompt(form_data):
             "actor_description": form_data.get("actor_description"),
             "character_archetype": form_data.get("character_archetype")
         }
+        context["enrichment"] = enrichment or product_enrichment(context["product_analysis"] or {})
 
         # Generate prompt using template-based logic
         result = _build_prompt_from_templates(context)
@@ -236,6 +797,39 @@ def generate_ugc_prompt(form_data):
         }
 
 
+def expand_settings_grid(grid):
+    """Return every combination of a {setting: [values]} grid as a list of dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def generate_ugc_prompts(contexts):
+    """Generate template prompts for many contexts, yielding results in order.
+
+    Hook and action tables are module constants and analysis enrichment is
+    memoized per analysis fingerprint, so per-product work is done once for
+    all of that product's setting variants.
+    """
+    for context in contexts:
+        yield generate_ugc_prompt(context)
+
+
+def generate_ugc_prompt_grid(base_contexts, grid):
+    """Yield (base_index, variant, result) for each base context × grid combination.
+
+    grid maps context keys to lists of values, e.g.
+    {"hook_type": ["fomo", "curiosity_gap"], "platform": ["tiktok", "reels"]};
+    each variant's values override the base context.
+    """
+    variants = expand_settings_grid(grid or {})
+    for index, base in enumerate(base_contexts):
+        # Every variant shares the base analysis unless the grid varies it
+        enrichment = None if "product_analysis" in (grid or {}) else product_enrichment(
+            base.get("product_analysis") or {})
+        for variant in variants:
+            yield index, variant, _generate_ugc_prompt({**base, **variant}, enrichment)
+
+
 def _build_prompt_logic(context):
     """Build strategic logic for prompt generation based on context"""
     logic = {
@@ -334,48 +928,8 @@ def _analyze_audience_psychology(context):
 def _build_prompt_from_templates(context):
     """Build UGC prompt using template-based system generation"""
 
-    # Get template components
-    hook = _build_hook(context)
-    subject = _build_subject(context)
-    action = _build_action(context)
-    setting = _build_setting(context)
-    camera = _build_camera_work(context)
-    audio = _build_audio(context)
-
-    # Add detailed product description if available
-    product_analysis = context.get("product_analysis", {})
-    detailed_description = product_analysis.get("detailed_description", "")
-
-    # Build structured prompt in required format
-    product_analysis = context.get("product_analysis", {})
-    detailed_description = product_analysis.get("detailed_description", "")
-
-    # Format exactly as required
-    prompt_sections = []
-
-    # PRODUCT section (visual ground truth)
-    if detailed_description:
-        prompt_sections.append(f"PRODUCT (read this exactly; use as visual ground truth):\n{detailed_description}\n\nDO NOT SUBSTITUTE ANOTHER PRODUCT. Keep exact branding/text/colors.")
-
-    # UGC advert section
-    duration = context.get("video_length", "8")
-    setting = context.get("setting", "modern office desk")
-    lighting = context.get("lighting", "soft natural light")
-
-    # Use the actor_persona built in _build_subject
-    actor_persona = _build_subject(context) # Re-call to get the actor_persona
-
-    ugc_section = f"""UGC advert. Duration {duration} seconds. Aspect 9:16.
-Setting: {setting}, {lighting}. Camera: handheld.
-Actor: {actor_persona}.
-Action: {action}
-Dialogue (to camera): {hook}
-Captions: match the spoken line. Audio: clear voice, faint room tone only."""
-
-    prompt_sections.append(ugc_section)
-
-    # Combine sections
-    final_prompt = "\n\n".join(prompt_sections)
+    # PRODUCT section (when there is a description) and UGC advert section
+    final_prompt = _STRUCTURED_PROMPT.render(context)
 
     # Generate metadata
     key_elements = _extract_key_elements(context)
@@ -393,6 +947,9 @@ Captions: match the spoken line. Audio: clear voice, faint room tone only."""
         "generation_method": "Template Logic"
     }
 
+def _product_description(context):
+    return _context_enrichment(context)["detailed_description"]
+
 def _build_hook(context):
     """Build compelling hook based on strategy"""
     hook_type = context.get("hook_type", "")
@@ -402,16 +959,7 @@ def _build_hook(context):
     if custom_hook:
         return custom_hook
 
-    hooks = {
-        "problem_agitate_solve": f"Are you tired of [problem with {product}]? Here's the game-changer",
-        "curiosity_gap": f"This {product} trick will blow your mind",
-        "social_proof": f"Everyone's talking about this {product} - here's why",
-        "pattern_interrupt": f"Stop! Before you buy another {product}, watch this",
-        "controversial": f"Unpopular opinion: Most {product} advice is wrong",
-        "fomo": f"Limited time: This {product} is flying off the shelves"
-    }
-
-    return hooks.get(hook_type, f"Check out this amazing {product}")
+    return HOOK_TEMPLATES.get(hook_type, DEFAULT_HOOK_TEMPLATE).format(product=product)
 
 def _build_subject(context):
     """Build subject description"""
@@ -436,135 +984,181 @@ def _build_action(context):
     ugc_type = context.get("ugc_type", "")
     product = context.get("product", "product")
 
-    # Get detailed description to enhance the action
-    product_analysis = context.get("product_analysis", {})
-    detailed_description = product_analysis.get("detailed_description", "")
-
     # Build base action
-    actions = {
-        "unboxing": f"unboxing and revealing the {product} with genuine excitement and surprise reactions",
-        "review": f"demonstrating and reviewing the {product}, showing its key features and benefits",
-        "tutorial": f"showing step-by-step how to use the {product} with clear instructions",
-        "lifestyle": f"naturally incorporating the {product} into their daily routine",
-        "problem_solving": f"solving a common problem using the {product} as the solution",
-        "before_after": f"showing dramatic before and after results using the {product}"
-    }
-
-    base_action = actions.get(ugc_type, f"showcasing the {product}")
+    base_action = ACTION_TEMPLATES.get(ugc_type, DEFAULT_ACTION_TEMPLATE).format(product=product)
 
-    # Enhance with detailed description if available
-    if detailed_description:
-        # Extract key visual elements from description
-        visual_details = _extract_visual_details(detailed_description)
-        if visual_details:
-            base_action += f", highlighting {visual_details}"
+    # Enhance with key visual elements from the detailed description, if any
+    visual_details = _context_enrichment(context)["visual_details"]
+    if visual_details:
+        base_action += f", highlighting {visual_details}"
 
     return base_action
 
-def _extract_visual_details(description):
-    """Extract key visual details from description for prompt enhancement"""
-    description_lower = description.lower()
+# Keyword tables for the description helpers, in priority order: each helper
+# uses the first entry of a table that occurs in the description
+VISUAL_COLOR_DETAILS = {
+    "white": "crisp white", "black": "sleek black", "blue": "vibrant blue",
+    "red": "bold red", "green": "fresh green", "yellow": "bright yellow",
+    "purple": "rich purple", "orange": "energetic orange", "pink": "playful pink",
+    "brown": "warm brown", "gray": "sophisticated gray", "grey": "sophisticated grey",
+    "beige": "elegant beige", "cream": "luxurious cream", "gold": "stunning gold",
+    "silver": "polished silver", "navy": "classic navy", "tan": "rich tan"
+}
+
+VISUAL_MATERIAL_DETAILS = {
+    "leather": "premium leather craftsmanship",
+    "fabric": "high-quality fabric construction",
+    "metal": "gleaming metal accents",
+    "metallic": "gleaming metal accents",
+    "plastic": "durable design elements",
+    "wood": "natural wood grain",
+    "wooden": "natural wood grain",
+    "glass": "crystal-clear finish",
+    "suede": "luxurious suede texture",
+    "canvas": "sturdy canvas build",
+    "rubber": "flexible grip technology"
+}
+
+ENHANCED_COLOR_DESCRIPTIONS = {
+    "white": "featuring crisp, clean white tones that exude elegance",
+    "brown": "with rich, warm brown accents that add sophistication",
+    "black": "showcasing sleek black elements for a modern aesthetic",
+    "blue": "highlighting vibrant blue details that catch the eye",
+    "red": "with bold red features that command attention"
+}
+
+# Every keyword the helpers look for, matched as whole words in one pass
+DESCRIPTION_KEYWORDS = KeywordMatcher({
+    "visual_color": VISUAL_COLOR_DETAILS,
+    "visual_material": VISUAL_MATERIAL_DETAILS,
+    "enhanced_color": ENHANCED_COLOR_DESCRIPTIONS,
+    "quality": ["professional", "detailed", "clear", "high-quality", "premium", "luxury"],
+    "surface": ["fabric", "wood", "wooden", "table", "surface", "background", "floor", "wall"],
+    "other": ["nike", "nikki", "logo", "text", "shoe", "sneaker", "clothing", "apparel", "neutral"],
+})
+
+
+# Settings-independent details derived from a product analysis, memoized per
+# analysis fingerprint. The frontend re-sends the same analysis on every
+# /generate and grids reuse one analysis for every variant, so each analysis
+# is enriched once.
+ENRICHMENT_CACHE_SIZE = int(os.environ.get("ENRICHMENT_CACHE_SIZE", "4096"))
+_enrichments: OrderedDict[tuple, MappingProxyType] = OrderedDict()
+_enrichments_lock = threading.Lock()
+
+
+def _enrichment_fingerprint(product_analysis):
+    """The analysis fields enrichment is derived from.
+
+    Analyses that differ only in other fields share an entry. Hashing the
+    whole canonicalized payload costs more than building a prompt.
+    """
+    return (product_analysis.get("product_name", "product"), product_analysis.get("detailed_description", ""))
+
+
+def _enrich_product_analysis(product_name, detailed_description):
+    hits = DESCRIPTION_KEYWORDS.scan(detailed_description) if detailed_description else None
+    return MappingProxyType({
+        "product_name": product_name,
+        "detailed_description": detailed_description,
+        "visual_details": _extract_visual_details(hits) if hits is not None else "",
+        "environmental_details": _extract_environmental_details(hits) if hits is not None else "",
+    })
+
+
+def product_enrichment(product_analysis):
+    """Return the memoized, read-only enrichment of a product analysis"""
+    fingerprint = _enrichment_fingerprint(product_analysis)
+    with _enrichments_lock:
+        enrichment = _enrichments.get(fingerprint)
+        if enrichment is not None:
+            _enrichments.move_to_end(fingerprint)
+            return enrichment
+
+    enrichment = _enrich_product_analysis(*fingerprint)
+    with _enrichments_lock:
+        _enrichments[fingerprint] = enrichment
+        while len(_enrichments) > ENRICHMENT_CACHE_SIZE:
+            _enrichments.popitem(last=False)
+    return enrichment
+
+
+def _context_enrichment(context):
+    """The enrichment generate_ugc_prompt attached to context, or a fresh lookup"""
+    enrichment = context.get("enrichment")
+    if enrichment is None:
+        enrichment = product_enrichment(context.get("product_analysis") or {})
+    return enrichment
+
+
+def _extract_visual_details(hits):
+    """Extract key visual details from description keyword hits for prompt enhancement"""
     found_details = []
 
     # Enhanced color detection with more dynamic descriptions
-    colors = {
-        "white": "crisp white", "black": "sleek black", "blue": "vibrant blue",
-        "red": "bold red", "green": "fresh green", "yellow": "bright yellow",
-        "purple": "rich purple", "orange": "energetic orange", "pink": "playful pink",
-        "brown": "warm brown", "gray": "sophisticated gray", "grey": "sophisticated grey",
-        "beige": "elegant beige", "cream": "luxurious cream", "gold": "stunning gold",
-        "silver": "polished silver", "navy": "classic navy", "tan": "rich tan"
-    }
-
-    for color, enhanced_desc in colors.items():
-        if color in description_lower:
-            found_details.append(f"the {enhanced_desc} coloring")
-            break
+    color = hits.first("visual_color")
+    if color:
+        found_details.append(f"the {VISUAL_COLOR_DETAILS[color]} coloring")
 
     # Enhanced material detection with exciting descriptions
-    materials = {
-        "leather": "premium leather craftsmanship",
-        "fabric": "high-quality fabric construction",
-        "metal": "gleaming metal accents",
-        "plastic": "durable design elements",
-        "wood": "natural wood grain",
-        "glass": "crystal-clear finish",
-        "suede": "luxurious suede texture",
-        "canvas": "sturdy canvas build",
-        "rubber": "flexible grip technology"
-    }
-
-    for material, enhanced_desc in materials.items():
-        if material in description_lower:
-            found_details.append(enhanced_desc)
-            break
+    material = hits.first("visual_material")
+    if material:
+        found_details.append(VISUAL_MATERIAL_DETAILS[material])
 
     # Look for brand/product specific details
-    if "nike" in description_lower or "nikki" in description_lower:
+    if hits.any("nike", "nikki"):
         found_details.append("the iconic design elements")
-    if "logo" in description_lower or "text" in description_lower:
+    if hits.any("logo", "text"):
         found_details.append("the distinctive branding")
-    if "shoe" in description_lower or "sneaker" in description_lower:
+    if hits.any("shoe", "sneaker"):
         found_details.append("the athletic silhouette and comfort features")
 
     # Look for quality indicators
-    quality_words = ["professional", "detailed", "clear", "high-quality", "premium", "luxury"]
-    for word in quality_words:
-        if word in description_lower:
-            found_details.append("the exceptional build quality")
-            break
+    if hits.first("quality"):
+        found_details.append("the exceptional build quality")
 
     return ", ".join(found_details[:4])  # Allow up to 4 details for richer descriptions
 
 def _create_enhanced_product_description(original_description, context):
     """Transform basic product description into engaging, dynamic content"""
     product = context.get("product", "product")
-    description_lower = original_description.lower()
+    hits = DESCRIPTION_KEYWORDS.scan(original_description)
 
     # Build enhanced description components
     enhanced_parts = []
 
     # Start with exciting product intro
-    if "shoe" in description_lower or "sneaker" in description_lower:
+    if hits.any("shoe", "sneaker"):
         enhanced_parts.append(f"This stunning {product} showcases incredible attention to detail")
-    elif "clothing" in description_lower or "apparel" in description_lower:
+    elif hits.any("clothing", "apparel"):
         enhanced_parts.append(f"This beautiful {product} features premium design and craftsmanship")
     else:
         enhanced_parts.append(f"This amazing {product} combines style and functionality")
 
     # Add color descriptions with emotion
-    colors = {
-        "white": "featuring crisp, clean white tones that exude elegance",
-        "brown": "with rich, warm brown accents that add sophistication",
-        "black": "showcasing sleek black elements for a modern aesthetic",
-        "blue": "highlighting vibrant blue details that catch the eye",
-        "red": "with bold red features that command attention"
-    }
-
-    for color, desc in colors.items():
-        if color in description_lower:
-            enhanced_parts.append(desc)
-            break
+    color = hits.first("enhanced_color")
+    if color:
+        enhanced_parts.append(ENHANCED_COLOR_DESCRIPTIONS[color])
 
     # Add material and construction details
-    if "leather" in description_lower:
+    if "leather" in hits:
         enhanced_parts.append("crafted with premium materials for lasting quality")
-    elif "fabric" in description_lower:
+    elif "fabric" in hits:
         enhanced_parts.append("made with high-performance materials")
     else:
         enhanced_parts.append("built with exceptional attention to quality")
 
     # Add brand recognition
-    if "nike" in description_lower or "nikki" in description_lower:
+    if hits.any("nike", "nikki"):
         enhanced_parts.append("featuring the iconic brand elements you love")
-    if "logo" in description_lower or "text" in description_lower:
+    if hits.any("logo", "text"):
         enhanced_parts.append("with distinctive branding that makes a statement")
 
     # Add visual appeal for video
     enhanced_parts.append("perfectly designed for stunning visual content")
 
     # Add engagement elements
-    if "professional" in description_lower:
+    if "professional" in hits:
         enhanced_parts.append("professionally styled for maximum impact")
 
     # Combine with dynamic connectors
@@ -579,6 +1173,79 @@ def _create_enhanced_product_description(original_description, context):
 
     return description
 
+def _ai_prompt_request(context, product_analysis):
+    """Build the chat request used by _generate_ai_powered_ugc_prompt"""
+    # Extract all available data
+    enrichment = product_enrichment(product_analysis)
+    product_name = enrichment["product_name"]
+    detailed_description = enrichment["detailed_description"]
+    key_features = product_analysis.get("key_features", [])
+    target_audience = context.get("target_audience", "general consumers")
+    ugc_type = context.get("ugc_type", "unboxing")
+    setting = context.get("setting", "indoors")
+    lighting = context.get("lighting", "natural")
+    duration = context.get("video_length", "8")
+
+    # Create comprehensive prompt for OpenAI - MUST include full description
+    ai_input = f"""
+    Create an engaging UGC video prompt for this product. IMPORTANT: You must include the complete product description in the final prompt.
+
+    Product: {product_name}
+    Full Product Description: {detailed_description}
+    Key Features: {', '.join(key_features) if key_features else 'Not specified'}
+
+    Video Details:
+    - Type: {ugc_type}
+    - Target Audience: {target_audience}
+    - Setting: {setting}
+    - Lighting: {lighting}
+    - Duration: {duration} seconds
+    - Format: Vertical 9:16
+
+    Generate a compelling video prompt that MUST end with: "Product description: [the full detailed description provided above]"
+
+    Structure: [Engaging UGC directions]. Product description: {detailed_description}
+    """
+
+    # Using gpt-4o for AI generation
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert UGC video strategist who creates compelling, authentic video prompts that drive conversions. Focus on natural, engaging language that resonates with real people."
+            },
+            {
+                "role": "user",
+                "content": ai_input
+            }
+        ],
+        "max_tokens": 500,
+        "temperature": 0.7
+    }
+
+
+def _ai_prompt_result(context, content):
+    """Wrap the AI-written prompt with the template-derived metadata"""
+    ai_generated_prompt = content.strip() if content else "AI generation failed"
+
+    # Generate metadata using existing functions
+    key_elements = _extract_key_elements(context)
+    conversion_potential = _assess_conversion_potential(context)
+    optimization_tips = _generate_optimization_tips(context)
+
+    return {
+        "prompt": ai_generated_prompt,
+        "key_elements": key_elements,
+        "conversion_psychology": _get_conversion_psychology(context),
+        "technical_elements": _get_technical_elements(context),
+        "estimated_conversion_potential": conversion_potential,
+        "optimization_tips": optimization_tips,
+        "prompt_structure": "AI-Generated Comprehensive UGC Prompt",
+        "generation_method": "OpenAI GPT-4o"
+    }
+
+
 def _generate_ai_powered_ugc_prompt(context, product_analysis):
     """Use OpenAI to generate engaging UGC prompts from product analysis"""
     client = get_openai_client()
@@ -587,91 +1254,83 @@ def _generate_ai_powered_ugc_prompt(context, product_analysis):
         return _generate_basic_template_prompt(context)
 
     try:
-        # Extract all available data
-        product_name = product_analysis.get("product_name", "product")
-        detailed_description = product_analysis.get("detailed_description", "")
-        key_features = product_analysis.get("key_features", [])
-        target_audience = context.get("target_audience", "general consumers")
-        ugc_type = context.get("ugc_type", "unboxing")
-        setting = context.get("setting", "indoors")
-        lighting = context.get("lighting", "natural")
-        duration = context.get("video_length", "8")
-
-        # Create comprehensive prompt for OpenAI - MUST include full description
-        ai_input = f"""
-        Create an engaging UGC video prompt for this product. IMPORTANT: You must include the complete product description in the final prompt.
-
-        Product: {product_name}
-        Full Product Description: {detailed_description}
-        Key Features: {', '.join(key_features) if key_features else 'Not specified'}
-
-        Video Details:
-        - Type: {ugc_type}
-        - Target Audience: {target_audience}
-        - Setting: {setting}
-        - Lighting: {lighting}
-        - Duration: {duration} seconds
-        - Format: Vertical 9:16
-
-        Generate a compelling video prompt that MUST end with: "Product description: [the full detailed description provided above]"
-
-        Structure: [Engaging UGC directions]. Product description: {detailed_description}
-        """
-
-        # Using gpt-4o for AI generation
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert UGC video strategist who creates compelling, authentic video prompts that drive conversions. Focus on natural, engaging language that resonates with real people."
-                },
-                {
-                    "role": "user",
-                    "content": ai_input
-                }
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
+        request = _ai_prompt_request(context, product_analysis)
+        response, _ = _call_openai("prompt", client, request, {})
+        return _ai_prompt_result(context, response.choices[0].message.content)
 
-        ai_generated_prompt = response.choices[0].message.content.strip() if response.choices[0].message.content else "AI generation failed"
+    except Exception as e:
+        logging.error(f"Error generating AI prompt: {e}")
+        # Fallback to template method
+        return _generate_basic_template_prompt(context)
 
-        # Generate metadata using existing functions
-        key_elements = _extract_key_elements(context)
-        conversion_potential = _assess_conversion_potential(context)
-        optimization_tips = _generate_optimization_tips(context)
 
-        return {
-            "prompt": ai_generated_prompt,
-            "key_elements": key_elements,
-            "conversion_psychology": _get_conversion_psychology(context),
-            "technical_elements": _get_technical_elements(context),
-            "estimated_conversion_potential": conversion_potential,
-            "optimization_tips": optimization_tips,
-            "prompt_structure": "AI-Generated Comprehensive UGC Prompt",
-            "generation_method": "OpenAI GPT-4o"
-        }
+def stream_ai_powered_ugc_prompt(context, product_analysis):
+    """Streaming variant of _generate_ai_powered_ugc_prompt.
 
+    Yields ("delta", text) events as the prompt is written and ends with a
+    ("result", prompt_data) event. Falls back to the template prompt, as a
+    lone result event, when OpenAI is unavailable or fails before streaming.
+    """
+    client = get_openai_client()
+    if not client:
+        logging.warning("OpenAI client not available, falling back to template prompt generation.")
+        yield "result", _generate_basic_template_prompt(context)
+        return
+
+    content = []
+    try:
+        request = dict(_ai_prompt_request(context, product_analysis), stream=True, stream_options=STREAM_OPTIONS)
+        stats, received, status = {}, {}, "error"
+        stream, started = _call_openai("prompt", client, request, stats)
+        try:
+            for text in _stream_text(stream, received):
+                content.append(text)
+                yield "delta", text
+            status = "ok"
+        finally:
+            stream.close()
+            _observe_call("prompt", request, started, stats, status, received.get("usage"))
+        result = _ai_prompt_result(context, "".join(content))
     except Exception as e:
         logging.error(f"Error generating AI prompt: {e}")
-        # Fallback to template method
-        return _generate_basic_template_prompt(context)
+        result = _generate_basic_template_prompt(context)
+
+    yield "result", result
+
+
+async def astream_ai_powered_ugc_prompt(context, product_analysis):
+    """Async variant of stream_ai_powered_ugc_prompt for the ASGI app."""
+    client = get_async_openai_client()
+    if not client:
+        logging.warning("OpenAI client not available, falling back to template prompt generation.")
+        yield "result", _generate_basic_template_prompt(context)
+        return
+
+    content = []
+    try:
+        request = dict(_ai_prompt_request(context, product_analysis), stream=True, stream_options=STREAM_OPTIONS)
+        stats, received, status = {}, {}, "error"
+        stream, started = await _acall_openai("prompt", client, request, stats)
+        try:
+            async for text in _astream_text(stream, received):
+                content.append(text)
+                yield "delta", text
+            status = "ok"
+        finally:
+            await stream.close()
+            _observe_call("prompt", request, started, stats, status, received.get("usage"))
+        result = _ai_prompt_result(context, "".join(content))
+    except Exception as e:
+        logging.error(f"Error generating AI prompt: {e}")
+        result = _generate_basic_template_prompt(context)
+
+    yield "result", result
 
 
 def _generate_basic_template_prompt(context):
     """Fallback template method when AI generation fails"""
-    # Basic template components
-    hook = _build_hook(context)
-    subject = _build_subject(context)
-    action = _build_action(context)
-    setting = _build_setting(context)
-    camera = _build_camera_work(context)
-    audio = _build_audio(context)
-
     # Build basic prompt
-    prompt_parts = [hook, subject, action, setting, camera, audio]
-    prompt = ". ".join([part for part in prompt_parts if part])
+    prompt = _BASIC_PROMPT.render(context)
 
     return {
         "prompt": prompt,
@@ -689,53 +1348,29 @@ def _build_setting(context):
     setting = context.get("setting", "")
     lighting = context.get("lighting", "")
 
-    settings = {
-        "home_bedroom": "in a cozy, well-lit bedroom",
-        "kitchen": "in a modern, clean kitchen",
-        "office": "in a professional office workspace",
-        "outdoors": "in a beautiful outdoor location with natural scenery",
-        "car": "inside a clean, modern vehicle",
-        "bathroom": "in a clean, well-lit bathroom"
-    }
-
-    lighting_styles = {
-        "natural": "with soft natural lighting",
-        "ring_light": "with professional ring light setup",
-        "golden_hour": "during golden hour with warm, flattering light",
-        "soft_indoor": "with soft, diffused indoor lighting"
-    }
-
-    setting_desc = settings.get(setting, "in an attractive indoor setting")
-    lighting_desc = lighting_styles.get(lighting, "with good lighting")
-
-    # Enhance with product analysis if available
-    product_analysis = context.get("product_analysis", {})
-    detailed_description = product_analysis.get("detailed_description", "")
+    setting_desc = SETTING_DESCRIPTIONS.get(setting, DEFAULT_SETTING_DESCRIPTION)
+    lighting_desc = LIGHTING_DESCRIPTIONS.get(lighting, DEFAULT_LIGHTING_DESCRIPTION)
 
     base_setting = f"{setting_desc} {lighting_desc}"
 
     # Add environmental details from product description
-    if detailed_description:
-        env_details = _extract_environmental_details(detailed_description)
-        if env_details:
-            base_setting += f", {env_details}"
+    env_details = _context_enrichment(context)["environmental_details"]
+    if env_details:
+        base_setting += f", {env_details}"
 
     return base_setting
 
-def _extract_environmental_details(description):
-    """Extract environmental/background details from description"""
-    description_lower = description.lower()
+def _extract_environmental_details(hits):
+    """Extract environmental/background details from description keyword hits"""
 
     # Look for background/surface mentions
-    surfaces = ["fabric", "wood", "table", "surface", "background", "floor", "wall"]
-    for surface in surfaces:
-        if surface in description_lower:
-            if "fabric" in description_lower:
-                return "with textured fabric surfaces visible"
-            elif "wood" in description_lower:
-                return "with warm wooden surfaces"
-            elif "neutral" in description_lower and "background" in description_lower:
-                return "against a clean, neutral background"
+    if hits.first("surface"):
+        if "fabric" in hits:
+            return "with textured fabric surfaces visible"
+        elif hits.any("wood", "wooden"):
+            return "with warm wooden surfaces"
+        elif "neutral" in hits and "background" in hits:
+            return "against a clean, neutral background"
 
     return ""
 
@@ -744,14 +1379,7 @@ def _build_camera_work(context):
     camera_movement = context.get("camera_movement", "")
     video_length = context.get("video_length", "8")
 
-    camera_styles = {
-        "static": "Shot with a steady, static camera for clear focus",
-        "handheld": "Filmed with natural handheld movement for authenticity",
-        "smooth_tracking": "Using smooth camera tracking to follow the action",
-        "close_zoom": "Starting wide and smoothly zooming in for detail"
-    }
-
-    camera_desc = camera_styles.get(camera_movement, "with steady, professional camera work")
+    camera_desc = CAMERA_STYLES.get(camera_movement, DEFAULT_CAMERA_STYLE)
 
     return f"{camera_desc}. {video_length}-second duration, vertical 9:16 format"
 
@@ -763,18 +1391,50 @@ def _build_audio(context):
     if not audio_enabled:
         return "Silent video with text overlays and engaging visuals"
 
-    audio_styles = {
-        "conversational": "with clear, natural speech and ambient background",
-        "excited": "with enthusiastic, high-energy narration",
-        "calm": "with calm, trustworthy voice and subtle background music",
-        "energetic": "with upbeat music and dynamic audio",
-        "emotional": "with heartfelt narration and supporting music"
-    }
-
-    audio_desc = audio_styles.get(performance_style, "with clear audio and engaging narration")
+    audio_desc = AUDIO_STYLES.get(performance_style, DEFAULT_AUDIO_STYLE)
 
     return f"Audio: {audio_desc}"
 
+
+# Everything a prompt format can reference. Formats are compiled once here and
+# only call the components they use.
+_PROMPT_COMPONENTS = {
+    "hook": _build_hook,
+    "subject": _build_subject,
+    "action": _build_action,
+    "setting": _build_setting,
+    "camera": _build_camera_work,
+    "audio": _build_audio,
+    "product_description": _product_description,
+    "duration": lambda context: context.get("video_length", "8"),
+    "setting_name": lambda context: context.get("setting", "modern office desk"),
+    "lighting_name": lambda context: context.get("lighting", "soft natural light"),
+}
+
+_STRUCTURED_PROMPT = CompiledFormat(
+    [
+        # PRODUCT section (visual ground truth), only with a description
+        ("PRODUCT (read this exactly; use as visual ground truth):\n{product_description}\n\n"
+         "DO NOT SUBSTITUTE ANOTHER PRODUCT. Keep exact branding/text/colors.", "product_description"),
+        # UGC advert section
+        ("UGC advert. Duration {duration} seconds. Aspect 9:16.\n"
+         "Setting: {setting_name}, {lighting_name}. Camera: handheld.\n"
+         "Actor: {subject}.\n"
+         "Action: {action}\n"
+         "Dialogue (to camera): {hook}\n"
+         "Captions: match the spoken line. Audio: clear voice, faint room tone only.", None),
+    ],
+    "\n\n",
+    _PROMPT_COMPONENTS,
+)
+
+# Basic prompt: the non-empty components joined into sentences
+_BASIC_PROMPT = CompiledFormat(
+    [(f"{{{name}}}", name) for name in ("hook", "subject", "action", "setting", "camera", "audio")],
+    ". ",
+    _PROMPT_COMPONENTS,
+)
+
 def _extract_key_elements(context):
     """Extract key elements from context"""
     elements = []
@@ -853,53 +1513,14 @@ def _get_technical_elements(context):
 
 def _get_enhancement_templates(context=None):
     """Get enhancement templates for different focus areas"""
-    return {
-        "conversion": {
-            "improvements": ["Added urgency triggers", "Enhanced call-to-action", "Included social proof elements"],
-            "changes": ["Stronger opening hook", "Clear value proposition", "Conversion-focused language"],
-            "boost_explanation": "Enhanced psychological triggers and conversion elements for higher sales potential"
-        },
-        "visual": {
-            "improvements": ["Enhanced cinematography", "Better visual composition", "Improved lighting description"],
-            "changes": ["More detailed camera work", "Professional visual elements", "Aesthetic improvements"],
-            "boost_explanation": "Improved visual storytelling and cinematography for more engaging content"
-        },
-        "emotion": {
-            "improvements": ["Deeper emotional connection", "Enhanced storytelling", "Relatable scenarios"],
-            "changes": ["Emotional language", "Personal connection points", "Empathy-driven content"],
-            "boost_explanation": "Amplified emotional resonance for stronger viewer connection and engagement"
-        },
-        "engagement": {
-            "improvements": ["Social media optimized", "Viral potential elements", "Interactive components"],
-            "changes": ["Platform-specific optimization", "Shareability factors", "Engagement hooks"],
-            "boost_explanation": "Optimized for maximum social media engagement and viral potential"
-        }
-    }
+    return ENHANCEMENT_TEMPLATES
 
 def _apply_enhancement_template(original_prompt, focus, templates):
     """Apply enhancement template to original prompt"""
-
-    # Enhancement strategies based on focus
-    if focus == "conversion":
-        # Add conversion elements
-        enhanced = f"URGENT: {original_prompt}. Viewers can't stop buying this! Limited time offer - act now before it's gone!"
-
-    elif focus == "visual":
-        # Enhance visual elements
-        enhanced = f"Cinematic quality: {original_prompt}. Shot with professional-grade lighting, perfect composition, and stunning visual appeal that stops viewers mid-scroll."
-
-    elif focus == "emotion":
-        # Add emotional elements
-        enhanced = f"Heartfelt story: {original_prompt}. The genuine emotion and personal connection will move viewers to tears and create lasting impact."
-
-    elif focus == "engagement":
-        # Add engagement elements
-        enhanced = f"Viral potential: {original_prompt}. Designed to maximize shares, comments, and saves. This content will dominate social feeds!"
-
-    else:
-        enhanced = original_prompt
-
-    return enhanced
+    enhancement = ENHANCEMENT_PROMPTS.get(focus)
+    if enhancement is None:
+        return original_prompt
+    return enhancement.render(original_prompt)
 
 def enhance_prompt_with_templates(original_prompt, enhancement_focus="conversion"):
     """Enhance existing prompt using template-based improvements (no AI tokens used)"""
@@ -911,9 +1532,9 @@ def enhance_prompt_with_templates(original_prompt, enhancement_focus="conversion
 
         result = {
             "enhanced_prompt": enhanced_prompt,
-            "improvements_made": enhancement_templates[enhancement_focus]["improvements"],
+            "improvements_made": list(enhancement_templates[enhancement_focus]["improvements"]),
             "enhancement_score": "15-25% improvement",
-            "key_changes": enhancement_templates[enhancement_focus]["changes"],
+            "key_changes": list(enhancement_templates[enhancement_focus]["changes"]),
             "conversion_boost": enhancement_templates[enhancement_focus]["boost_explanation"]
         }
 
@@ -0,0 +1,157 @@
+"""
+Perceptual hashing and near-duplicate lookup for uploaded images.
+
+A 64-bit difference hash (dHash) survives re-encoding, resizing and browser
+screenshots of the same photo, so a new upload whose hash is within a small
+Hamming distance of an already analysed image can reuse that analysis.
+
+The dHash only sees luminance, so a recoloured copy of a product (the same
+shoe in red and in blue) hashes the same. Each hash is therefore paired with
+a color signature, the mean chroma of a coarse grid of the image, and a
+match must also be within max_color_distance of it.
+
+Lookups use multi-index hashing: the hash is split into max_distance + 1
+chunks, and by the pigeonhole principle any hash within max_distance bits
+must match the query exactly in at least one chunk. Only the entries sharing
+a chunk are compared, so a lookup touches a few hundred candidates rather
+than every stored hash.
+"""
+
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image, ImageOps
+
+
+HASH_BITS = 64
+
+
+def image_signature(image_bytes: bytes, hash_size: int = 8, color_grid: int = 4) -> tuple[int, tuple[int, ...]]:
+    """Return (dHash, color signature) of an encoded image, decoding it once.
+
+    The color signature is the mean Cb and Cr of each cell of a
+    color_grid x color_grid grid over the image.
+    """
+    with Image.open(BytesIO(image_bytes)) as img:
+        # For JPEGs, let the decoder downscale while decoding
+        img.draft("RGB", (hash_size * 8, hash_size * 8))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = list(small.getdata())
+        _, cb, cr = img.convert("YCbCr").resize((color_grid, color_grid), Image.Resampling.BOX).split()
+        colors = (*cb.getdata(), *cr.getdata())
+
+    return _difference_hash(pixels, hash_size), colors
+
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """Return the difference hash of an encoded image as an integer."""
+    return image_signature(image_bytes, hash_size)[0]
+
+
+def color_distance(a, b) -> int:
+    """The largest difference between two color signatures in any cell and channel."""
+    return max(abs(x - y) for x, y in zip(a, b, strict=True))
+
+
+def _difference_hash(pixels: list[int], hash_size: int) -> int:
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_distance: int = 5, max_color_distance: int = 6, max_entries: int = 50000):
+        self.max_distance = max_distance
+        self.max_color_distance = max_color_distance
+        self.max_entries = max_entries
+
+        # Split the hash into max_distance + 1 contiguous bit ranges
+        chunk_count = max_distance + 1
+        base, extra = divmod(HASH_BITS, chunk_count)
+        self._chunks = []
+        shift = 0
+        for i in range(chunk_count):
+            width = base + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._tables: list[dict[int, set[int]]] = [{} for _ in self._chunks]
+        # (hash, color signature) -> value, oldest first so the index can be bounded
+        self._entries: OrderedDict[tuple[int, tuple[int, ...]], str] = OrderedDict()
+        # hash -> color signatures stored under it; images of different
+        # colorways can share a hash
+        self._colorways: dict[int, list[tuple[int, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, image_hash: int, colors, value: str) -> None:
+        """Index a hash and its color signature.
+
+        Replaces the value of an entry with the same hash and a color
+        signature within max_color_distance; another colorway with the same
+        hash is stored alongside it.
+        """
+        colors = tuple(colors)
+        with self._lock:
+            colorways = self._colorways.get(image_hash)
+            if colorways is None:
+                colorways = self._colorways[image_hash] = []
+                for table, (shift, mask) in zip(self._tables, self._chunks):
+                    table.setdefault((image_hash >> shift) & mask, set()).add(image_hash)
+            else:
+                for stored in colorways:
+                    if color_distance(stored, colors) <= self.max_color_distance:
+                        colorways.remove(stored)
+                        del self._entries[(image_hash, stored)]
+                        break
+
+            colorways.append(colors)
+            self._entries[(image_hash, colors)] = value
+
+            while len(self._entries) > self.max_entries:
+                (evicted, evicted_colors), _ = self._entries.popitem(last=False)
+                colorways = self._colorways[evicted]
+                colorways.remove(evicted_colors)
+                if not colorways:
+                    del self._colorways[evicted]
+                    self._unlink(evicted)
+
+    def find(self, image_hash: int, colors) -> tuple[str, int] | None:
+        """Return (value, distance) of the closest hash within max_distance.
+
+        Candidates whose color signature is further than max_color_distance
+        from colors are skipped, however close their hash.
+        """
+        best = None
+        with self._lock:
+            seen = set()
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                for candidate in table.get((image_hash >> shift) & mask, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = (candidate ^ image_hash).bit_count()
+                    if distance > self.max_distance or (best is not None and distance >= best[1]):
+                        continue
+                    for candidate_colors in self._colorways[candidate]:
+                        if color_distance(candidate_colors, colors) <= self.max_color_distance:
+                            best = (self._entries[(candidate, candidate_colors)], distance)
+                            break
+                    if best is not None and best[1] == 0:
+                        return best
+        return best
+
+    def _unlink(self, image_hash: int) -> None:
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (image_hash >> shift) & mask
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(image_hash)
+                if not bucket:
+                    del table[chunk]
@@ -0,0 +1,298 @@
+"""
+Precompiled prompt templates.
+
+The hook, action, setting, camera, audio and enhancement tables are loaded
+once into read-only mappings. Each prompt format is parsed once, at import,
+into its literal text and fields, and rendering calls only the components
+that format uses, each at most once per prompt.
+"""
+
+import string
+from types import MappingProxyType
+
+
+def _frozen(table):
+    return MappingProxyType(dict(table))
+
+
+HOOK_TEMPLATES = _frozen({
+    "problem_agitate_solve": "Are you tired of [problem with {product}]? Here's the game-changer",
+    "curiosity_gap": "This {product} trick will blow your mind",
+    "social_proof": "Everyone's talking about this {product} - here's why",
+    "pattern_interrupt": "Stop! Before you buy another {product}, watch this",
+    "controversial": "Unpopular opinion: Most {product} advice is wrong",
+    "fomo": "Limited time: This {product} is flying off the shelves",
+})
+DEFAULT_HOOK_TEMPLATE = "Check out this amazing {product}"
+
+ACTION_TEMPLATES = _frozen({
+    "unboxing": "unboxing and revealing the {product} with genuine excitement and surprise reactions",
+    "review": "demonstrating and reviewing the {product}, showing its key features and benefits",
+    "tutorial": "showing step-by-step how to use the {product} with clear instructions",
+    "lifestyle": "naturally incorporating the {product} into their daily routine",
+    "problem_solving": "solving a common problem using the {product} as the solution",
+    "before_after": "showing dramatic before and after results using the {product}",
+})
+DEFAULT_ACTION_TEMPLATE = "showcasing the {product}"
+
+SETTING_DESCRIPTIONS = _frozen({
+    "home_bedroom": "in a cozy, well-lit bedroom",
+    "kitchen": "in a modern, clean kitchen",
+    "office": "in a professional office workspace",
+    "outdoors": "in a beautiful outdoor location with natural scenery",
+    "car": "inside a clean, modern vehicle",
+    "bathroom": "in a clean, well-lit bathroom",
+})
+DEFAULT_SETTING_DESCRIPTION = "in an attractive indoor setting"
+
+LIGHTING_DESCRIPTIONS = _frozen({
+    "natural": "with soft natural lighting",
+    "ring_light": "with professional ring light setup",
+    "golden_hour": "during golden hour with warm, flattering light",
+    "soft_indoor": "with soft, diffused indoor lighting",
+})
+DEFAULT_LIGHTING_DESCRIPTION = "with good lighting"
+
+CAMERA_STYLES = _frozen({
+    "static": "Shot with a steady, static camera for clear focus",
+    "handheld": "Filmed with natural handheld movement for authenticity",
+    "smooth_tracking": "Using smooth camera tracking to follow the action",
+    "close_zoom": "Starting wide and smoothly zooming in for detail",
+})
+DEFAULT_CAMERA_STYLE = "with steady, professional camera work"
+
+AUDIO_STYLES = _frozen({
+    "conversational": "with clear, natural speech and ambient background",
+    "excited": "with enthusiastic, high-energy narration",
+    "calm": "with calm, trustworthy voice and subtle background music",
+    "energetic": "with upbeat music and dynamic audio",
+    "emotional": "with heartfelt narration and supporting music",
+})
+DEFAULT_AUDIO_STYLE = "with clear audio and engaging narration"
+
+# Per enhancement focus: the rewrite of the prompt plus the explanation shown with it
+ENHANCEMENT_TEMPLATES = _frozen({
+    "conversion": _frozen({
+        "template": "URGENT: {prompt}. Viewers can't stop buying this! Limited time offer - act now before it's gone!",
+        "improvements": ("Added urgency triggers", "Enhanced call-to-action", "Included social proof elements"),
+        "changes": ("Stronger opening hook", "Clear value proposition", "Conversion-focused language"),
+        "boost_explanation": "Enhanced psychological triggers and conversion elements for higher sales potential",
+    }),
+    "visual": _frozen({
+        "template": "Cinematic quality: {prompt}. Shot with professional-grade lighting, perfect composition, and stunning visual appeal that stops viewers mid-scroll.",
+        "improvements": ("Enhanced cinematography", "Better visual composition", "Improved lighting description"),
+        "changes": ("More detailed camera work", "Professional visual elements", "Aesthetic improvements"),
+        "boost_explanation": "Improved visual storytelling and cinematography for more engaging content",
+    }),
+    "emotion": _frozen({
+        "template": "Heartfelt story: {prompt}. The genuine emotion and personal connection will move viewers to tears and create lasting impact.",
+        "improvements": ("Deeper emotional connection", "Enhanced storytelling", "Relatable scenarios"),
+        "changes": ("Emotional language", "Personal connection points", "Empathy-driven content"),
+        "boost_explanation": "Amplified emotional resonance for stronger viewer connection and engagement",
+    }),
+    "engagement": _frozen({
+        "template": "Viral potential: {prompt}. Designed to maximize shares, comments, and saves. This content will dominate social feeds!",
+        "improvements": ("Social media optimized", "Viral potential elements", "Interactive components"),
+        "changes": ("Platform-specific optimization", "Shareability factors", "Engagement hooks"),
+        "boost_explanation": "Optimized for maximum social media engagement and viral potential",
+    }),
+})
+
+
+class TemplateError(ValueError):
+    """Raised when a template references an unknown component or uses format specs."""
+
+
+def _parse(source: str, components: dict):
+    """Split a format string into [(literal, field or None)], validating fields"""
+    parts = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(source):
+        if field is not None:
+            if format_spec or conversion:
+                raise TemplateError(f"Format specs are not supported: {{{field}}}")
+            if field not in components:
+                raise TemplateError(f"Unknown component {field!r} in template")
+        parts.append((literal, field))
+    return parts
+
+
+def _join(separator, pieces):
+    """separator.join(pieces), with values other than str put through format().
+
+    format(value) is what str.format does for a bare {field}; joining the
+    literals and values avoids parsing the template again on every call.
+    """
+    try:
+        return separator.join(pieces)
+    except TypeError:
+        return separator.join([piece if isinstance(piece, str) else format(piece) for piece in pieces])
+
+
+# Formats with more distinct conditional fields than this render lazily
+# rather than precompute a template for every combination of sections
+MAX_CONDITIONAL_FIELDS = 6
+
+
+def _variant(sections, known, components, separator):
+    """The sections joined with separator, as (template, known, getters, copies).
+
+    template holds the literal text at its even slots. Rendering fills a copy:
+    known lists (slot, index) of values already fetched, getters lists
+    (slot, component) for the rest, and copies lists (slot, source) for
+    fields used more than once.
+    """
+    literals = [""]
+    known_slots, getters, copies = [], [], []
+    first = {}
+    for number, parts in enumerate(sections):
+        if number:
+            literals[-1] += separator
+        for literal, field in parts:
+            literals[-1] += literal
+            if field:
+                slot = 2 * len(literals) - 1
+                literals.append("")
+                if field in first:
+                    copies.append((slot, first[field]))
+                elif field in known:
+                    first[field] = slot
+                    known_slots.append((slot, known[field]))
+                else:
+                    first[field] = slot
+                    getters.append((slot, components[field]))
+
+    template = [None] * (2 * len(literals) - 1)
+    template[0::2] = literals
+    return template, tuple(known_slots), tuple(getters), tuple(copies)
+
+
+class CompiledFormat:
+    """A prompt format parsed once into literal text and component slots.
+
+    sections is a list of (template, required_field) pairs; a section is
+    rendered only when its required field (if any) comes out non-empty, and
+    rendered sections are joined with separator. components maps field
+    names to functions of the context. render(context) calls each component
+    the format uses at most once, and components only used by a skipped
+    section are not called at all.
+
+    Each combination of conditional sections is flattened into one list of
+    literals with slots for the values, so rendering fills a copy of it and
+    joins it once.
+    """
+
+    __slots__ = ("sections", "separator", "fields", "render", "_components", "_parts")
+
+    def __init__(self, sections, separator: str, components: dict):
+        parsed = [(_parse(source, components), required) for source, required in sections]
+        for _, required in parsed:
+            if required is not None and required not in components:
+                raise TemplateError(f"Unknown component {required!r} in template")
+
+        fields = []
+        for parts, required in parsed:
+            for field in [required] + [field for _, field in parts]:
+                if field and field not in fields:
+                    fields.append(field)
+
+        self.sections = tuple(sections)
+        self.separator = separator
+        self.fields = tuple(fields)
+        self._components = {field: components[field] for field in fields}
+        self._parts = tuple((tuple(parts), required) for parts, required in parsed)
+        self.render = self._renderer(parsed, separator, self._components) or self._render_lazily
+
+    @staticmethod
+    def _renderer(parsed, separator, components):
+        """A render() function for the format, or None to render lazily"""
+        if len(parsed) == 1 and parsed[0][1] is None:
+            parts = parsed[0][0]
+            if 0 < len(parts) <= 2 and parts[0][1] and not (len(parts) == 2 and parts[1][1]):
+                # One field, as in the enhancement rewrites
+                getter = components[parts[0][1]]
+                leading, trailing = parts[0][0], parts[1][0] if len(parts) == 2 else ""
+                return lambda context: leading + format(getter(context)) + trailing
+
+        required_fields = list(dict.fromkeys(required for _, required in parsed if required is not None))
+        if all(parts == [("", required)] for parts, required in parsed) and len(required_fields) == len(parsed):
+            # Bare fields each shown when non-empty, as in the basic prompt
+            getters = tuple(components[field] for field in required_fields)
+
+            def render(context):
+                rendered = []
+                for getter in getters:
+                    value = getter(context)
+                    if value:
+                        rendered.append(value)
+                return _join(separator, rendered)
+
+            return render
+
+        if len(required_fields) > MAX_CONDITIONAL_FIELDS:
+            return None
+
+        # One variant per combination of non-empty required fields, indexed by
+        # a bit mask in required_fields order
+        known = {field: number for number, field in enumerate(required_fields)}
+        variants = []
+        for mask in range(1 << len(required_fields)):
+            shown = [parts for parts, required in parsed
+                     if required is None or mask >> known[required] & 1]
+            variants.append(_variant(shown, known, components, separator))
+        conditions = tuple((1 << number, components[field]) for number, field in enumerate(required_fields))
+
+        def render(context):
+            values = []
+            mask = 0
+            for bit, getter in conditions:
+                value = getter(context)
+                values.append(value)
+                if value:
+                    mask |= bit
+            template, known_slots, getters, copies = variants[mask]
+            pieces = template.copy()
+            for slot, number in known_slots:
+                pieces[slot] = values[number]
+            for slot, getter in getters:
+                pieces[slot] = getter(context)
+            for slot, source in copies:
+                pieces[slot] = pieces[source]
+            return _join("", pieces)
+
+        return render
+
+    def _render_lazily(self, context) -> str:
+        """render() for formats with too many conditional fields to precompute"""
+        values = {}
+        rendered = []
+        for parts, required in self._parts:
+            if required is not None:
+                if required not in values:
+                    values[required] = self._components[required](context)
+                if not values[required]:
+                    continue
+            pieces = []
+            for literal, field in parts:
+                pieces.append(literal)
+                if field:
+                    if field not in values:
+                        values[field] = self._components[field](context)
+                    pieces.append(values[field])
+            rendered.append(_join("", pieces))
+        return self.separator.join(rendered)
+
+
+def compile_template(source: str, components: dict) -> CompiledFormat:
+    """Compile a single unconditional template"""
+    return CompiledFormat([(source, None)], "", components)
+
+
+def _prompt_text(prompt):
+    return prompt
+
+
+# Compiled enhancement rewrites, keyed by focus; render(original_prompt)
+ENHANCEMENT_PROMPTS = _frozen({
+    focus: compile_template(template["template"], {"prompt": _prompt_text})
+    for focus, template in ENHANCEMENT_TEMPLATES.items()
+})
@@ -1,28 +1,110 @@
 import os
 import json
 import base64
+import hashlib
+import hmac
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+try:
+    import fcntl  # advisory locking between worker processes (POSIX only)
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# Derived encryption keys are cached in-process for this many seconds so
+# repeated unlocks skip the 100,000-iteration PBKDF2 run.
+KEY_CACHE_TTL_SECONDS = float(os.environ.get("API_KEY_CACHE_TTL", "300"))
+KEY_CACHE_MAX_ENTRIES = 16
 
 
 class SecureAPIKeyManager:
-    def __init__(self, config_dir: str = ".secure_config"):
+    def __init__(self, config_dir: str = ".secure_config", key_cache_ttl: float = KEY_CACHE_TTL_SECONDS):
         self.config_dir = Path(config_dir)
         self.config_dir.mkdir(exist_ok=True)
         self.key_file = self.config_dir / "api_keys.enc"
         self.salt_file = self.config_dir / "salt.key"
-
-    def _generate_key_from_password(self, password: str) -> bytes:
-        """Generate encryption key from password."""
-        if self.salt_file.exists():
-            with open(self.salt_file, "rb") as f:
-                salt = f.read()
-        else:
+        self.lock_file = self.config_dir / "api_keys.lock"
+
+        self.key_cache_ttl = key_cache_ttl
+        # HMAC(secret, salt + password) -> (expires_at, derived key). The
+        # per-process secret keeps cache keys useless for offline guessing.
+        self._key_cache: dict[str, tuple[float, bytearray]] = {}
+        self._cache_secret = os.urandom(32)
+        self._cache_lock = threading.Lock()
+        self._salt: bytes | None = None
+        self._salt_signature = None
+        self._key_file_signature = None
+        # (key file signature, key id, decrypted keys) from the last read or write
+        self._snapshot = None
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _file_signature(path: Path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def invalidate_key_cache(self) -> None:
+        """Forget all cached derived keys, zeroing the key material."""
+        with self._cache_lock:
+            self._clear_key_cache()
+
+    def _clear_key_cache(self) -> None:
+        for _, derived in self._key_cache.values():
+            derived[:] = bytes(len(derived))
+        self._key_cache.clear()
+        self._snapshot = None
+
+    def _evict_key(self, cache_key: str) -> None:
+        _, derived = self._key_cache.pop(cache_key)
+        derived[:] = bytes(len(derived))
+
+    def _load_salt(self) -> bytes:
+        """Return the salt, dropping cached keys if the salt or key file changed."""
+        signature = self._file_signature(self.salt_file)
+        if signature is None:
             salt = os.urandom(16)
             with open(self.salt_file, "wb") as f:
                 f.write(salt)
+            signature = self._file_signature(self.salt_file)
+            self._clear_key_cache()
+        elif signature != self._salt_signature or self._salt is None:
+            with open(self.salt_file, "rb") as f:
+                salt = f.read()
+            self._clear_key_cache()
+        else:
+            salt = self._salt
+        self._salt = salt
+        self._salt_signature = signature
+
+        key_file_signature = self._file_signature(self.key_file)
+        if key_file_signature != self._key_file_signature:
+            # Another process rewrote the store; it may use a new password
+            self._clear_key_cache()
+            self._key_file_signature = key_file_signature
+        return salt
+
+    def _derive_key(self, password: str) -> tuple[bytes, str]:
+        """Return (Fernet key, cache id) for a password, reusing a recently derived key."""
+        with self._cache_lock:
+            salt = self._load_salt()
+            key_id = hmac.new(self._cache_secret, salt + password.encode(), hashlib.sha256).hexdigest()
+
+            now = time.monotonic()
+            for stale in [k for k, (expires_at, _) in self._key_cache.items() if expires_at <= now]:
+                self._evict_key(stale)
+
+            entry = self._key_cache.get(key_id)
+            if entry is not None:
+                return bytes(entry[1]), key_id
 
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
@@ -30,31 +112,92 @@ class SecureAPIKeyManager:
             salt=salt,
             iterations=100000,
         )
-        return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
 
-    def store_api_key(self, service_name: str, api_key: str, password: str) -> bool:
-        """Store API key encrypted with password."""
-        try:
-            key = self._generate_key_from_password(password)
-            cipher_suite = Fernet(key)
+        with self._cache_lock:
+            if salt == self._salt and self.key_cache_ttl > 0:
+                while len(self._key_cache) >= KEY_CACHE_MAX_ENTRIES:
+                    self._evict_key(next(iter(self._key_cache)))
+                self._key_cache[key_id] = (time.monotonic() + self.key_cache_ttl, bytearray(key))
+        return key, key_id
 
-            keys_data = {}
-            if self.key_file.exists():
-                try:
-                    with open(self.key_file, "rb") as f:
-                        encrypted_data = f.read()
-                    decrypted_data = cipher_suite.decrypt(encrypted_data)
-                    keys_data = json.loads(decrypted_data.decode())
-                except Exception:
-                    keys_data = {}
+    def _generate_key_from_password(self, password: str) -> bytes:
+        """Generate encryption key from password."""
+        return self._derive_key(password)[0]
+
+    def _read_keys(self, key: bytes, key_id: str) -> dict:
+        """Return the decrypted key store.
 
-            keys_data[service_name] = api_key
+        While the file's inode, mtime and size are unchanged the last
+        decrypted snapshot is returned, so lookups are dictionary reads.
+        """
+        signature = self._file_signature(self.key_file)
+        with self._cache_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot[0] == signature and snapshot[1] == key_id:
+                return dict(snapshot[2])
 
-            json_data = json.dumps(keys_data).encode()
-            encrypted_data = cipher_suite.encrypt(json_data)
+        with open(self.key_file, "rb") as f:
+            # Take the signature of the file actually read; writers replace it atomically
+            st = os.fstat(f.fileno())
+            encrypted_data = f.read()
 
-            with open(self.key_file, "wb") as f:
+        decrypted_data = Fernet(key).decrypt(encrypted_data)
+        keys_data = json.loads(decrypted_data.decode())
+
+        with self._cache_lock:
+            self._snapshot = ((st.st_ino, st.st_mtime_ns, st.st_size), key_id, keys_data)
+        return dict(keys_data)
+
+    def _write_keys(self, keys_data: dict, key: bytes, key_id: str) -> None:
+        """Encrypt and atomically replace the key file. Call with _locked_store held."""
+        encrypted_data = Fernet(key).encrypt(json.dumps(keys_data).encode())
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.config_dir, prefix=".api_keys.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
                 f.write(encrypted_data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.key_file)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        signature = self._file_signature(self.key_file)
+        with self._cache_lock:
+            # Our own write must not invalidate the derived-key cache
+            self._key_file_signature = signature
+            self._snapshot = (signature, key_id, dict(keys_data))
+
+    @contextmanager
+    def _locked_store(self):
+        """Serialize read-modify-write cycles across threads and worker processes."""
+        with self._write_lock:
+            with open(self.lock_file, "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def store_api_key(self, service_name: str, api_key: str, password: str) -> bool:
+        """Store API key encrypted with password."""
+        try:
+            with self._locked_store():
+                key, key_id = self._derive_key(password)
+
+                keys_data = {}
+                if self.key_file.exists():
+                    try:
+                        keys_data = self._read_keys(key, key_id)
+                    except Exception:
+                        keys_data = {}
+
+                keys_data[service_name] = api_key
+                self._write_keys(keys_data, key, key_id)
 
             print(f"[OK] {service_name} API key stored securely!")
             return True
@@ -78,14 +221,7 @@ class SecureAPIKeyManager:
                 if not password:
                     return None
 
-            key = self._generate_key_from_password(password)
-            cipher_suite = Fernet(key)
-
-            with open(self.key_file, "rb") as f:
-                encrypted_data = f.read()
-
-            decrypted_data = cipher_suite.decrypt(encrypted_data)
-            keys_data = json.loads(decrypted_data.decode())
+            keys_data = self._read_keys(*self._derive_key(password))
 
             return keys_data.get(service_name)
 
@@ -99,14 +235,7 @@ class SecureAPIKeyManager:
             if not self.key_file.exists():
                 return []
 
-            key = self._generate_key_from_password(password)
-            cipher_suite = Fernet(key)
-
-            with open(self.key_file, "rb") as f:
-                encrypted_data = f.read()
-
-            decrypted_data = cipher_suite.decrypt(encrypted_data)
-            keys_data = json.loads(decrypted_data.decode())
+            keys_data = self._read_keys(*self._derive_key(password))
 
             return list(keys_data.keys())
 
@@ -120,29 +249,19 @@ class SecureAPIKeyManager:
             if not self.key_file.exists():
                 return False
 
-            key = self._generate_key_from_password(password)
-            cipher_suite = Fernet(key)
+            with self._locked_store():
+                key, key_id = self._derive_key(password)
+                keys_data = self._read_keys(key, key_id)
 
-            with open(self.key_file, "rb") as f:
-                encrypted_data = f.read()
+                if service_name not in keys_data:
+                    print(f"[WARN] {service_name} not found in stored keys")
+                    return False
 
-            decrypted_data = cipher_suite.decrypt(encrypted_data)
-            keys_data = json.loads(decrypted_data.decode())
-
-            if service_name in keys_data:
                 del keys_data[service_name]
+                self._write_keys(keys_data, key, key_id)
 
-                json_data = json.dumps(keys_data).encode()
-                encrypted_data = cipher_suite.encrypt(json_data)
-
-                with open(self.key_file, "wb") as f:
-                    f.write(encrypted_data)
-
-                print(f"[OK] {service_name} API key deleted!")
-                return True
-            else:
-                print(f"[WARN] {service_name} not found in stored keys")
-                return False
+            print(f"[OK] {service_name} API key deleted!")
+            return True
 
         except Exception as e:
             print(f"[ERROR] Error deleting API key: {e}")
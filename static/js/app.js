@@ -2,6 +2,8 @@ class UGCStudio {
     constructor() {
         this.currentTab = 'product';
         this.analysisData = null;
+        // Server-side handle for analysisData, sent to /generate in its place
+        this.analysisHandle = null;
         this.actorData = null;
         this.locationData = null;
         this.sceneData = null;
@@ -466,10 +468,7 @@ class UGCStudio {
             img.style.opacity = '0.5';
             img.style.filter = 'blur(5px)';
 
-            // Create a new image to preload
-            const imageLoader = new Image();
-            imageLoader.onload = () => {
-                img.src = src;
+            const loaded = () => {
                 img.removeAttribute('data-src');
                 img.classList.add('loaded');
 
@@ -478,15 +477,58 @@ class UGCStudio {
                 img.style.opacity = '1';
                 img.style.filter = 'none';
             };
-            imageLoader.onerror = () => {
+            const failed = () => {
                 img.style.opacity = '1';
                 img.style.filter = 'none';
                 img.alt = 'Image failed to load';
             };
+
+            const picture = img.parentElement?.tagName === 'PICTURE' ? img.parentElement : null;
+            if (picture) {
+                // Responsive image: hand the candidates to the browser, which
+                // fetches only the one matching the format support and density
+                img.addEventListener('load', loaded, { once: true });
+                img.addEventListener('error', failed, { once: true });
+                picture.querySelectorAll('source[data-srcset]').forEach(source => {
+                    source.srcset = source.dataset.srcset;
+                    source.removeAttribute('data-srcset');
+                });
+                img.src = src;
+                return;
+            }
+
+            // Create a new image to preload
+            const imageLoader = new Image();
+            imageLoader.onload = () => {
+                img.src = src;
+                loaded();
+            };
+            imageLoader.onerror = failed;
             imageLoader.src = src;
         }
     }
 
+    // Markup for a picker image: a <picture> over the variants listed in the
+    // asset manifest (see build_assets.py), or the original file if the
+    // image has none. Loaded lazily through loadImage().
+    responsiveImage(src, alt, className, manifest, sizes = '120px') {
+        const entry = manifest?.images?.[src];
+        const variants = entry ? Object.entries(entry.variants) : [];
+        const placeholder = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='92' height='180' viewBox='0 0 92 180'%3E%3Crect width='92' height='180' fill='%23334155'/%3E%3Ctext x='50%25' y='50%25' font-family='Arial' font-size='12' fill='%23cbd5e1' text-anchor='middle' dominant-baseline='middle'%3ELoading...%3C/text%3E%3C/svg%3E";
+        if (!variants.length) {
+            return `<img data-src="${src}" alt="${alt}" class="${className} lazy-image" src="${placeholder}">`;
+        }
+
+        const sources = variants.map(([type, list]) => `
+            <source type="${type}" sizes="${sizes}" data-srcset="${list.map(v => `${v.src} ${v.width}w`).join(', ')}">`).join('');
+        // The <img> itself gets the 1x variant of the most widely supported
+        // format; the browser swaps in the <source> candidate it prefers
+        const fallback = variants[variants.length - 1][1][0];
+        return `<picture>${sources}
+            <img data-src="${fallback.src}" alt="${alt}" class="${className} lazy-image" src="${placeholder}" width="${fallback.width}" height="${fallback.height}" loading="lazy" decoding="async">
+        </picture>`;
+    }
+
     observeLazyImages() {
         if (this.lazyImageObserver) {
             const lazyImages = document.querySelectorAll('img[data-src]');
@@ -630,13 +672,13 @@ class UGCStudio {
             return;
         }
 
-        const actorData = await this.getActorData();
+        const [actorData, manifest] = await Promise.all([this.getActorData(), this.getImageManifest()]);
         console.log('Actor data loaded:', actorData.length, 'actors');
 
         const cardsHTML = actorData.map(actor => `
             <div class="option-card ${actor.name === 'Jake' ? 'active' : ''}" data-value="${actor.name}">
                 <div class="actor-image-container">
-                    <img data-src="${actor.image}" alt="${actor.name} - ${actor.role}" class="actor-image lazy-image" src="data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='92' height='180' viewBox='0 0 92 180'%3E%3Crect width='92' height='180' fill='%23334155'/%3E%3Ctext x='50%25' y='50%25' font-family='Arial' font-size='12' fill='%23cbd5e1' text-anchor='middle' dominant-baseline='middle'%3ELoading...%3C/text%3E%3C/svg%3E">
+                    ${this.responsiveImage(actor.image, `${actor.name} - ${actor.role}`, 'actor-image', manifest)}
                 </div>
                 <div class="content">
                     <div class="actor-name">${actor.name}</div>
@@ -1118,26 +1160,15 @@ class UGCStudio {
             return;
         }
 
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            this.analyzeScene(e.target.result);
-        };
-        reader.readAsDataURL(file);
+        // Downscaled in a worker, then sent as the raw request body
+        this.prepareUpload(file, 'scene').then(upload => this.analyzeScene(upload));
     }
 
-    analyzeScene(imageData) {
+    analyzeScene(file) {
         this.showLoading('Analyzing your scene...');
 
-        fetch('/analyze-scene', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image: imageData
-            })
-        })
-        .then(response => response.json())
+        // Streamed so the overlay can show the description as it is written
+        this.streamRequest('/analyze-scene-stream', file, text => this.showLoadingPreview(text))
         .then(data => {
             this.hideLoading();
             if (data.success) {
@@ -1282,26 +1313,15 @@ class UGCStudio {
             return;
         }
 
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            this.analyzeActor(e.target.result);
-        };
-        reader.readAsDataURL(file);
+        // Downscaled in a worker, then sent as the raw request body
+        this.prepareUpload(file, 'actor').then(upload => this.analyzeActor(upload));
     }
 
-    analyzeActor(imageData) {
+    analyzeActor(file) {
         this.showLoading('Analyzing actor image...');
 
-        fetch('/analyze-actor', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image: imageData
-            })
-        })
-        .then(response => response.json())
+        // Streamed so the overlay can show the description as it is written
+        this.streamRequest('/analyze-actor-stream', file, text => this.showLoadingPreview(text))
         .then(data => {
             this.hideLoading();
             if (data.success) {
@@ -1389,30 +1409,20 @@ class UGCStudio {
             return;
         }
 
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            this.analyzeImage(e.target.result);
-        };
-        reader.readAsDataURL(file);
+        // Downscaled in a worker, then sent as the raw request body
+        this.prepareUpload(file, 'product').then(upload => this.analyzeImage(upload));
     }
 
-    analyzeImage(imageData) {
+    analyzeImage(file) {
         this.showLoading('Analyzing your product image...');
 
-        fetch('/analyze', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image: imageData
-            })
-        })
-        .then(response => response.json())
+        // Streamed so the overlay can show the description as it is written
+        this.streamRequest('/analyze-stream', file, text => this.showLoadingPreview(text))
         .then(data => {
             this.hideLoading();
             if (data.success) {
                 this.analysisData = data.analysis;
+                this.analysisHandle = data.analysis_handle || null;
                 this.displayAnalysisResults(data.analysis);
                 this.populateFormFromAnalysis(data.analysis);
                 this.showToast('Product analysis complete! 🎉', 'success');
@@ -1482,6 +1492,7 @@ class UGCStudio {
             return;
         }
 
+        this.analysisHandle = null;
         this.analysisData = {
             product_name: productName,
             product_type: 'Manual Entry',
@@ -1597,6 +1608,24 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
         return { prompt: prompt };
     }
 
+    // The server's template prompt for the current analysis and options
+    async requestServerPrompt() {
+        const data = await this.postWithHandle('/generate', {
+            settings: {
+                product: document.getElementById('product-name')?.value || this.analysisData?.product_name || '',
+                ugc_type: this.selectedOptions.contentType,
+                hook_type: this.selectedOptions.hookStrategy,
+                custom_hook: document.getElementById('custom-message')?.value || '',
+                setting: this.selectedOptions.location,
+                lighting: this.selectedOptions.lighting,
+                camera_movement: this.selectedOptions.cameraStyle
+            }
+        }, 'analysis_handle', this.analysisHandle, { analysis: this.analysisData });
+
+        if (!data.success) throw new Error(data.error || 'Prompt generation failed');
+        return data.prompt;
+    }
+
     async getSettingDescription() {
         // If custom scene is selected and we have scene data, use that
         if (this.selectedOptions.location === 'custom_scene' && this.sceneData?.scene_description) {
@@ -1656,9 +1685,174 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
         const text = overlay?.querySelector('.loading-text');
 
         if (text) text.textContent = message;
+        this.showLoadingPreview('');
         if (overlay) overlay.style.display = 'flex';
     }
 
+    showLoadingPreview(text) {
+        const preview = document.querySelector('#loading-overlay .loading-preview');
+        if (!preview) return;
+
+        // Only the most recent text fits in the overlay
+        preview.textContent = text.length > 240 ? '…' + text.slice(-240) : text;
+        preview.style.display = text ? 'block' : 'none';
+    }
+
+    // Upload settings published by the server (target sizes per analysis
+    // kind, upload format), fetched once
+    getCapabilities() {
+        if (!this.capabilitiesRequest) {
+            this.capabilitiesRequest = fetch('/api/capabilities')
+                .then(response => response.ok ? response.json() : null)
+                .catch(() => null);
+        }
+        return this.capabilitiesRequest;
+    }
+
+    // Downscale an image to the server's target size for the analysis kind
+    // and re-encode it in a Web Worker, so a multi-megabyte phone photo
+    // uploads as a few hundred kilobytes without blocking the page. Resolves
+    // with the original file where workers or OffscreenCanvas are missing.
+    async prepareUpload(file, kind) {
+        const capabilities = await this.getCapabilities();
+        const maxSide = capabilities?.target_sizes?.[kind];
+        if (!maxSide || typeof Worker === 'undefined' || typeof OffscreenCanvas === 'undefined') {
+            return file;
+        }
+
+        try {
+            return await this.runImageWorker({
+                file,
+                maxSide,
+                type: capabilities.upload_type,
+                quality: capabilities.upload_quality
+            });
+        } catch (error) {
+            console.warn('Client-side downscale failed, uploading the original image', error);
+            return file;
+        }
+    }
+
+    runImageWorker(message) {
+        if (!this.imageWorker) {
+            this.imageWorker = new Worker('/static/js/image-worker.js');
+            this.imageWorkerJobs = new Map();
+            this.imageWorkerNextId = 0;
+            this.imageWorker.onmessage = (event) => {
+                const { id, blob, error } = event.data;
+                const job = this.imageWorkerJobs.get(id);
+                if (!job) return;
+                this.imageWorkerJobs.delete(id);
+                if (error) {
+                    job.reject(new Error(error));
+                } else {
+                    job.resolve(blob);
+                }
+            };
+        }
+
+        const id = this.imageWorkerNextId++;
+        return new Promise((resolve, reject) => {
+            this.imageWorkerJobs.set(id, { resolve, reject });
+            this.imageWorker.postMessage({ id, ...message });
+        });
+    }
+
+    // Random id for this browser tab, sent with API calls so the server's
+    // usage ledger can total the OpenAI spend per session
+    sessionId() {
+        if (!this.usageSessionId) {
+            try {
+                this.usageSessionId = sessionStorage.getItem('ugcSessionId');
+                if (!this.usageSessionId) {
+                    this.usageSessionId = crypto.randomUUID();
+                    sessionStorage.setItem('ugcSessionId', this.usageSessionId);
+                }
+            } catch (error) {
+                // sessionStorage is unavailable in some private modes
+                this.usageSessionId = this.usageSessionId || crypto.randomUUID();
+            }
+        }
+        return this.usageSessionId;
+    }
+
+    // POST to a server-sent-events route and resolve with its final
+    // "result" payload. onDelta gets the text generated so far on each event.
+    // body is sent as JSON, or as the raw request body if it is a Blob (such
+    // as an uploaded File).
+    async streamRequest(url, body, onDelta) {
+        const isBlob = body instanceof Blob;
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': isBlob ? (body.type || 'application/octet-stream') : 'application/json',
+                'X-Session-Id': this.sessionId(),
+            },
+            body: isBlob ? body : JSON.stringify(body)
+        });
+
+        // Validation errors and overload come back as plain JSON
+        if (!(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+            return response.json();
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let result = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const event = (raw.match(/^event: (.*)$/m) || [])[1];
+                const data = (raw.match(/^data: (.*)$/m) || [])[1];
+                if (!data) continue;
+
+                const payload = JSON.parse(data);
+                if (event === 'delta') {
+                    text += payload.text;
+                    if (onDelta) onDelta(text);
+                } else if (event === 'reset') {
+                    // The server is rewriting the reply with a stronger model
+                    text = '';
+                    if (onDelta) onDelta(text);
+                } else if (event === 'result') {
+                    result = payload;
+                }
+            }
+        }
+
+        return result || { error: 'Connection closed before the analysis finished' };
+    }
+
+    // POST JSON that references server-side data by handle rather than
+    // sending it again. Without a handle, or when the server answers 404
+    // because the handle expired, the inline fields are sent instead.
+    async postWithHandle(url, body, handleField, handle, inline) {
+        const post = fields => fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Session-Id': this.sessionId(),
+            },
+            body: JSON.stringify({ ...body, ...fields })
+        });
+
+        if (handle) {
+            const response = await post({ [handleField]: handle });
+            if (response.status !== 404) return response.json();
+        }
+        return (await post(inline)).json();
+    }
+
     hideLoading() {
         const overlay = document.getElementById('loading-overlay');
         if (overlay) overlay.style.display = 'none';
@@ -1698,6 +1892,20 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
         return data.camera;
     }
 
+    async getImageManifest() {
+        if (this.imageManifest === undefined) {
+            try {
+                const response = await fetch('/static/data/image-manifest.json');
+                this.imageManifest = response.ok ? await response.json() : null;
+            } catch (error) {
+                // Without a manifest the picker falls back to the original images
+                console.error('Error loading image manifest:', error);
+                this.imageManifest = null;
+            }
+        }
+        return this.imageManifest;
+    }
+
     async getActorData() {
         if (!this.actorData) {
             try {
@@ -1918,30 +2126,19 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
             uploadZone.classList.add('uploading');
         }
 
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            this.analyzeImage(e.target.result);
-        };
-        reader.readAsDataURL(file);
+        // Downscaled in a worker, then sent as the raw request body
+        this.prepareUpload(file, 'product').then(upload => this.analyzeImage(upload));
     }
 
     // Enhanced image analysis with better feedback
-    analyzeImage(imageData) {
+    analyzeImage(file) {
         this.showLoading('Analyzing your product image...');
         
         const analyzeBtn = document.querySelector('.upload-zone');
         this.setButtonState(analyzeBtn, 'loading');
 
-        fetch('/analyze', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                image: imageData
-            })
-        })
-        .then(response => response.json())
+        // Streamed so the overlay can show the description as it is written
+        this.streamRequest('/analyze-stream', file, text => this.showLoadingPreview(text))
         .then(data => {
             this.hideLoading();
             
@@ -1953,6 +2150,7 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
             
             if (data.success) {
                 this.analysisData = data.analysis;
+                this.analysisHandle = data.analysis_handle || null;
                 this.displayAnalysisResults(data.analysis);
                 this.populateFormFromAnalysis(data.analysis);
                 this.setButtonState(analyzeBtn, 'success');
@@ -1996,8 +2194,10 @@ No Subtitles. Audio: clear voice, faint room tone only.`;
         this.showLoading('Generating your UGC prompt...');
 
         try {
-            // Generate prompt using pure template logic (no backend call)
-            const promptData = await this.buildPromptFromTemplate();
+            // Generate prompt using pure template logic, or the server's
+            // templates when the page's own data files failed to load
+            const promptData = await this.buildPromptFromTemplate()
+                .catch(() => this.requestServerPrompt());
 
             this.hideLoading();
             this.setButtonState(generateBtn, 'success');
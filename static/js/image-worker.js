@@ -0,0 +1,43 @@
+// Downscales and re-encodes images off the main thread before upload.
+//
+// Message in:  { id, file, maxSide, type, quality }
+// Message out: { id, blob } with the image to upload, or { id, error }
+//
+// The image is scaled so its longest side is at most maxSide (the server's
+// target size for the analysis kind) and encoded as `type`. EXIF orientation
+// is applied while decoding, and transparency is flattened onto white, as
+// the server normalizer does.
+
+self.onmessage = async (event) => {
+    const { id, file, maxSide, type, quality } = event.data;
+
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, maxSide / Math.max(bitmap.width, bitmap.height));
+
+        // Already small enough and in the upload format: send it untouched
+        if (scale === 1 && file.type === type) {
+            bitmap.close();
+            self.postMessage({ id, blob: file });
+            return;
+        }
+
+        const width = Math.max(1, Math.round(bitmap.width * scale));
+        const height = Math.max(1, Math.round(bitmap.height * scale));
+        const canvas = new OffscreenCanvas(width, height);
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingEnabled = true;
+        ctx.imageSmoothingQuality = 'high';
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(0, 0, width, height);
+        ctx.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+
+        const blob = await canvas.convertToBlob({ type, quality });
+
+        // Re-encoding a small, already compressed image can make it larger
+        self.postMessage({ id, blob: blob.size < file.size || scale < 1 ? blob : file });
+    } catch (error) {
+        self.postMessage({ id, error: String(error) });
+    }
+};
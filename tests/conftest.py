@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# Keep the tests from writing a usage ledger; set before the app modules import
+os.environ["USAGE_LEDGER_DB"] = ""
+
+# The app is a set of top-level modules, importable from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,30 @@
+import pytest
+
+from app import app
+
+ADMIN_PATHS = ["/api/usage", "/api/usage/entries", "/api/pool-stats", "/metrics"]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.mark.parametrize("path", ADMIN_PATHS)
+def test_closed_without_admin_token_even_from_loopback(client, monkeypatch, path):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+
+    response = client.get(path, environ_base={"REMOTE_ADDR": "127.0.0.1"},
+                          headers={"X-Forwarded-For": "203.0.113.7"})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("path", ADMIN_PATHS)
+def test_requires_the_bearer_token(client, monkeypatch, path):
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.get(path, headers={"Authorization": "Bearer s3crët"}).status_code == 403
+    assert client.get(path, headers={"Authorization": "Bearer s3cret"}).status_code == 200
@@ -0,0 +1,45 @@
+import pytest
+
+from analysis_store import AnalysisStore, UnknownHandle
+from app import app
+
+ANALYSIS = {"product_name": "Sneaker", "detailed_description": "A white leather sneaker with a navy logo."}
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_handles_are_content_hashes_of_kind_and_value():
+    store = AnalysisStore()
+    handle = store.put("product", ANALYSIS)
+
+    assert store.put("product", dict(ANALYSIS)) == handle
+    assert store.get(handle, "product") == ANALYSIS
+    with pytest.raises(UnknownHandle):
+        store.get(handle, "prompt")
+
+
+def test_handles_are_shared_through_the_database(tmp_path):
+    db_path = str(tmp_path / "handles.db")
+    handle = AnalysisStore(db_path=db_path).put("product", ANALYSIS)
+
+    assert AnalysisStore(db_path=db_path).get(handle, "product") == ANALYSIS
+
+
+def test_generate_stores_the_prompt_only_when_asked(client):
+    plain = client.post("/generate", json={"settings": {}, "analysis": ANALYSIS}).get_json()
+    assert plain["success"] and "prompt_handle" not in plain
+
+    stored = client.post("/generate", json={"settings": {}, "analysis": ANALYSIS, "store_prompt": True}).get_json()
+    enhanced = client.post("/enhance-prompt", json={"prompt_handle": stored["prompt_handle"]}).get_json()
+
+    assert enhanced["success"]
+    assert stored["prompt"]["prompt"] in enhanced["enhancement"]["enhanced_prompt"]
+
+
+def test_unknown_analysis_handle_is_a_404(client):
+    response = client.post("/generate", json={"settings": {}, "analysis_handle": "0" * 24})
+
+    assert response.status_code == 404
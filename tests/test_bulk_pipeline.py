@@ -0,0 +1,38 @@
+import json
+import time
+
+import pytest
+
+import bulk_pipeline
+
+
+def test_ctrl_c_writes_the_analyses_already_running(tmp_path, monkeypatch):
+    started = []
+
+    def process_image(job, base_settings, grid):
+        started.append(job['id'])
+        time.sleep(job['seconds'])
+        return {'id': job['id'], 'analysis': {'product_name': job['id']}}
+
+    real_wait = bulk_pipeline.wait
+    waits = []
+
+    def wait(*args, **kwargs):
+        # Ctrl-C arrives while the second wait is blocked
+        waits.append(1)
+        if len(waits) == 2:
+            time.sleep(0.05)
+            raise KeyboardInterrupt
+        return real_wait(*args, **kwargs)
+
+    monkeypatch.setattr(bulk_pipeline, 'process_image', process_image)
+    monkeypatch.setattr(bulk_pipeline, 'wait', wait)
+    jobs = [{'id': f'img{i}', 'seconds': 0.01 if i == 0 else 0.2} for i in range(5)]
+    out_path = tmp_path / 'out.jsonl'
+
+    with pytest.raises(KeyboardInterrupt):
+        bulk_pipeline.run(jobs, out_path, {}, {}, 2, bulk_pipeline.Progress(len(jobs), 60))
+
+    written = [json.loads(line)['id'] for line in out_path.read_text().splitlines()]
+    assert sorted(written) == sorted(started) == ['img0', 'img1', 'img2']
+    assert bulk_pipeline.load_checkpoint(out_path) == {'img0', 'img1', 'img2'}
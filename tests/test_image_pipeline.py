@@ -0,0 +1,71 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageCms
+
+from image_pipeline import _strip_jpeg_metadata, normalize_image
+
+ICC_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+
+def exif_with_gps():
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[0x0112] = 1
+    gps = exif.get_ifd(0x8825)
+    gps[1] = "N"
+    gps[2] = (52.0, 31.0, 12.0)
+    return exif.tobytes()
+
+
+def photo(mode="RGB", size=(320, 240)):
+    img = Image.new("RGB", size)
+    img.putdata([(x % 256, y % 256, (x * y) % 256) for y in range(size[1]) for x in range(size[0])])
+    return img.convert(mode)
+
+
+def encode(img, **params):
+    out = BytesIO()
+    img.save(out, "JPEG", quality=90, **params)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+@pytest.mark.parametrize("params", [
+    {},
+    {"progressive": True},
+    {"restart_marker_blocks": 1},
+    {"icc_profile": ICC_PROFILE, "comment": b"shot at home"},
+], ids=["baseline", "progressive", "restarts", "icc"])
+def test_fast_path_strips_metadata_and_keeps_pixels(mode, params):
+    original = encode(photo(mode), exif=exif_with_gps(), xmp=b"<x:xmpmeta>GPSLatitude</x:xmpmeta>", **params)
+
+    normalized, stats = normalize_image(original, "product")
+
+    with Image.open(BytesIO(original)) as before, Image.open(BytesIO(normalized)) as after:
+        assert after.tobytes() == before.tobytes()
+        assert len(after.getexif()) == 0
+        assert "xmp" not in after.info and "comment" not in after.info
+        assert after.info.get("icc_profile") == before.info.get("icc_profile")
+    assert b"PhoneMaker" not in normalized and b"GPS" not in normalized
+    assert stats["bytes_saved"] == len(original) - len(normalized) > 0
+
+
+def test_reencoded_images_carry_no_exif():
+    original = encode(photo(size=(1600, 1200)), exif=exif_with_gps())
+
+    normalized, stats = normalize_image(original, "product")
+
+    assert stats["normalized_size"] == [1024, 768]
+    assert b"PhoneMaker" not in normalized
+    with Image.open(BytesIO(normalized)) as img:
+        assert len(img.getexif()) == 0
+
+
+def test_strip_drops_trailing_data_and_rejects_truncated_files():
+    data = encode(photo())
+
+    assert _strip_jpeg_metadata(data) == data
+    assert _strip_jpeg_metadata(data + b"\xff\xd8second image") == data
+    assert _strip_jpeg_metadata(data[:-10]) is None
+    assert _strip_jpeg_metadata(b"not a jpeg") is None
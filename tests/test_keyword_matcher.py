@@ -0,0 +1,61 @@
+import pytest
+
+from keyword_matcher import KeywordMatcher
+from openai_service import DESCRIPTION_KEYWORDS
+
+
+def found(text, matcher=DESCRIPTION_KEYWORDS):
+    return set(matcher.scan(text).positions)
+
+
+@pytest.mark.parametrize("text, keywords", [
+    ("A white sneaker", {"white", "sneaker"}),
+    ("Two SNEAKERS on a Table", {"sneaker", "table"}),
+    ("Running shoes", {"shoe"}),
+    ("Reading glasses", {"glass"}),
+    ("A wooden floor", {"wooden", "floor"}),
+    ("A metallic finish", {"metallic"}),
+    ("Brushed metal and wood", {"metal", "wood"}),
+    ("A navy-blue logo", {"navy", "blue", "logo"}),
+    ("high-quality leather, premium feel.", {"high-quality", "leather", "premium"}),
+])
+def test_whole_words_and_plurals_match(text, keywords):
+    assert found(text) == keywords
+
+
+@pytest.mark.parametrize("text", [
+    "An important detail",  # tan
+    "A textured finish",  # text, red
+    "A sneakerhead favourite",  # sneaker
+    "Tanks and credits",  # tan, red
+    "Blueberry goldfish",  # blue, gold
+    "Woodland metalwork",  # wood, metal
+])
+def test_keywords_inside_other_words_do_not_match(text):
+    assert found(text) == set()
+
+
+def test_wooden_and_metallic_do_not_count_as_wood_and_metal():
+    hits = DESCRIPTION_KEYWORDS.scan("A wooden table with metallic legs")
+
+    assert "wooden" in hits and "metallic" in hits
+    assert "wood" not in hits and "metal" not in hits
+
+
+def test_plurals_can_be_turned_off():
+    matcher = KeywordMatcher({"things": ["shoe", "glass"]}, plurals=False)
+
+    assert found("shoe and glass", matcher) == {"shoe", "glass"}
+    assert found("shoes and glasses", matcher) == set()
+
+
+def test_positions_and_priority():
+    matcher = KeywordMatcher({"color": ["white", "black", "red"], "material": ["Leather"]})
+    hits = matcher.scan("Red leather, black sole, red laces")
+
+    assert hits.positions == {"red": [0, 25], "leather": [4], "black": [13]}
+    # Table order wins over text order
+    assert hits.first("color") == "black"
+    assert hits.in_category("color") == [(0, "red"), (13, "black"), (25, "red")]
+    assert hits.any("white", "leather") and not hits.any("white")
+    assert not matcher.scan("Nothing here")
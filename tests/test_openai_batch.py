@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import openai_batch
+import openai_service
+
+
+def batch_result(content):
+    return {"response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}}
+
+
+@pytest.fixture
+def merge(monkeypatch):
+    monkeypatch.setattr(openai_batch.usage_ledger, "record", lambda *args, **kwargs: None)
+    monkeypatch.setattr(openai_service, "ESCALATION_MODEL", "gpt-4o")
+    openai_service.analysis_cache.clear()
+
+    def merge(model, content):
+        job = {"kind": "product", "model": model}
+        entry = {"cache_key": f"key-{model}", "normalization": {}, "image_hash": None, "image_colors": None}
+        analysis, meta = openai_batch._merge_result(job, {"id": "batch_1", "status": "completed"}, entry,
+                                                    batch_result(content))
+        return analysis, meta, openai_service.analysis_cache.get(entry["cache_key"])
+
+    return merge
+
+
+COMPLETE = json.dumps({"detailed_description": "A white sneaker", "product_name": "Sneaker",
+                       "product_type": "footwear"})
+MISSING_KEYS = json.dumps({"detailed_description": "A white sneaker", "product_name": "Sneaker"})
+
+
+def test_complete_reply_is_cached(merge):
+    analysis, meta, cached = merge("gpt-4o-mini", COMPLETE)
+
+    assert analysis == cached == json.loads(COMPLETE)
+    assert "error" not in meta
+
+
+def test_reply_the_sync_path_would_escalate_is_an_uncached_error(merge):
+    analysis, meta, cached = merge("gpt-4o-mini", MISSING_KEYS)
+
+    assert analysis == {} and cached is None
+    assert "missing_keys" in meta["error"]
+
+
+def test_reply_from_the_escalation_model_is_kept(merge):
+    analysis, _, cached = merge("gpt-4o", MISSING_KEYS)
+
+    assert analysis == cached == json.loads(MISSING_KEYS)
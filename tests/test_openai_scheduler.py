@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from openai_scheduler import RequestScheduler, SchedulerOverloaded
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def slow_failure_then(result, seconds):
+    """A send() whose first attempt fails retryably after seconds, and whose second returns result"""
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            time.sleep(seconds)
+            raise connection_error()
+        return result
+
+    return send, attempts
+
+
+def test_retry_within_the_deadline_is_admitted():
+    scheduler = RequestScheduler(max_queue_wait=5, base_delay=0.0)
+    send, attempts = slow_failure_then("ok", 0.01)
+    stats = {}
+
+    assert scheduler.call(send, estimated_tokens=10, stats=stats) == "ok"
+    assert len(attempts) == 2
+    assert stats["retries"] == 1
+    # Queue wait covers the first admission only, not the failed attempt
+    assert stats["queue_wait_ms"] < 50
+
+
+def test_retry_past_the_deadline_is_overloaded():
+    scheduler = RequestScheduler(max_queue_wait=0.05, base_delay=0.0)
+    send, attempts = slow_failure_then("ok", 0.1)
+    stats = {}
+
+    with pytest.raises(SchedulerOverloaded) as raised:
+        scheduler.call(send, estimated_tokens=10, stats=stats)
+    assert isinstance(raised.value.__cause__, openai.APIConnectionError)
+    assert len(attempts) == 1
+    assert stats["retries"] == 0
+
+
+def test_async_retry_past_the_deadline_is_overloaded():
+    scheduler = RequestScheduler(max_queue_wait=0.05, base_delay=0.0)
+    attempts = []
+
+    async def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            await asyncio.sleep(0.1)
+            raise connection_error()
+        return "ok"
+
+    with pytest.raises(SchedulerOverloaded):
+        asyncio.run(scheduler.acall(send, estimated_tokens=10))
+    assert len(attempts) == 1
+
+
+def test_backoff_past_the_deadline_is_overloaded(monkeypatch):
+    scheduler = RequestScheduler(max_queue_wait=1, base_delay=5.0)
+    monkeypatch.setattr("random.uniform", lambda low, high: high)
+    send, attempts = slow_failure_then("ok", 0)
+
+    started = time.monotonic()
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.call(send, estimated_tokens=10)
+    assert time.monotonic() - started < 0.5
+    assert len(attempts) == 1
+
+
+def test_non_retryable_error_is_raised_without_retry():
+    scheduler = RequestScheduler(base_delay=0.0)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call(send, estimated_tokens=10)
+    assert len(calls) == 1
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.0)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise connection_error()
+
+    stats = {}
+    with pytest.raises(openai.APIConnectionError):
+        scheduler.call(send, estimated_tokens=10, stats=stats)
+    assert len(calls) == 3
+    assert stats["retries"] == 2
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_holds_its_slot_until_closed():
+    scheduler = RequestScheduler(max_in_flight=1, max_queue_wait=0.05)
+    stream = scheduler.call(lambda: FakeStream(["a", "b"]), estimated_tokens=10, stream=True)
+
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.call(lambda: "second", estimated_tokens=10)
+
+    assert list(stream) == ["a", "b"]
+    stream.close()
+    assert stream.closed
+    assert scheduler.call(lambda: "second", estimated_tokens=10) == "second"
+
+
+def test_exhausted_stream_releases_its_slot_once():
+    scheduler = RequestScheduler(max_in_flight=1, max_queue_wait=0.05)
+    stream = scheduler.call(lambda: FakeStream(["a"]), estimated_tokens=10, stream=True)
+    list(stream)
+    # A close after exhaustion must not release the slot a second time
+    stream.close()
+    assert scheduler.call(lambda: "second", estimated_tokens=10) == "second"
+    with pytest.raises(ValueError):
+        scheduler._slots.release()
+
+
+def test_async_stream_holds_its_slot_until_closed():
+    class FakeAsyncStream:
+        def __init__(self):
+            self.closed = False
+
+        async def __aiter__(self):
+            for chunk in ("a", "b"):
+                yield chunk
+
+        async def close(self):
+            self.closed = True
+
+    async def run():
+        scheduler = RequestScheduler(max_in_flight=1, max_queue_wait=0.05)
+
+        async def open_stream():
+            return FakeAsyncStream()
+
+        async def plain():
+            return "second"
+
+        stream = await scheduler.acall(open_stream, estimated_tokens=10, stream=True)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acall(plain, estimated_tokens=10)
+        assert [chunk async for chunk in stream] == ["a", "b"]
+        await stream.close()
+        return await scheduler.acall(plain, estimated_tokens=10)
+
+    assert asyncio.run(run()) == "second"
@@ -0,0 +1,126 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import openai_service
+from perceptual_hash import NearDuplicateIndex, image_signature
+
+IMAGES = sorted((Path(__file__).resolve().parent.parent / "static" / "images").glob("*.png"))[:4]
+
+
+def encode(img, fmt="JPEG", **params):
+    out = BytesIO()
+    img.save(out, fmt, **params)
+    return out.getvalue()
+
+
+def hue_shifted(img, degrees):
+    h, s, v = img.convert("HSV").split()
+    h = h.point(lambda x: (x + round(degrees * 256 / 360)) % 256)
+    return Image.merge("HSV", (h, s, v)).convert("RGB")
+
+
+@pytest.fixture(params=IMAGES, ids=lambda path: path.stem)
+def photo(request):
+    with Image.open(request.param) as img:
+        return img.convert("RGB")
+
+
+def test_reencoded_and_resized_copies_match(photo):
+    index = NearDuplicateIndex()
+    index.add(*image_signature(encode(photo, quality=95)), "original")
+
+    for copy in (encode(photo, quality=40), encode(photo, "PNG"),
+                 encode(photo.resize((photo.width // 3, photo.height // 3)), quality=80)):
+        match = index.find(*image_signature(copy))
+        assert match is not None and match[0] == "original"
+
+
+def test_hue_shifted_copy_is_not_matched(photo):
+    original_hash, original_colors = image_signature(encode(photo, quality=95))
+    index = NearDuplicateIndex()
+    index.add(original_hash, original_colors, "original")
+
+    shifted_hash, shifted_colors = image_signature(encode(hue_shifted(photo, 60), quality=95))
+
+    # Luminance alone cannot tell them apart
+    assert (shifted_hash ^ original_hash).bit_count() <= index.max_distance
+    assert index.find(shifted_hash, shifted_colors) is None
+
+
+def test_hash_distance_threshold():
+    colors = (128,) * 32
+    index = NearDuplicateIndex(max_distance=5)
+    index.add(0, colors, "zero")
+
+    assert index.find(0b11111, colors) == ("zero", 5)
+    assert index.find(0b111111, colors) is None
+    assert index.find(1 << 63 | 0b1111, colors) == ("zero", 5)
+
+
+def test_color_distance_threshold():
+    index = NearDuplicateIndex(max_color_distance=6)
+    index.add(0, (128,) * 32, "zero")
+
+    assert index.find(1, (134,) + (128,) * 31) == ("zero", 1)
+    assert index.find(1, (135,) + (128,) * 31) is None
+
+
+def test_closest_color_compatible_candidate_wins():
+    index = NearDuplicateIndex(max_distance=5)
+    index.add(0b1, (200,) * 32, "closer, other color")
+    index.add(0b111, (128,) * 32, "further, same color")
+
+    assert index.find(0, (128,) * 32) == ("further, same color", 3)
+
+
+def test_colorways_sharing_a_hash_are_both_kept():
+    red, blue = (200,) + (128,) * 31, (60,) + (128,) * 31
+    index = NearDuplicateIndex()
+    index.add(0, red, "red")
+    index.add(0, blue, "blue")
+
+    assert len(index) == 2
+    assert index.find(0, red) == ("red", 0)
+    assert index.find(1, blue) == ("blue", 1)
+
+    # The same colorway again replaces its value rather than adding an entry
+    index.add(0, (202,) + (128,) * 31, "red again")
+    assert len(index) == 2
+    assert index.find(0, red) == ("red again", 0)
+
+
+def test_eviction_drops_one_colorway_at_a_time():
+    red, blue = (200,) + (128,) * 31, (60,) + (128,) * 31
+    index = NearDuplicateIndex(max_entries=2)
+    index.add(0, red, "red")
+    index.add(0, blue, "blue")
+    index.add((1 << 64) - 1, red, "other")
+
+    assert len(index) == 2
+    assert index.find(0, red) is None
+    assert index.find(0, blue) == ("blue", 0)
+
+    index.add((1 << 64) - 1, blue, "other blue")
+    assert index.find(0, blue) is None
+    assert index.find((1 << 64) - 1, red) == ("other", 0)
+
+
+def test_product_analysis_is_not_reused_for_a_recolored_product(photo, monkeypatch):
+    monkeypatch.setattr(openai_service, "_near_duplicate_indexes", {})
+    monkeypatch.setattr(openai_service.usage_ledger, "record", lambda *args, **kwargs: None)
+    openai_service.analysis_cache.clear()
+
+    state, cached = openai_service.prepare_analysis("product", encode(photo, quality=95))
+    assert cached is None
+    openai_service.finish_analysis(state, '{"detailed_description": "A portrait"}')
+
+    state, cached = openai_service.prepare_analysis("product", encode(photo, quality=60))
+    assert cached == {"detailed_description": "A portrait"}
+    assert state["meta"]["cache"] == "near_duplicate"
+
+    state, cached = openai_service.prepare_analysis("product", encode(hue_shifted(photo, 60), quality=95))
+    assert cached is None
+    assert state["meta"]["cache"] == "miss"
@@ -0,0 +1,107 @@
+import string
+
+import pytest
+
+import openai_service
+from prompt_templates import (
+    ACTION_TEMPLATES, AUDIO_STYLES, CAMERA_STYLES, DEFAULT_ACTION_TEMPLATE, DEFAULT_AUDIO_STYLE,
+    DEFAULT_CAMERA_STYLE, DEFAULT_HOOK_TEMPLATE, DEFAULT_LIGHTING_DESCRIPTION, DEFAULT_SETTING_DESCRIPTION,
+    ENHANCEMENT_PROMPTS, ENHANCEMENT_TEMPLATES, HOOK_TEMPLATES, LIGHTING_DESCRIPTIONS, SETTING_DESCRIPTIONS,
+    CompiledFormat, TemplateError, compile_template,
+)
+
+TABLES = [HOOK_TEMPLATES, ACTION_TEMPLATES, SETTING_DESCRIPTIONS, LIGHTING_DESCRIPTIONS, CAMERA_STYLES, AUDIO_STYLES]
+DEFAULTS = [DEFAULT_HOOK_TEMPLATE, DEFAULT_ACTION_TEMPLATE, DEFAULT_SETTING_DESCRIPTION,
+            DEFAULT_LIGHTING_DESCRIPTION, DEFAULT_CAMERA_STYLE, DEFAULT_AUDIO_STYLE]
+ALL_TEMPLATES = [t for table in TABLES for t in table.values()] + DEFAULTS + [
+    e["template"] for e in ENHANCEMENT_TEMPLATES.values()]
+
+# Values with braces, a format-looking spec and non-str types
+VALUES = ["Sneaker", "", "{product}", "50% off: {0:>10}", "émoji ✨ and\nnewline", 8, 2.5, None]
+
+
+def field_components(source):
+    fields = {field for _, field, _, _ in string.Formatter().parse(source) if field}
+    return {field: (lambda context, field=field: context[field]) for field in fields}
+
+
+@pytest.mark.parametrize("source", ALL_TEMPLATES)
+@pytest.mark.parametrize("value", VALUES)
+def test_compiled_template_matches_str_format(source, value):
+    components = field_components(source)
+    context = {field: value for field in components}
+
+    assert compile_template(source, components).render(context) == source.format(**context)
+
+
+@pytest.mark.parametrize("focus", list(ENHANCEMENT_TEMPLATES))
+def test_enhancement_prompts_match_str_format(focus):
+    prompt = "A creator unboxes a {sneaker} at 50% off"
+    expected = ENHANCEMENT_TEMPLATES[focus]["template"].format(prompt=prompt)
+
+    assert ENHANCEMENT_PROMPTS[focus].render(prompt) == expected
+
+
+def prompt_contexts():
+    descriptions = ["", "A white leather sneaker with a navy logo on a light wooden table."]
+    contexts = []
+    for hook_type in [*HOOK_TEMPLATES, ""]:
+        for ugc_type in [*ACTION_TEMPLATES, ""]:
+            for description in descriptions:
+                analysis = {"detailed_description": description} if description else {}
+                contexts.append({
+                    "product": "Sneaker",
+                    "ugc_type": ugc_type,
+                    "hook_type": hook_type,
+                    "setting": "kitchen",
+                    "lighting": "natural",
+                    "camera_movement": "handheld",
+                    "performance_style": "calm",
+                    "video_length": "8",
+                    "audio_enabled": bool(description),
+                    "product_analysis": analysis,
+                    "enrichment": openai_service.product_enrichment(analysis),
+                })
+    return contexts
+
+
+@pytest.mark.parametrize("compiled", [openai_service._STRUCTURED_PROMPT, openai_service._BASIC_PROMPT],
+                         ids=["structured", "basic"])
+def test_prompt_formats_match_str_format(compiled):
+    for context in prompt_contexts():
+        values = {field: component(context) for field, component in openai_service._PROMPT_COMPONENTS.items()}
+        expected = compiled.separator.join(
+            source.format(**values) for source, required in compiled.sections if required is None or values[required])
+
+        assert compiled.render(context) == expected
+
+
+def test_components_are_called_once_and_only_for_rendered_sections():
+    calls = []
+
+    def component(name, value):
+        def call(context):
+            calls.append(name)
+            return value
+        return call
+
+    compiled = CompiledFormat(
+        [("[{a}]", "a"), ("{b}/{b}/{c}", None), ("{d}", "empty"), ("{c}{e}", "c")],
+        "|",
+        {"a": component("a", "A"), "b": component("b", "B"), "c": component("c", "C"),
+         "d": component("d", "D"), "e": component("e", "E"), "empty": component("empty", "")},
+    )
+
+    assert compiled.render({}) == "[A]|B/B/C|CE"
+    assert sorted(calls) == ["a", "b", "c", "e", "empty"]
+
+
+def test_invalid_templates_are_rejected():
+    with pytest.raises(TemplateError):
+        compile_template("{product:>10}", {"product": str})
+    with pytest.raises(TemplateError):
+        compile_template("{product!r}", {"product": str})
+    with pytest.raises(TemplateError):
+        compile_template("{missing}", {"product": str})
+    with pytest.raises(TemplateError):
+        CompiledFormat([("{product}", "missing")], "", {"product": str})
@@ -0,0 +1,117 @@
+import pytest
+
+import secure_config
+from secure_config import SecureAPIKeyManager
+
+
+@pytest.fixture
+def counts(monkeypatch):
+    """Counts of PBKDF2 derivations and Fernet decryptions"""
+    counts = {"derive": 0, "decrypt": 0}
+    real_kdf, real_fernet = secure_config.PBKDF2HMAC, secure_config.Fernet
+
+    class CountingKDF(real_kdf):
+        def derive(self, key_material):
+            counts["derive"] += 1
+            return super().derive(key_material)
+
+    class CountingFernet(real_fernet):
+        def decrypt(self, token, ttl=None):
+            counts["decrypt"] += 1
+            return super().decrypt(token, ttl)
+
+    monkeypatch.setattr(secure_config, "PBKDF2HMAC", CountingKDF)
+    monkeypatch.setattr(secure_config, "Fernet", CountingFernet)
+    monkeypatch.delenv("TESTSVC_API_KEY", raising=False)
+    return counts
+
+
+def test_lookups_reuse_the_derived_key_and_snapshot(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path))
+    assert manager.store_api_key("testsvc", "sk-one", "pw")
+
+    for _ in range(3):
+        assert manager.get_api_key("testsvc", "pw") == "sk-one"
+    assert manager.list_stored_services("pw") == ["testsvc"]
+
+    # One derivation for the store, none for lookups; our own write is the snapshot
+    assert counts == {"derive": 1, "decrypt": 0}
+
+
+def test_snapshot_is_not_shared_with_a_wrong_password(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path))
+    manager.store_api_key("testsvc", "sk-one", "pw")
+
+    assert manager.get_api_key("testsvc", "wrong") is None
+    assert manager.get_api_key("testsvc", "pw") == "sk-one"
+
+
+def test_rewrite_by_another_process_invalidates_snapshot_and_keys(tmp_path, counts):
+    worker = SecureAPIKeyManager(str(tmp_path))
+    worker.store_api_key("testsvc", "sk-one", "old")
+    assert worker.get_api_key("testsvc", "old") == "sk-one"
+
+    # Another worker process re-encrypts the store under a new password
+    other = SecureAPIKeyManager(str(tmp_path))
+    other.store_api_key("testsvc", "sk-two", "new")
+    other.delete_api_key("testsvc", "old")
+
+    assert worker.get_api_key("testsvc", "old") is None
+    assert worker.get_api_key("testsvc", "new") == "sk-two"
+
+
+def test_changes_by_another_process_are_read(tmp_path, counts):
+    worker = SecureAPIKeyManager(str(tmp_path))
+    worker.store_api_key("testsvc", "sk-one", "pw")
+    assert worker.get_api_key("testsvc", "pw") == "sk-one"
+
+    SecureAPIKeyManager(str(tmp_path)).store_api_key("testsvc", "sk-two", "pw")
+
+    assert worker.get_api_key("testsvc", "pw") == "sk-two"
+    assert counts["decrypt"] == 2  # the other manager's read before its write, then ours
+
+
+def test_salt_change_drops_cached_keys(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path))
+    manager.store_api_key("testsvc", "sk-one", "pw")
+    manager._derive_key("pw")
+    assert counts["derive"] == 1
+
+    manager.salt_file.write_bytes(b"0123456789abcdef")
+
+    manager._derive_key("pw")
+    assert counts["derive"] == 2
+    # The store was encrypted under the old salt, so the new key cannot read it
+    assert manager.get_api_key("testsvc", "pw") is None
+
+
+def test_delete_updates_the_snapshot(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path))
+    manager.store_api_key("testsvc", "sk-one", "pw")
+    manager.store_api_key("other", "sk-other", "pw")
+
+    assert manager.delete_api_key("testsvc", "pw")
+
+    assert manager.get_api_key("testsvc", "pw") is None
+    assert manager.list_stored_services("pw") == ["other"]
+
+
+def test_invalidate_zeroes_cached_keys(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path))
+    manager.store_api_key("testsvc", "sk-one", "pw")
+    cached = [derived for _, derived in manager._key_cache.values()]
+
+    manager.invalidate_key_cache()
+
+    assert cached and all(not any(derived) for derived in cached)
+    assert manager.get_api_key("testsvc", "pw") == "sk-one"
+    assert counts == {"derive": 2, "decrypt": 1}
+
+
+def test_zero_ttl_disables_the_key_cache(tmp_path, counts):
+    manager = SecureAPIKeyManager(str(tmp_path), key_cache_ttl=0)
+    manager.store_api_key("testsvc", "sk-one", "pw")
+
+    assert manager.get_api_key("testsvc", "pw") == "sk-one"
+    assert manager.get_api_key("testsvc", "pw") == "sk-one"
+    assert counts["derive"] == 3
@@ -0,0 +1,64 @@
+"""
+Record API traffic for replay by benchmarks/replay.py.
+
+Set TRAFFIC_RECORD_FILE to a path and the Flask app appends each request to
+the analyze, generate and enhance routes to it as one JSON line: arrival
+time, method, path, content type and body. JSON bodies are kept as JSON and
+others (multipart and raw image uploads) as base64. Analysis and prompt
+handles in a body are recorded with the values they stood for, so a replay
+does not depend on what the recording server had stored.
+
+Bodies hold the uploaded images and settings verbatim; record only traffic
+you are allowed to keep. Workers of one deployment can share the file.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+RECORDED_ROUTE_PREFIXES = ("/analyze", "/generate", "/enhance-prompt")
+
+
+class TrafficRecorder:
+    def __init__(self, path: str | None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TrafficRecorder":
+        """Build a recorder configured from the TRAFFIC_RECORD_FILE environment variable."""
+        return cls(os.environ.get("TRAFFIC_RECORD_FILE") or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def record(self, method: str, path: str, content_type: str | None, body: bytes,
+               inline: dict | None = None) -> None:
+        """Append one request; inline maps "analysis" or "prompt" to the value its handle stood for"""
+        entry = {"ts": time.time(), "method": method, "path": path, "content_type": content_type}
+        try:
+            if content_type and content_type.startswith("application/json"):
+                entry["json"] = json.loads(body)
+            else:
+                entry["body_b64"] = base64.b64encode(body).decode("ascii")
+        except ValueError:
+            entry["body_b64"] = base64.b64encode(body).decode("ascii")
+        if inline:
+            entry["inline"] = inline
+
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        try:
+            with self._lock:
+                # One write per line in append mode, so workers' lines do not interleave
+                with open(self.path, "a") as f:
+                    f.write(line)
+        except OSError as e:
+            logging.warning(f"Failed to record {method} {path} to {self.path}: {e}")
+
+
+# Global instance
+traffic_recorder = TrafficRecorder.from_env()
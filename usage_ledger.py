@@ -0,0 +1,243 @@
+"""
+Append-only ledger of OpenAI token usage and cost.
+
+Every OpenAI call appends a row with the tokens from response.usage, the
+max_tokens it asked for, its estimated cost and latency, tagged with the
+route, session and request it served, the analysis kind and the model.
+Analyses answered from the cache append a row too, with no tokens, so hit
+rates and the spend they avoided show up next to the calls. Rollups group
+the rows by hour, day, route, kind, model, cache status or session, to tune
+max_tokens, image resolution and cache TTLs against what was actually spent.
+
+Rows are written to SQLite (USAGE_LEDGER_DB, default usage_ledger.db under
+DATA_DIR, which defaults to ./data; set it empty to disable) by a background
+thread, so recording never waits on the disk. Workers of one deployment can
+share the file.
+"""
+
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Directory for the ledger and other files the app keeps between runs
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+
+# USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+# The Batch API bills half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+
+COLUMNS = (
+    "ts", "request_id", "session_id", "route", "kind", "model", "cache", "stream", "outcome",
+    "prompt_tokens", "completion_tokens", "total_tokens", "max_tokens", "request_bytes",
+    "latency_ms", "retries", "cost_usd",
+)
+
+# Rollup dimension -> SQL expression
+DIMENSIONS = {
+    "hour": "strftime('%Y-%m-%dT%H:00:00Z', ts, 'unixepoch')",
+    "day": "date(ts, 'unixepoch')",
+    "route": "route",
+    "kind": "kind",
+    "model": "model",
+    "cache": "cache",
+    "session": "session_id",
+}
+
+ROLLUP_METRICS = """
+    COUNT(*) AS requests,
+    SUM(outcome != 'cached') AS openai_calls,
+    SUM(outcome = 'cached') AS cache_hits,
+    SUM(outcome IN ('error', 'overloaded')) AS errors,
+    COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+    COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+    COALESCE(SUM(total_tokens), 0) AS total_tokens,
+    ROUND(COALESCE(SUM(cost_usd), 0), 6) AS cost_usd,
+    ROUND(AVG(completion_tokens), 1) AS avg_completion_tokens,
+    MAX(completion_tokens) AS max_completion_tokens,
+    MAX(max_tokens) AS max_tokens_requested,
+    ROUND(AVG(CASE WHEN outcome != 'cached' THEN latency_ms END)) AS avg_latency_ms
+"""
+
+# Route, request and session of the work in progress; set per request by the
+# web apps and per run by the CLIs
+_request_tags = contextvars.ContextVar("usage_request_tags", default={})
+
+
+def tag_request(route: str | None, request_id: str | None = None, session_id: str | None = None) -> None:
+    """Tag the usage recorded from here on in the current context"""
+    _request_tags.set({"route": route, "request_id": request_id, "session_id": session_id})
+
+
+def call_cost(model: str, prompt_tokens: int | None, completion_tokens: int | None,
+              price_factor: float = 1.0) -> float | None:
+    """Estimated USD cost of a call, or None for a model without a known price"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    cost = ((prompt_tokens or 0) * prices[0] + (completion_tokens or 0) * prices[1]) / 1_000_000
+    return cost * price_factor
+
+
+class UsageLedger:
+    def __init__(self, db_path: str | None):
+        self.db_path = db_path
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writer_pid = None
+
+    @classmethod
+    def from_env(cls) -> "UsageLedger":
+        """Build a ledger configured from the USAGE_LEDGER_DB environment variable."""
+        return cls(os.environ.get("USAGE_LEDGER_DB", os.path.join(DATA_DIR, "usage_ledger.db")) or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.db_path is not None
+
+    def record(self, kind: str, model: str, *, cache: str | None = None, stream: bool = False,
+               outcome: str = "ok", usage=None, max_tokens: int | None = None,
+               request_bytes: int | None = None, latency_ms: int | None = None, retries: int = 0,
+               price_factor: float = 1.0) -> None:
+        """Queue one row for the ledger; never raises and never blocks on the disk.
+
+        usage is an OpenAI usage object (or dict) or None; outcome is "ok",
+        "error", "overloaded", or "cached" for an analysis the cache answered.
+        """
+        if not self.enabled:
+            return
+        if isinstance(usage, dict):
+            prompt_tokens, completion_tokens, total_tokens = (
+                usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("total_tokens"))
+        elif usage is not None:
+            prompt_tokens, completion_tokens, total_tokens = (
+                usage.prompt_tokens, usage.completion_tokens, usage.total_tokens)
+        else:
+            prompt_tokens = completion_tokens = total_tokens = None
+
+        tags = _request_tags.get()
+        row = (
+            time.time(), tags.get("request_id"), tags.get("session_id"), tags.get("route"), kind, model,
+            cache, int(stream), outcome, prompt_tokens, completion_tokens, total_tokens, max_tokens,
+            request_bytes, latency_ms, retries,
+            call_cost(model, prompt_tokens, completion_tokens, price_factor) if usage is not None else 0.0,
+        )
+        self._ensure_writer()
+        self._queue.put(row)
+
+    def flush(self) -> None:
+        """Wait until every queued row is written"""
+        if self.enabled and self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def rollup(self, group_by=("day",), since: float | None = None, until: float | None = None) -> list:
+        """Usage totals grouped by the given DIMENSIONS, ordered by those dimensions.
+
+        Raises ValueError for an unknown dimension.
+        """
+        unknown = [name for name in group_by if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown group_by {', '.join(unknown)}; expected any of {', '.join(DIMENSIONS)}")
+        where, params = self._time_filter(since, until)
+        select = "".join(f"{DIMENSIONS[name]} AS {name}, " for name in group_by)
+        group = f" GROUP BY {', '.join(DIMENSIONS[name] for name in group_by)}" if group_by else ""
+        order = f" ORDER BY {', '.join(DIMENSIONS[name] for name in group_by)}" if group_by else ""
+        return self._query(f"SELECT {select}{ROLLUP_METRICS} FROM usage{where}{group}{order}", params)
+
+    def entries(self, session_id: str | None = None, request_id: str | None = None,
+                since: float | None = None, until: float | None = None, limit: int = 100) -> list:
+        """The most recent rows, newest first, optionally for one session or request"""
+        where, params = self._time_filter(since, until)
+        for column, value in (("session_id", session_id), ("request_id", request_id)):
+            if value:
+                where += (" AND " if where else " WHERE ") + f"{column} = ?"
+                params.append(value)
+        params.append(limit)
+        return self._query(f"SELECT {', '.join(COLUMNS)} FROM usage{where} ORDER BY ts DESC LIMIT ?", params)
+
+    @staticmethod
+    def _time_filter(since, until):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _query(self, sql: str, params) -> list:
+        if not self.enabled:
+            return []
+        self.flush()
+        with self._lock:
+            cursor = self._connection().execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened per process: gunicorn workers must not share a forked connection
+        if self._db is None or self._db[0] != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY, ts REAL NOT NULL, request_id TEXT, session_id TEXT, route TEXT, "
+                "kind TEXT, model TEXT, cache TEXT, stream INTEGER, outcome TEXT, prompt_tokens INTEGER, "
+                "completion_tokens INTEGER, total_tokens INTEGER, max_tokens INTEGER, request_bytes INTEGER, "
+                "latency_ms INTEGER, retries INTEGER, cost_usd REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts)")
+            db.execute("CREATE INDEX IF NOT EXISTS usage_session ON usage (session_id, ts)")
+            self._db = (os.getpid(), db)
+        return self._db[1]
+
+    def _ensure_writer(self) -> None:
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid != os.getpid():
+                # A forked child inherits the queue object but not the thread
+                self._queue = queue.Queue()
+                threading.Thread(target=self._write_rows, name="usage-ledger", daemon=True).start()
+                if self._writer_pid is None:
+                    atexit.register(self.flush)
+                self._writer_pid = os.getpid()
+
+    def _write_rows(self) -> None:
+        """Writer thread: insert queued rows, batching whatever has piled up"""
+        insert = f"INSERT INTO usage ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            rows = [self._queue.get()]
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    db = self._connection()
+                    # Commits the batch, or rolls it back if an insert fails
+                    with db:
+                        db.execute("BEGIN")
+                        db.executemany(insert, rows)
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to write {len(rows)} usage ledger rows: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+
+# Global instance
+usage_ledger = UsageLedger.from_env()